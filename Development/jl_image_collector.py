@@ -1,11 +1,11 @@
 import os
-import shutil
-import hashlib
 import threading
 import datetime
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox
-from Helpers.byte_unit_converter import format_unit_4_byte_size
+from ImageCollector import CollectorSettings, FileTypes2Copy, ImageCollector
+from Helpers.parallel_copy_engine import default_hash_workers
+from Helpers.progress_bus import ProgressBus, PROGRESS_REFRESH_RATE_HZ
 
 # This is a simple script to copy images from a source folder and all its subfolders
 # to a target folder without the subfolders (all collected in only one target folder).
@@ -23,240 +23,22 @@ from Helpers.byte_unit_converter import format_unit_4_byte_size
 # 5. The copied images, together with a log file with all the images initially 
 #    found, is now in the target folder.
 #
+# This file is the graphical user interface. The collector itself is in the
+# ImageCollector package, which can also be used without a user interface:
+#   python -m ImageCollector --source <folder> --target <folder>
+#
 # This code is made in cooperation with GPT-4 and GitHub Copilot.
 # This code is released under the MIT license.
 #
 # Author: Jan Lægreid, CPT-4, GitHub Copilot - 2023
 
 
-class FileTypes2Copy:
-    # This class is used to store the file types that can be selected.
-
-    def __init__(self):
-        super().__init__()
-
-        # Define the possible file extensions.
-
-        images = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif', '.webp', '.esp', '.raw', '.cr2', '.nef', '.orf', '.sr2', '.heic')
-
-        videos = ('.mp4', '.avi', '.mov', '.thm', '.wmv', '.flv', '.webm', '.mkv', '.m4v', '.mpg', '.mpeg', '.3gp', '.3g2', '.mxf', 
-                '.mts', '.m2ts', '.ts', '.vob', '.m2v', '.asf', '.rm', '.rmvb', '.ogv', '.ogm', '.ogx', '.qt', '.divx', '.xvid')
-        
-        # Define the possible file types.
-        types_texts = ('images', 'videos', 'images and videos')
+# Number of worker threads used for hashing and for copying files.
+HASH_WORKERS = default_hash_workers()
+COPY_WORKERS = 2
 
-        # Define the file type dictionary.
-        file_type_dict = {
-                            types_texts[0] : images,
-                            types_texts[1] : videos,
-                            types_texts[2] : images + videos
-                        }
-
-        # Set the values for the class properties.
-        self._file_types = types_texts
-        self._file_types_extentions = file_type_dict
-
-    @property
-    def file_types(self) -> tuple:
-        return self._file_types
-
-    @property
-    def file_types_extentions(self) -> dict:
-        return self._file_types_extentions
-
-class FileCopyingCurrentStatusTextDict():
-    # This class is used to store the current status text for the file copying process.
-
-    def __init__(self, status_text="", folder_text="", file_text=""):
-        super().__init__()
-        self._status_text = status_text
-        self._folder_text = folder_text
-        self._file_text = file_text
-
-    @property
-    def status_text(self):
-        return self._status_text
-
-    @status_text.setter
-    def status_text(self, value):
-        self._status_text = value
-
-    @property
-    def folder_text(self):
-        return self._folder_text
-    
-    @folder_text.setter
-    def folder_text(self, value):
-        self._folder_text = value
-
-    @property
-    def file_text(self):
-        return self._file_text
-    
-    @file_text.setter
-    def file_text(self, value):
-        self._file_text = value
-
-
-
-def md5(file_path: str) -> str:
-    # Calculate the MD5 hash of a file.
-    # Return the MD5 hash as a string.
-
-    hash_md5 = hashlib.md5()
-    try:
-
-        with open(file_path, "rb") as f:
-
-            if os.path.getsize(file_path) == 0:
-                return hash_md5.hexdigest()
-
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-
-    except Exception as e:
-
-        print(f"Error reading file: {e}")
-        return hashlib.md5().hexdigest()
-    
-    return hash_md5.hexdigest()
-
-
-def read_hashes_from_file(file_path: str) -> set:
-    # Read the hashes from a file.
-    # Return a set with the hashes.
-    hashes = set()
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                hashes.add(line.strip())
-    except FileNotFoundError:
-        print(f"Warning: Hash file not found: {file_path}")
-    except PermissionError as e:
-        print(f"Warning: Could not read hashes from file '{file_path}'. Error: {e}")
-    return hashes
-
-
-def save_hashes_to_file(file_path: str, hashes: set) -> bool:
-    # Save the hashes to a file.
-    try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            for h in hashes:
-                f.write(f"{h}\n")
-    except PermissionError as e:
-        print(f"Warning: Could not save hashes to file '{file_path}'. Error: {e}")
-        return False
-    return True
-
-
-        
-def find_files_in_folder(source_folder: str, extensions, forbidden_paths_file: str, folders_2_avoid: list=[], min_file_size_kb: int=0) -> tuple:
-    # Find all files in a folder and its subfolders that match the specified extensions.
-    # Avoid folders that are in the folders_2_avoid list.
-    # Avoid files that have a path starting with any of the forbidden paths in the database file.
-    # Return a tuple with a list of all files found and the total size of all files found.
-
-    
-    # Read the forbidden paths from the database file and store them in a set.
-    forbidden_paths = set()
-    try:
-        with open(forbidden_paths_file, 'r', encoding='utf-8') as f:
-            
-            for line in f:
-                forbidden_paths.add(line.strip().replace('\\', '/').lower())
-
-    except (FileNotFoundError, PermissionError) as e:
-        print(f"Warning: Could not read forbidden paths from file '{forbidden_paths_file}'. Error: {e}")
-
-
-    files_found = []
-    total_files_size_bytes = 0
-    file_count = 0
-    files_found_count = 0
-    progress_text = FileCopyingCurrentStatusTextDict()
-
-    # Loop through all files in the source folder and its subfolders
-    for root, _, files in os.walk(source_folder):
-
-        for file in files:
-
-            file_count += 1
-
-            # Set some status text to give feedback to the user.
-            progress_text.status_text = f"Number of files investegated: {file_count}"
-            
-            if os.path.basename(root) in folders_2_avoid:
-                continue
-
-            file_path = os.path.join(root, file)
-            
-            # Check if the file's path starts with any of the forbidden paths, and if so, skip the file
-            if any(file_path.replace('\\', '/').lower().startswith(forbidden_path) for forbidden_path in forbidden_paths):
-                continue
-
-            # Check if the file's extension is in the list of extensions to look for.
-            if os.path.splitext(file)[1].lower() in extensions:
-                
-                file_size_bytes = os.path.getsize(file_path)
-                total_files_size_bytes += file_size_bytes
-
-                file_size_kb = file_size_bytes / 1024
-                
-                # Check if the file is larger than the minimum file size.
-                if (min_file_size_kb > 0 and file_size_kb >= min_file_size_kb) or (min_file_size_kb == 0 and file_size_kb > 0):
-                    # Add the file to the list of files found, since it is larger than the minimum file size.
-                    files_found.append(file_path)
-                    files_found_count += 1
-                else:
-                    # Add the file to the list of files found, but with a note that it is too small.
-                    files_found.append( f"{file_path} --> Too small ({file_size_kb} kb)" )
-                    # Because of the note "--> Too small", the file is not counted as found, allthough it is added to the list of files found.
-
-            # Update the status text to give feedback to the user.
-            progress_text.folder_text = f"Files found: {files_found_count}"
-            progress_text.file_text = ""
-
-            # Yield the current status text to the caller.
-            set_current_status_text(progress_text)
-            
-
-    # Format the total size of all files found, so that it is easier to read.
-    # The format_unit_4_byte_size function returns a tuple with the formatted size and the unit used.
-    total_files_size_formatted = format_unit_4_byte_size(total_files_size_bytes)
-
-    # Return the list of files found and the total size of all files found as a tuple.
-    return (files_found, total_files_size_formatted)
-
-
-def copy_file_if_unique(file, target_folder: str, target_hashes: set, hash_file_path: str) -> str:
-    # Check if the file is unique (not already in the target folder) and copy it if it is.
-    # Return a string with the status of the copy operation.
-
-    # Get the MD5 hash of the file.
-    file_hash = md5(file)
-
-    # Check if the file is unique - if it is, copy it to the target folder.
-    if file_hash not in target_hashes:
-        # Generate a unique destination filename
-        basename = os.path.basename(file)
-        filename, extension = os.path.splitext(basename)
-        destination_file = os.path.join(target_folder, basename)
-
-        index = 1
-        while os.path.exists(destination_file):
-            new_basename = f"{filename}({index}){extension}"
-            destination_file = os.path.join(target_folder, new_basename)
-            index += 1 
-        try:
-            # Copy the image and update the hash list.
-            shutil.copy2(file, destination_file)
-            target_hashes.add(file_hash) # Update the hash list
-            save_hashes_to_file(hash_file_path, target_hashes)  # Save the target hashes to a file.
-            return 'Copied'
-        except Exception as e:
-            return f"Error copying: {e}"
-    else:
-        return 'Duplicate'
+# Progress events posted by the collector, shown by the GUI thread.
+progress_bus = ProgressBus()
 
 
 def browse_source():
@@ -272,28 +54,23 @@ def browse_forbidden_paths_file():
     forbidden_paths_file_var.set(forbidden_paths_file)
 
 
-# Update the content of the Text widget used for displaying the log.
-def set_current_status_text(progress_info_text: FileCopyingCurrentStatusTextDict):
-    progress_bar_info_text_current_status.set(progress_info_text.status_text)
-    progress_bar_info_text_current_folder.set(progress_info_text.folder_text)
-    progress_bar_info_text_current_file.set(progress_info_text.file_text)
-    root.update_idletasks()
-
-
-# Update progress bar value and progress bar info text.
-def update_progress(progress_index, total, info_text_ending, file) -> int:
-    progress_text = FileCopyingCurrentStatusTextDict()
-    progress_index += 1
-    progress_percent = (progress_index) / total * 100
-    progress_text.status_text = f"{progress_percent:.2f}% ({progress_index}/{total}) {info_text_ending}"
-    progress_text.folder_text = f"-> Folder: {os.path.dirname(file)}"
-    progress_text.file_text = f"-> File: {os.path.basename(file)}"
+# Show the latest progress posted to the progress bus, and schedule the next refresh.
+# Runs in the GUI thread, so the worker threads never touch the Tk widgets.
+def refresh_progress():
+    progress_state = progress_bus.drain()
+    if progress_state is not None:
+        if progress_state.log_text is not None:
+            update_log_text_panel(progress_state.log_text)
+        progress_bar_value.set(progress_state.progress_percent)  # Update progress value (0-100) -> in percent.
+        progress_bar_info_text_current_status.set(progress_state.status_text)
+        progress_bar_info_text_current_folder.set(progress_state.folder_text)
+        progress_bar_info_text_current_file.set(progress_state.file_text)
+        if progress_state.finished_text is not None:
+            timestamp_finished_text.set(progress_state.finished_text)
+            # Re-enable the Start Copy button at the end of the run.
+            start_copy_button.config(state=tk.NORMAL)
 
-    progress_bar_value.set(progress_percent)  # Update progress value (0-100) -> in percent.
-    set_current_status_text(progress_text)  # Update progress bar info text
-    
-    root.update_idletasks()  # Update progress bar
-    return progress_index
+    root.after(int(1000 / PROGRESS_REFRESH_RATE_HZ), refresh_progress)
 
 
 # Update the content of the Text widget
@@ -322,152 +99,32 @@ def start_copy():
         return
 
     # Initialize progress bar and progress bar info text.
-    progress_bar_value.set(0)
     progress_bar["maximum"] = 100  # Set maximum progress value
-    progress_bar_info_text_current_status.set("Initializing...")
-
-    # Copy in a separate thread.
+    progress_bus.post_reset("Initializing...")
+
+    # Reset the infotext panel.
+    update_log_text_panel("")
+
+    # Get the file types to copy as string from the format selector combobox ('images', 'videos', 'images and videos').
+    settings = CollectorSettings(source_folders=[source_folder],
+                                 target_folder=target_folder,
+                                 forbidden_paths_file=forbidden_paths_file,
+                                 file_types=format_selector_var.get(),
+                                 hash_workers=HASH_WORKERS,
+                                 copy_workers=COPY_WORKERS,
+                                 update_hash_list_from_scratch=update_hash_list_from_scratch_var.get() == True)
+
+    # Copy in a separate thread. The collector posts its progress to the progress bus, which is
+    # shown by the GUI thread (refresh_progress).
     def copy_thread():
-
-        hash_file_folder_name = "hashes"
-        hash_file_path = os.path.join(target_folder, hash_file_folder_name )
-        os.makedirs(hash_file_path, exist_ok=True)  # Create the log_files folder if it doesn't exist
-        hash_file_path = os.path.join(hash_file_path, "hashes.jllog") # Path to the file containing the hashes of the files in the target folder.
-
-        # Define the folders to avoid.
-        folders_2_avoid = ('__pycache__', 'node_modules', 'venv', '.git', '.vscode', '.idea', 'dist', 'build', 'cache', 'logs', 'temp',
-                            'tmp', 'temp', 'tmp', 'thumbs', 'thumbnails', 'thumbs.db', 'desktop.ini', 'thumbs.db:encryptable', 'thumbs.db:encryptable$')
-        
-        # Reset the infotext panel.
-        update_log_text_panel("")
-
-        # Get the file types to copy as string from the format selector combobox and
-        # get the proper file extensions from the selected file types to copy ('images', 'videos', 'images and videos')
-        # to use for the file search.
-        selected_file_types_to_copy = format_selector_var.get()
-        extensions = FileTypes2Copy().file_types_extentions[selected_file_types_to_copy]
-        
-        # Get all files in the source folder and calculate the total number of files and the total file size -> to be used for the progress bar.
-        files, total_files_size_formated = find_files_in_folder(source_folder, extensions, forbidden_paths_file, folders_2_avoid)
-        # total_files_size_mb = round(total_files_size  / 1024, 2) # files_and_total_files_sizes[1] contains the total file sizes in kb -> convert to MB and round to 2 decimals.
-        
-        # Update the log text panel with the initial status text.
-        initial_status_log_text = (f"Found {len(files)} {selected_file_types_to_copy} in {source_folder}.\n" \
-                                   f"Total of {total_files_size_formated['value']} {total_files_size_formated['unit']}.\n" \
-                                   f"Harvesting file hashes for files already in the target folder...")
-        update_log_text_panel(initial_status_log_text)
-        
-        progress_index= 0
-        target_hashes = set()
-
-        # Check if the user wants to update the hash list from scratch.
-        if update_hash_list_from_scratch_var.get() == False:
-            # Read the target hashes from the file with the saved hashes.
-            target_hashes = read_hashes_from_file(hash_file_path)
-        
-        if not target_hashes:
-            # Get all files in the target folder and calculate the total number of files -> to be used for the progress bar.
-            target_files = [f for f in os.listdir(target_folder) if f.lower().endswith(extensions)]
-            total_target_files = len(target_files)
-            # Calculate the md5 hash for each file in the target folder and store it in a set while updating the progress bar.
-            target_hashes = set()
-            for f in target_files:
-                file_path = os.path.join(target_folder, f)
-                target_hashes.add(md5(file_path)) # Add the md5 hash to the set.
-                save_hashes_to_file(hash_file_path, target_hashes)  # Save the target hashes to a file.
-                progress_index = update_progress(progress_index, total_target_files, "- md5 hash",f)
-        
-        # Create a log folder in the target folder
-        log_folder_name = "log_files"
-        log_folder_path = os.path.join(target_folder, log_folder_name )
-        os.makedirs(log_folder_path, exist_ok=True)  # Create the log_files folder if it doesn't exist
-        # Create a log file name with a timestamp
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        log_file_name = f"Files_processed_{timestamp}.txt"
-        # Save the log file in the log_files folder
-        log_file_path = os.path.join(log_folder_path, log_file_name)  
-
-        # Update the log text panel
-        initial_status_log_text += (f"\nCopying files...")
-        update_log_text_panel(initial_status_log_text)
-
-        # Initialize counters.
-        copied_ok_count = 0
-        copied_skipped_count = 0
-        copy_error_count = 0
-        file_size_copied_sum = 0
-        
-        # Iteriate through the files and copy them to the target folder while logging the results.
-        with open(log_file_path, "w", encoding='utf-8', newline='') as log_file:
-            
-            # Iterate through the files
-            for index, f in enumerate(files):
-
-                # Copy the image if it is actually on the disk and unique, 
-                # and write to the log file.
-
-                #Check if file_name/path contains "--> Too small" at the end, and logs it and skip if it does.
-                if "--> Too small" in f:
-                    log_file.write(f"{f}\n".encode('utf-8').decode('utf-8'))
-                    copied_skipped_count += 1
-                    continue #Skips to the next iteration of the loop.
-
-                #Copy the file if it is unique, and write to the log file.
-                copy_result = copy_file_if_unique(f, target_folder, target_hashes, hash_file_path)
-                if copy_result == 'Copied':
-                    log_file.write(f"{os.path.normpath(f)} --> OK\n".encode('utf-8').decode('utf-8'))
-                    copied_ok_count += 1
-                    file_size_copied_sum += os.path.getsize(f)
-                elif copy_result == 'Duplicate':
-                    log_file.write(f"{os.path.normpath(f)} --> Skipped (duplicate)\n".encode('utf-8').decode('utf-8'))
-                    copied_skipped_count += 1
-                else:
-                    # Error copying file
-                    log_file.write(f"{os.path.normpath(f)} --> !{copy_result}\n".encode('utf-8').decode('utf-8')) # Write error message to log file
-                    copy_error_count += 1
-                
-                # Update the progress bar and status text.
-                update_progress(index, len(files), "copying", f)
-
-            # Set progress bar to 100% and update status text to "Finished!"
-            progress_bar_value.set(100)  # Set progress value to 100
-            set_current_status_text(FileCopyingCurrentStatusTextDict(status_text="Finished!"))
-
-            total_bytes_copied = format_unit_4_byte_size(file_size_copied_sum)
-
-            # Create the summary text and update the log text panel.
-            initial_status_log_text += f"\nCopied {copied_ok_count} new {selected_file_types_to_copy} to the target folder" + \
-                                      f" --> {total_bytes_copied['value']} {total_bytes_copied['unit']} total.\n" + \
-                                      f"Skipped {copied_skipped_count} {selected_file_types_to_copy} duplicates.\n" + \
-                                      f"Error copying {copy_error_count} {selected_file_types_to_copy}.\n" + \
-                                      f"Log file saved to the following file in the target folder --> \{log_folder_name}\{log_file_name}."
-            
-            update_log_text_panel(initial_status_log_text)
-
-        # Read the log file and add the summary to the top of the file.
-        with open(log_file_path, "r", encoding='utf-8' ) as log_file:
-            log_file_content = log_file.read()
-
-        timestamp_finished = datetime.datetime.now().strftime("%d.%m.%Y %H:%M:%S")
-        # Create the summary text.
-        process_summary_text = f"Summary:\n------------------------------\n{initial_status_log_text}\n\n" + \
-                                f"Start of process: {timestamp_start}\n" + \
-                                f"End of process: {timestamp_finished}\n------------------------------\n\n"
-        # Add the summary to the top of the log file.
-        log_file_content = process_summary_text + log_file_content
-        
-        # Write the log file with the summary added to the top.
-        with open(log_file_path, "w", encoding='utf-8', newline='') as log_file:
-            log_file.write(log_file_content.encode('utf-8').decode('utf-8'))
-
-        # Update the timestamp_finished_text variable.
-        timestamp_finished_text.set(f"End time:  {timestamp_finished}")
-
-        # Re-enable the Start Copy button at the end of the thread.
-        start_copy_button.config(state=tk.NORMAL)
+        try:
+            ImageCollector(settings, progress_bus).run()
+        except Exception as e:
+            progress_bus.post_log_text(f"Error: {e}")
+            progress_bus.post_finished("")
 
     # Start the copy thread.
-    threading.Thread(target=copy_thread).start()
+    threading.Thread(target=copy_thread, daemon=True).start()
     # Disable the Start Copy button while the thread is running.
     start_copy_button.config(state=tk.DISABLED)
 
@@ -538,5 +195,7 @@ timestamp_finished_text = tk.StringVar()
 tk.Label(frame, textvariable=timestamp_start_text).grid(row=9, column=0, columnspan=3, sticky=tk.W)
 tk.Label(frame, textvariable=timestamp_finished_text).grid(row=10, column=0, columnspan=3, sticky=tk.W)
 
+# Show the progress posted by the worker threads at a fixed rate.
+refresh_progress()
 
 root.mainloop()
\ No newline at end of file
@@ -0,0 +1,366 @@
+import io
+import os
+import time
+import zlib
+import tarfile
+import zipfile
+import tempfile
+import threading
+from Helpers.source_scanner import ScanRecord, normalize_path
+from Helpers.hashing_copy import TEMP_FILE_SUFFIX, discard_temp_file
+from Helpers.exif_reader import EXIF_READ_SIZE, parse_exif_datetime
+
+# ZIP and TAR archives in the source folders, read as virtual folders (phone backups and
+# Takeout-style bundles), so their files can be collected without extracting them first.
+#
+# The files in an archive get a path below the path of the archive ("<archive>/<member path>"),
+# which is used for the forbidden paths, the log and the run journal like the path of a file.
+# Members in a folder to avoid are skipped, and archives inside an archive are read as well
+# (up to MAX_ARCHIVE_DEPTH levels).
+#
+# How the data of a member is read depends on the archive:
+# - zip:           random access. The member is decompressed when it is read (by the hash and
+#                  copy stages). The central directory holds the CRC-32 and the size of every
+#                  member, which are used to rule out duplicates without decompressing it
+#                  (see size_index.py).
+# - tar:           random access. The data of a member is read from its offset in the file.
+# - compressed tar (.tar.gz, .tgz, .tar.bz2, .tar.xz) and tar archives inside an archive: can
+#                  only be read from start to end. The data of each member is read while the
+#                  archive is scanned and kept until the file is done: in memory up to a total of
+#                  SPOOL_MEMORY_BUDGET, else in a temporary file in the target folder.
+# A zip archive inside an archive is copied to a temporary file in the target folder first (zip
+# needs random access), which is removed at the end of the run.
+#
+# Temporary files end with the suffix of incomplete copies, so the ones left behind by an
+# interrupted run are removed by the next run.
+
+ZIP_EXTENSIONS = ('.zip',)
+TAR_EXTENSIONS = ('.tar',)
+COMPRESSED_TAR_EXTENSIONS = ('.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tbz', '.tar.xz', '.txz')
+ARCHIVE_EXTENSIONS = ZIP_EXTENSIONS + TAR_EXTENSIONS + COMPRESSED_TAR_EXTENSIONS
+MAX_ARCHIVE_DEPTH = 3
+SPOOL_MEMORY_BUDGET = 256 * 1024 * 1024
+SPOOL_CHUNK_SIZE = 1024 * 1024
+# The permission bits of a copied file when the archive does not hold them.
+DEFAULT_FILE_MODE = 0o644
+
+# Errors raised while reading a broken archive.
+ARCHIVE_ERRORS = (OSError, EOFError, ValueError, zipfile.BadZipFile, tarfile.TarError, zlib.error, RuntimeError,
+                 NotImplementedError)
+
+
+def is_archive_name(name: str) -> bool:
+    # Check if a file name has the extension of an archive that can be read.
+    return name.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def _zip_mtime_ns(date_time: tuple) -> int:
+    try:
+        return int(time.mktime(date_time + (0, 0, -1))) * 1000000000
+    except (OverflowError, ValueError):
+        return 0
+
+
+class _MemberSlice(io.RawIOBase):
+    # This class is used to read the data of a member of an uncompressed tar file (a part of the file).
+
+    def __init__(self, file_path: str, offset: int, size: int):
+        super().__init__()
+        self._file = open(file_path, "rb", buffering=0)
+        self._offset = offset
+        self._size = size
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        count = min(len(buffer), self._size - self._position)
+        if count <= 0:
+            return 0
+        self._file.seek(self._offset + self._position)
+        with memoryview(buffer) as view:
+            count = self._file.readinto(view[:count])
+        self._position += count
+        return count
+
+    def seek(self, offset: int, whence: int=io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._size
+        self._position = max(0, offset)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+class ArchiveMember(ScanRecord):
+    # This class is used to store a file found in an archive.
+
+    __slots__ = ('crc', 'mode', '_opener', '_spooled_size', '_spool_path', '_scanner')
+
+    def __init__(self, path: str, size: int, mtime_ns: int, device: int=0, crc: int=None, mode: int=DEFAULT_FILE_MODE, opener=None):
+        super().__init__(path, size, mtime_ns, device)
+        # The CRC-32 stored in the archive (zip), or None, and the permission bits.
+        self.crc = crc
+        self.mode = mode
+        self._opener = opener
+        self._spooled_size = 0
+        self._spool_path = None
+        self._scanner = None
+
+    def open(self):
+        # Open the data of the member for reading (a binary file object that can seek).
+        if self._spool_path is not None:
+            return open(self._spool_path, "rb")
+        return self._opener()
+
+    def read_exif_datetime(self):
+        # Return the date and time the photo was taken, or None if it is not known.
+        try:
+            with self.open() as f:
+                return parse_exif_datetime(f.read(EXIF_READ_SIZE))
+        except ARCHIVE_ERRORS:
+            return None
+
+    def release(self):
+        # Free the data read ahead for the member (when the file is done).
+        if self._scanner is not None:
+            self._scanner.release_spool(self)
+
+
+class ArchiveScanner:
+    # This class is used to find the files in the archives of the source folders and keep the archives
+    # open until the files are done. It is safe to use from several threads.
+
+    def __init__(self, spool_folder: str, spool_memory_budget: int=SPOOL_MEMORY_BUDGET):
+        super().__init__()
+        self._spool_folder = spool_folder
+        self._spool_memory_budget = spool_memory_budget
+        self._lock = threading.Lock()
+        self._open_archives = []
+        self._temp_file_paths = set()
+        self._spooled_memory = 0
+
+    def is_archive(self, path: str) -> bool:
+        # Check if a path found by the scanner is an archive (and not a folder with the name of one).
+        return is_archive_name(path) and os.path.isfile(path)
+
+    def scan(self, archive_path: str, device: int, extensions, forbidden_path_matcher=None, folders_2_avoid=(), snapshot=None):
+        # Find the files in an archive (and the archives inside it) that match the specified extensions.
+        # With a snapshot, the archive is handled like a folder: only the files that are new or changed
+        # since the last run are yielded.
+        # Yield an ArchiveMember for each file found.
+        member_filter = _MemberFilter(extensions, forbidden_path_matcher, folders_2_avoid)
+        if forbidden_path_matcher is not None and forbidden_path_matcher.has_prefixes_under(normalize_path(os.path.join(archive_path, ''))):
+            member_filter.check_forbidden_paths = True
+
+        if snapshot is None:
+            yield from self._scan_archive(archive_path, device, member_filter)
+            return
+
+        try:
+            mtime_ns = os.stat(archive_path).st_mtime_ns
+        except OSError as e:
+            print(f"Warning: Could not read archive '{archive_path}'. Error: {e}")
+            return
+        if snapshot.folder_unchanged(archive_path, mtime_ns):
+            member_filter.wanted_paths = set(snapshot.pending_files(archive_path))
+        else:
+            # List the archive without reading the data of the members, and read only the changed ones.
+            member_filter.read_data = False
+            records = list(self._scan_archive(archive_path, device, member_filter))
+            member_filter.read_data = True
+            member_filter.wanted_paths = {record.path for record in snapshot.update_folder(archive_path, mtime_ns, [], records)}
+        if member_filter.wanted_paths:
+            yield from self._scan_archive(archive_path, device, member_filter)
+
+    def release_spool(self, member: ArchiveMember):
+        with self._lock:
+            self._spooled_memory -= member._spooled_size
+            member._spooled_size = 0
+            spool_path = member._spool_path
+            self._temp_file_paths.discard(spool_path)
+        member._spool_path = None
+        member._opener = None
+        if spool_path is not None:
+            discard_temp_file(spool_path)
+
+    def close(self):
+        # Close the archives and remove the temporary files.
+        with self._lock:
+            open_archives = self._open_archives
+            temp_file_paths = self._temp_file_paths
+            self._open_archives = []
+            self._temp_file_paths = set()
+        for archive in open_archives:
+            archive.close()
+        for temp_file_path in temp_file_paths:
+            discard_temp_file(temp_file_path)
+
+    def _scan_archive(self, archive_path: str, device: int, member_filter):
+        name = archive_path.lower()
+        try:
+            if name.endswith(ZIP_EXTENSIONS):
+                yield from self._scan_zip(archive_path, archive_path, device, member_filter, 1)
+            elif name.endswith(TAR_EXTENSIONS):
+                with tarfile.open(archive_path, mode='r:') as tar_file:
+                    yield from self._scan_tar(tar_file, archive_path, device, member_filter, 1, archive_path)
+            else:
+                with open(archive_path, "rb") as f, tarfile.open(fileobj=f, mode='r|*') as tar_file:
+                    yield from self._scan_tar(tar_file, archive_path, device, member_filter, 1)
+        except ARCHIVE_ERRORS as e:
+            print(f"Warning: Could not read archive '{archive_path}'. Error: {e}")
+
+    def _scan_zip(self, zip_source, virtual_path: str, device: int, member_filter, depth: int) -> bool:
+        # Return True if the archive is kept open for its files.
+        zip_file = zipfile.ZipFile(zip_source)
+        keep_open = False
+        try:
+            for info in zip_file.infolist():
+                if info.is_dir():
+                    continue
+                path = member_filter.member_path(virtual_path, info.filename)
+                if path is None:
+                    continue
+                if is_archive_name(info.filename):
+                    if self._can_descend(path, depth):
+                        yield from self._scan_nested(lambda: zip_file.open(info), info.filename, path, device, member_filter, depth)
+                    continue
+                if not member_filter.accepts(path):
+                    continue
+                keep_open = True
+                yield ArchiveMember(path, info.file_size, _zip_mtime_ns(info.date_time), device, info.CRC,
+                                    (info.external_attr >> 16) & 0o777 or DEFAULT_FILE_MODE, lambda info=info: zip_file.open(info))
+        finally:
+            # The archive stays open while its files are in the run (closed by close()).
+            keep_open = keep_open and member_filter.read_data
+            if keep_open:
+                with self._lock:
+                    self._open_archives.append(zip_file)
+            else:
+                zip_file.close()
+        return keep_open
+
+    def _scan_tar(self, tar_file, virtual_path: str, device: int, member_filter, depth: int, data_path: str=None):
+        # data_path: the path of an uncompressed tar file, whose members are read from their offset.
+        # Without it, the data of each member is read while scanning.
+        for tar_info in tar_file:
+            if not tar_info.isfile() or tar_info.issparse():
+                continue
+            path = member_filter.member_path(virtual_path, tar_info.name)
+            if path is None:
+                continue
+            if is_archive_name(tar_info.name):
+                if self._can_descend(path, depth):
+                    yield from self._scan_nested(lambda: tar_file.extractfile(tar_info), tar_info.name, path, device, member_filter, depth)
+                continue
+            if not member_filter.accepts(path):
+                continue
+            member = ArchiveMember(path, tar_info.size, int(tar_info.mtime) * 1000000000, device, mode=tar_info.mode & 0o777 or DEFAULT_FILE_MODE)
+            if data_path is not None:
+                member._opener = lambda offset=tar_info.offset_data, size=tar_info.size: io.BufferedReader(_MemberSlice(data_path, offset, size))
+            elif member_filter.read_data:
+                with tar_file.extractfile(tar_info) as data:
+                    self._spool(member, data)
+            yield member
+
+    def _scan_nested(self, open_data, name: str, virtual_path: str, device: int, member_filter, depth: int):
+        # Scan an archive inside an archive.
+        try:
+            if name.lower().endswith(ZIP_EXTENSIONS):
+                kept_open = False
+                temp_file_path = self._new_temp_file()
+                try:
+                    with open_data() as data, open(temp_file_path, "wb") as temp_file:
+                        _copy_data(data, temp_file)
+                    kept_open = yield from self._scan_zip(temp_file_path, virtual_path, device, member_filter, depth + 1)
+                finally:
+                    if not kept_open:
+                        self._discard_temp_file(temp_file_path)
+            else:
+                with open_data() as data, tarfile.open(fileobj=data, mode='r|*') as tar_file:
+                    yield from self._scan_tar(tar_file, virtual_path, device, member_filter, depth + 1)
+        except ARCHIVE_ERRORS as e:
+            print(f"Warning: Could not read archive '{virtual_path}'. Error: {e}")
+
+    def _can_descend(self, virtual_path: str, depth: int) -> bool:
+        if depth >= MAX_ARCHIVE_DEPTH:
+            print(f"Warning: Skipped archive '{virtual_path}' (more than {MAX_ARCHIVE_DEPTH} levels of archives).")
+            return False
+        return True
+
+    def _spool(self, member: ArchiveMember, data):
+        # Read the data of a member ahead: in memory while the budget allows, else to a temporary file.
+        with self._lock:
+            in_memory = self._spooled_memory + member.size <= self._spool_memory_budget
+            if in_memory:
+                self._spooled_memory += member.size
+        if in_memory:
+            content = data.read()
+            member._spooled_size = member.size
+            member._opener = lambda: io.BytesIO(content)
+        else:
+            temp_file_path = self._new_temp_file()
+            with open(temp_file_path, "wb") as temp_file:
+                _copy_data(data, temp_file)
+            member._spool_path = temp_file_path
+        member._scanner = self
+
+    def _discard_temp_file(self, temp_file_path: str):
+        with self._lock:
+            self._temp_file_paths.discard(temp_file_path)
+        discard_temp_file(temp_file_path)
+
+    def _new_temp_file(self) -> str:
+        fd, temp_file_path = tempfile.mkstemp(prefix=".", suffix=TEMP_FILE_SUFFIX, dir=self._spool_folder)
+        os.close(fd)
+        with self._lock:
+            self._temp_file_paths.add(temp_file_path)
+        return temp_file_path
+
+
+def _copy_data(source_file, destination_file):
+    while True:
+        chunk = source_file.read(SPOOL_CHUNK_SIZE)
+        if not chunk:
+            break
+        destination_file.write(chunk)
+
+
+class _MemberFilter:
+    # This class is used to select the members of an archive that are collected.
+
+    def __init__(self, extensions, forbidden_path_matcher, folders_2_avoid):
+        super().__init__()
+        self.extensions = frozenset(extensions)
+        self.forbidden_path_matcher = forbidden_path_matcher
+        self.folders_2_avoid = frozenset(folders_2_avoid)
+        self.check_forbidden_paths = False
+        # The paths of the members to yield (None: all), and whether the data of the members is needed.
+        self.wanted_paths = None
+        self.read_data = True
+
+    def member_path(self, virtual_path: str, member_name: str) -> str:
+        # Return the path of a member below the path of its archive, or None if it is in a folder to avoid.
+        parts = [part for part in member_name.replace('\\', '/').split('/') if part and part not in ('.', '..')]
+        if not parts or any(part in self.folders_2_avoid for part in parts[:-1]):
+            return None
+        path = os.path.join(virtual_path, *parts)
+        if self.check_forbidden_paths and self.forbidden_path_matcher.matches(normalize_path(path)):
+            return None
+        return path
+
+    def accepts(self, path: str) -> bool:
+        if os.path.splitext(path)[1].lower() not in self.extensions:
+            return False
+        return self.wanted_paths is None or path in self.wanted_paths
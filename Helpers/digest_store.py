@@ -0,0 +1,313 @@
+import os
+import heapq
+import mmap
+import struct
+import bisect
+import threading
+from Helpers.hash_journal import HashJournal
+
+# Compact store for the hashes of the files in a target folder.
+#
+# Most of the hashes are kept in a binary file (hashes/digests.bin) that holds the raw
+# digests (16 or 32 bytes each, not hex strings) sorted in ascending order. The file is
+# memory-mapped and searched with a binary search, so opening the store costs the same no
+# matter how many hashes it holds, and the hashes are not loaded into Python objects.
+#
+# New hashes are appended to the hash journal (hashes/hashes.jllog) and kept in memory as
+# a small delta set. When the delta grows large compared to the binary file, it is merged
+# into a new binary file which then atomically replaces the old one, and the journal is
+# emptied. If the program crashes between the two steps, the journal holds hashes that are
+# also in the binary file, which is harmless: they are merged again the next time.
+#
+# The header of the hash journal (e.g. the hash algorithm) is the header of the store.
+#
+# The hashes of other stores (like the target folders of a batch, see shared_index.py) are
+# added in bulk: their sorted digest files are merged with the digest file in one pass (a
+# k-way merge of the memory-mapped files), and only the hashes in their journals are added
+# one by one.
+
+DIGEST_FILE_MAGIC = b"JLDIGEST"
+DIGEST_FILE_VERSION = 1
+# Magic, version, digest size, reserved, number of digests.
+DIGEST_FILE_HEADER = struct.Struct("<8sHHIQ")
+
+MERGE_MIN_DIGESTS = 16384
+MERGE_RATIO = 1 / 32
+WRITE_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+class _SortedDigests:
+    # A read-only sequence of the digests in a memory-mapped digest file, used with bisect.
+
+    def __init__(self, file_path: str):
+        super().__init__()
+        self._map = None
+        self.digest_size = 0
+        self.count = 0
+        try:
+            with open(file_path, 'rb') as f:
+                header = f.read(DIGEST_FILE_HEADER.size)
+                if len(header) < DIGEST_FILE_HEADER.size:
+                    raise ValueError("The file is too short")
+                magic, version, self.digest_size, _, self.count = DIGEST_FILE_HEADER.unpack(header)
+                if magic != DIGEST_FILE_MAGIC or version != DIGEST_FILE_VERSION:
+                    raise ValueError("Unknown file format")
+                if os.fstat(f.fileno()).st_size < DIGEST_FILE_HEADER.size + self.count * self.digest_size:
+                    raise ValueError("The file is truncated")
+                if self.count:
+                    self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            pass
+        except ValueError as e:
+            print(f"Warning: Ignoring the digest file '{file_path}'. Error: {e}")
+            self.digest_size = 0
+            self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index: int) -> bytes:
+        offset = DIGEST_FILE_HEADER.size + index * self.digest_size
+        return self._map[offset:offset + self.digest_size]
+
+    def __contains__(self, digest: bytes) -> bool:
+        if len(digest) != self.digest_size:
+            return False
+        index = bisect.bisect_left(self, digest)
+        return index < self.count and self[index] == digest
+
+    def __iter__(self):
+        # Iterate over the digests in order, reading the memory map in large chunks.
+        if not self.count:
+            return
+        chunk_size = max(1, WRITE_CHUNK_SIZE // self.digest_size) * self.digest_size
+        end_offset = DIGEST_FILE_HEADER.size + self.count * self.digest_size
+        for offset in range(DIGEST_FILE_HEADER.size, end_offset, chunk_size):
+            chunk = self._map[offset:min(offset + chunk_size, end_offset)]
+            for index in range(0, len(chunk), self.digest_size):
+                yield chunk[index:index + self.digest_size]
+
+    def write_range(self, f, start: int, end: int):
+        # Write the digests from index start to end (exclusive) to a file, in large chunks.
+        offset = DIGEST_FILE_HEADER.size + start * self.digest_size
+        end_offset = DIGEST_FILE_HEADER.size + end * self.digest_size
+        while offset < end_offset:
+            chunk_end = min(offset + WRITE_CHUNK_SIZE, end_offset)
+            f.write(self._map[offset:chunk_end])
+            offset = chunk_end
+
+    def hex_digests(self):
+        for index in range(self.count):
+            yield self[index].hex()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+def _parse_digests(records, digest_size: int=0) -> tuple:
+    # Convert hex records to raw digests of the same size.
+    # Return a tuple with the set of digests and the digest size.
+    digests = set()
+    for record in records:
+        try:
+            digest = bytes.fromhex(record)
+        except ValueError:
+            print(f"Warning: Ignoring invalid hash '{record}'")
+            continue
+        if not digest_size:
+            digest_size = len(digest)
+        if len(digest) != digest_size:
+            print(f"Warning: Ignoring hash '{record}' with a different length")
+            continue
+        digests.add(digest)
+    return (digests, digest_size)
+
+
+def read_digest_file(file_path: str) -> set:
+    # Read all hashes from a digest file.
+    # Return a set with the hashes as hex strings.
+    digests = _SortedDigests(file_path)
+    try:
+        return set(digests.hex_digests())
+    finally:
+        digests.close()
+
+
+class DigestStore:
+    # This class is used to keep the hashes of a target folder in a digest file and a hash journal.
+    # It is safe to use from several threads.
+
+    def __init__(self, journal_file_path: str, digest_file_path: str, merge_min_digests: int=MERGE_MIN_DIGESTS,
+                 merge_ratio: float=MERGE_RATIO):
+        super().__init__()
+        self._digest_file_path = digest_file_path
+        self._merge_min_digests = merge_min_digests
+        self._merge_ratio = merge_ratio
+        self._lock = threading.RLock()
+
+        self._journal = HashJournal(journal_file_path)
+        self._digests = _SortedDigests(digest_file_path)
+
+        # Merge a large delta (e.g. a hash journal from an earlier version) and hashes that are
+        # already in the digest file (left by a merge that was interrupted).
+        if self._needs_merge() or any(self._in_digest_file(record) for record in self._journal.records):
+            self.merge()
+
+    @property
+    def header(self) -> list:
+        return self._journal.header
+
+    @property
+    def digest_file_path(self) -> str:
+        return self._digest_file_path
+
+    @property
+    def journal(self) -> HashJournal:
+        return self._journal
+
+    def __contains__(self, file_hash: str) -> bool:
+        return file_hash in self._journal or self._in_digest_file(file_hash)
+
+    def __len__(self) -> int:
+        return len(self._digests) + len(self._journal)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, file_hash: str) -> bool:
+        # Add a hash to the store.
+        # Return False if the hash was already in the store.
+        with self._lock:
+            if self._in_digest_file(file_hash):
+                return False
+            return self._journal.add(file_hash)
+
+    def hex_hashes(self) -> list:
+        # Return a list with all hashes in the store (as hex strings).
+        with self._lock:
+            return list(self._digests.hex_digests()) + list(self._journal.records)
+
+    def rewrite(self, records, header: list=None):
+        # Replace all hashes in the store with the given hashes.
+        with self._lock:
+            digests, digest_size = _parse_digests(records)
+            self._write_digest_file(sorted(digests), digest_size, rewrite=True)
+            self._journal.reset(header)
+
+    def merge(self):
+        # Merge the hashes in the journal into the digest file and empty the journal.
+        with self._lock:
+            digests, digest_size = _parse_digests(self._journal.records, self._digests.digest_size)
+            self._write_digest_file(sorted(digests), digest_size, rewrite=False)
+            self._journal.reset(self._journal.header)
+
+    def merge_stores(self, stores: list) -> int:
+        # Add the hashes of other stores (not used by other threads meanwhile): their digest files are merged
+        # with the digest file and the journal of this store in one pass, then the hashes in their journals are added.
+        # Return the number of hashes that were not in the store yet.
+        with self._lock:
+            old_count = len(self)
+            digest_size = self._digests.digest_size
+            sources = []
+            for store in stores:
+                other_digests = store._digests
+                if not other_digests.count:
+                    continue
+                digest_size = digest_size or other_digests.digest_size
+                if other_digests.digest_size != digest_size:
+                    print(f"Warning: Ignoring the digest file '{store.digest_file_path}' with a different hash length")
+                    continue
+                sources.append(other_digests)
+
+            if sources:
+                journal_digests, digest_size = _parse_digests(self._journal.records, digest_size)
+                self._write_merged_digest_file([self._digests, sorted(journal_digests)] + sources, digest_size)
+                self._journal.reset(self._journal.header)
+
+            for store in stores:
+                for file_hash in store.journal.records:
+                    self.add(file_hash)
+            return len(self) - old_count
+
+    def close(self):
+        with self._lock:
+            if self._needs_merge():
+                self.merge()
+            self._journal.close()
+            self._digests.close()
+
+    def _in_digest_file(self, file_hash: str) -> bool:
+        try:
+            return bytes.fromhex(file_hash) in self._digests
+        except ValueError:
+            return False
+
+    def _needs_merge(self) -> bool:
+        return len(self._journal) >= max(self._merge_min_digests, self._merge_ratio * len(self._digests))
+
+    def _write_digest_file(self, new_digests: list, digest_size: int, rewrite: bool):
+        # Write a digest file with the (sorted) new digests, together with the digests of the
+        # current digest file unless it is rewritten. The new file atomically replaces the old one.
+        old_digests = self._digests
+        temp_file_path = f"{self._digest_file_path}.tmp"
+        with open(temp_file_path, 'wb') as f:
+            f.write(DIGEST_FILE_HEADER.pack(DIGEST_FILE_MAGIC, DIGEST_FILE_VERSION, digest_size, 0, 0))
+            count = 0
+            start = 0
+            for digest in new_digests:
+                if not rewrite:
+                    index = bisect.bisect_left(old_digests, digest)
+                    if index < len(old_digests) and old_digests[index] == digest:
+                        continue
+                    old_digests.write_range(f, start, index)
+                    count += index - start
+                    start = index
+                f.write(digest)
+                count += 1
+            if not rewrite:
+                old_digests.write_range(f, start, len(old_digests))
+                count += len(old_digests) - start
+
+            self._finish_digest_file(f, digest_size, count)
+        self._replace_digest_file(temp_file_path)
+
+    def _write_merged_digest_file(self, sorted_sources: list, digest_size: int):
+        # Write a digest file with the digests of the sorted sources (k-way merge, without duplicates).
+        # The new file atomically replaces the old one.
+        temp_file_path = f"{self._digest_file_path}.tmp"
+        with open(temp_file_path, 'wb') as f:
+            f.write(DIGEST_FILE_HEADER.pack(DIGEST_FILE_MAGIC, DIGEST_FILE_VERSION, digest_size, 0, 0))
+            count = 0
+            previous = None
+            chunk = []
+            chunk_limit = max(1, WRITE_CHUNK_SIZE // digest_size)
+            for digest in heapq.merge(*sorted_sources):
+                if digest == previous:
+                    continue
+                previous = digest
+                chunk.append(digest)
+                if len(chunk) >= chunk_limit:
+                    f.write(b"".join(chunk))
+                    count += len(chunk)
+                    chunk = []
+            f.write(b"".join(chunk))
+            count += len(chunk)
+            self._finish_digest_file(f, digest_size, count)
+        self._replace_digest_file(temp_file_path)
+
+    def _finish_digest_file(self, f, digest_size: int, count: int):
+        f.seek(0)
+        f.write(DIGEST_FILE_HEADER.pack(DIGEST_FILE_MAGIC, DIGEST_FILE_VERSION, digest_size, 0, count))
+        f.flush()
+        os.fsync(f.fileno())
+
+    def _replace_digest_file(self, temp_file_path: str):
+        # The memory map is closed first: a mapped file can not be replaced on Windows.
+        self._digests.close()
+        os.replace(temp_file_path, self._digest_file_path)
+        self._digests = _SortedDigests(self._digest_file_path)
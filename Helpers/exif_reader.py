@@ -0,0 +1,103 @@
+import struct
+import datetime
+
+# Minimal EXIF reader for the date a photo was taken.
+#
+# Only the EXIF DateTimeOriginal tag (or the DateTime tag of the first image) is read, from
+# JPEG files (APP1 "Exif" segment) and TIFF based files (TIFF, and raw formats like CR2, NEF,
+# ORF and SR2). Only the first part of the file is read. Other files, and files without a
+# valid date, return None.
+
+EXIF_READ_SIZE = 128 * 1024
+
+TAG_DATE_TIME = 0x0132
+TAG_EXIF_IFD = 0x8769
+TAG_DATE_TIME_ORIGINAL = 0x9003
+
+
+def _read_ifd(tiff: bytes, offset: int, byte_order: str) -> dict:
+    # Read the entries of an image file directory (IFD).
+    # Return a dictionary with the tag as key and a tuple (type, count, value/offset field) as value.
+    entries = {}
+    if offset + 2 > len(tiff):
+        return entries
+    entry_count = struct.unpack_from(byte_order + "H", tiff, offset)[0]
+    for index in range(entry_count):
+        entry_offset = offset + 2 + index * 12
+        if entry_offset + 12 > len(tiff):
+            break
+        tag, value_type, count = struct.unpack_from(byte_order + "HHI", tiff, entry_offset)
+        entries[tag] = (value_type, count, entry_offset + 8)
+    return entries
+
+
+def _read_date(tiff: bytes, entry: tuple, byte_order: str) -> datetime.datetime:
+    value_type, count, field_offset = entry
+    if value_type != 2 or count < 19:  # ASCII "YYYY:MM:DD HH:MM:SS"
+        return None
+    value_offset = field_offset if count <= 4 else struct.unpack_from(byte_order + "I", tiff, field_offset)[0]
+    text = tiff[value_offset:value_offset + 19].decode('ascii', errors='replace')
+    try:
+        return datetime.datetime.strptime(text, "%Y:%m:%d %H:%M:%S")
+    except ValueError:
+        return None
+
+
+def _read_tiff_date(tiff: bytes) -> datetime.datetime:
+    if tiff[:2] == b"II":
+        byte_order = "<"
+    elif tiff[:2] == b"MM":
+        byte_order = ">"
+    else:
+        return None
+    ifd0 = _read_ifd(tiff, struct.unpack_from(byte_order + "I", tiff, 4)[0], byte_order)
+
+    date = None
+    if TAG_EXIF_IFD in ifd0:
+        exif_ifd_offset = struct.unpack_from(byte_order + "I", tiff, ifd0[TAG_EXIF_IFD][2])[0]
+        exif_ifd = _read_ifd(tiff, exif_ifd_offset, byte_order)
+        if TAG_DATE_TIME_ORIGINAL in exif_ifd:
+            date = _read_date(tiff, exif_ifd[TAG_DATE_TIME_ORIGINAL], byte_order)
+    if date is None and TAG_DATE_TIME in ifd0:
+        date = _read_date(tiff, ifd0[TAG_DATE_TIME], byte_order)
+    return date
+
+
+def _find_jpeg_exif(data: bytes) -> bytes:
+    # Return the TIFF part of the EXIF segment of a JPEG file, or None.
+    offset = 2
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker in (0xD9, 0xDA):  # End of image, start of scan
+            return None
+        length = struct.unpack_from(">H", data, offset + 2)[0]
+        if marker == 0xE1 and data[offset + 4:offset + 10] == b"Exif\x00\x00":
+            return data[offset + 10:offset + 2 + length]
+        offset += 2 + length
+    return None
+
+
+def read_exif_datetime(file_path: str) -> datetime.datetime:
+    # Return the date and time the photo was taken, or None if it is not known.
+    try:
+        with open(file_path, "rb") as f:
+            data = f.read(EXIF_READ_SIZE)
+    except OSError:
+        return None
+    return parse_exif_datetime(data)
+
+
+def parse_exif_datetime(data: bytes) -> datetime.datetime:
+    # Return the date and time the photo was taken from the first EXIF_READ_SIZE bytes of a file, or None.
+    try:
+        if data[:2] == b"\xff\xd8":
+            tiff = _find_jpeg_exif(data)
+            return _read_tiff_date(tiff) if tiff else None
+        if data[:4] in (b"II*\x00", b"MM\x00*", b"IIRO", b"IIU\x00"):
+            return _read_tiff_date(data)
+    except struct.error:
+        # Truncated or corrupt EXIF data.
+        pass
+    return None
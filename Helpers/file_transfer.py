@@ -0,0 +1,189 @@
+import os
+import uuid
+import errno
+import shutil
+import tempfile
+import threading
+from Helpers.hashing_copy import TEMP_FILE_SUFFIX, copy_file_hashing, copy_stream_hashing, discard_temp_file
+from Helpers.archive_source import ArchiveMember
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows (no reflinks there).
+    fcntl = None
+
+# Transfer strategies for copying a file to a temporary file in the target folder.
+#
+# - copy:     buffered copy that hashes the file in the same pass (see hashing_copy.py).
+# - kernel:   the kernel copies the data (os.copy_file_range, else os.sendfile), without
+#             passing it through Python.
+# - reflink:  the target file shares the data blocks of the source file (FICLONE on Btrfs,
+#             XFS and other copy-on-write file systems). Free in time and disk space.
+# - hardlink: the target file is a hard link to the source file (the same file, so changes to
+#             the source file also show in the target folder). Free in time and disk space.
+#
+# Each strategy falls back to the next method when it is not supported, down to the buffered
+# copy: reflink -> copy_file_range -> sendfile -> buffered, hardlink -> buffered. Whether a
+# method works is detected once per pair of devices (source, target) and remembered, so
+# unsupported methods are not tried again for every file. Reflinks and hard links are never
+# tried between different devices.
+#
+# Only the buffered copy can hash the file while copying. With the other methods, a file
+# whose hash is not known yet is hashed before it is transferred.
+#
+# Files in an archive (see archive_source.py) are always copied with the buffered copy, since
+# their data is only available through Python.
+
+TRANSFER_STRATEGIES = ('copy', 'kernel', 'reflink', 'hardlink')
+DEFAULT_TRANSFER_STRATEGY = 'copy'
+
+# The ioctl request to clone a file on Linux (FICLONE = _IOW(0x94, 9, int)).
+FICLONE = 0x40049409
+KERNEL_COPY_CHUNK_SIZE = 64 * 1024 * 1024
+
+_METHOD_CHAINS = {
+    'copy': ('buffered',),
+    'kernel': ('copy_file_range', 'sendfile', 'buffered'),
+    'reflink': ('reflink', 'copy_file_range', 'sendfile', 'buffered'),
+    'hardlink': ('hardlink', 'buffered'),
+}
+_SAME_DEVICE_METHODS = ('reflink', 'hardlink')
+
+# Errors that mean that a method is not supported by the file systems (instead of a real error).
+_UNSUPPORTED_ERRNOS = frozenset(code for code in (errno.EXDEV, errno.EOPNOTSUPP, getattr(errno, 'ENOTSUP', None), errno.EINVAL,
+                                                  errno.ENOSYS, errno.ENOTTY, errno.EPERM) if code is not None)
+
+
+class MethodNotSupported(Exception):
+    # Raised by a transfer method that can not be used for a pair of devices.
+    pass
+
+
+def _kernel_copy(source_file, temp_file, use_copy_file_range: bool):
+    if use_copy_file_range:
+        if not hasattr(os, 'copy_file_range'):
+            raise MethodNotSupported()
+        copy = lambda: os.copy_file_range(source_file.fileno(), temp_file.fileno(), KERNEL_COPY_CHUNK_SIZE)
+    else:
+        if not hasattr(os, 'sendfile'):
+            raise MethodNotSupported()
+        copy = lambda: os.sendfile(temp_file.fileno(), source_file.fileno(), None, KERNEL_COPY_CHUNK_SIZE)
+
+    copied_count = 0
+    try:
+        while True:
+            count = copy()
+            if not count:
+                break
+            copied_count += count
+    except OSError as e:
+        if copied_count == 0 and e.errno in _UNSUPPORTED_ERRNOS:
+            raise MethodNotSupported() from e
+        raise
+
+
+def _reflink(source_file, temp_file):
+    if fcntl is None:
+        raise MethodNotSupported()
+    try:
+        fcntl.ioctl(temp_file.fileno(), FICLONE, source_file.fileno())
+    except OSError as e:
+        if e.errno in _UNSUPPORTED_ERRNOS:
+            raise MethodNotSupported() from e
+        raise
+
+
+class FileTransfer:
+    # This class is used to transfer files to the target folder with a transfer strategy.
+    # It is safe to use from several threads.
+
+    def __init__(self, strategy: str=DEFAULT_TRANSFER_STRATEGY):
+        super().__init__()
+        if strategy not in _METHOD_CHAINS:
+            raise ValueError(f"Unknown transfer strategy '{strategy}'. Available: {', '.join(TRANSFER_STRATEGIES)}")
+        self._strategy = strategy
+        self._lock = threading.Lock()
+        # The methods that are still believed to work, per pair of devices (source, target).
+        self._device_pair_methods = {}
+        self._folder_devices = {}
+
+    @property
+    def strategy(self) -> str:
+        return self._strategy
+
+    def hashes_while_copying(self, source_path: str, destination_folder: str) -> bool:
+        # Check if the file will be transferred with the buffered copy (which can hash it in the same pass).
+        if self._strategy == 'copy' or isinstance(source_path, ArchiveMember):
+            return True
+        _, methods = self._device_pair(source_path, destination_folder)
+        return methods[0] == 'buffered'
+
+    def transfer(self, source_path: str, destination_folder: str, hash_object=None) -> str:
+        # Transfer a file to a temporary file in the destination folder, with the first method of the
+        # strategy that works. The hash object (if given) is only updated by the buffered copy.
+        # Return the path of the temporary file.
+        if isinstance(source_path, ArchiveMember):
+            with source_path.open() as source_file:
+                return copy_stream_hashing(source_file, destination_folder, hash_object, source_path.mode, source_path.mtime_ns)
+        if self._strategy == 'copy':
+            return copy_file_hashing(source_path, destination_folder, hash_object)
+
+        device_pair, methods = self._device_pair(source_path, destination_folder)
+        for method in methods:
+            if method == 'buffered':
+                return copy_file_hashing(source_path, destination_folder, hash_object)
+            try:
+                return self._transfer_with(method, source_path, destination_folder)
+            except MethodNotSupported:
+                self._drop_method(device_pair, method)
+
+        return copy_file_hashing(source_path, destination_folder, hash_object)
+
+    def _transfer_with(self, method: str, source_path: str, destination_folder: str) -> str:
+        if method == 'hardlink':
+            temp_file_path = os.path.join(destination_folder, f".{uuid.uuid4().hex}{TEMP_FILE_SUFFIX}")
+            try:
+                os.link(source_path, temp_file_path)
+            except OSError as e:
+                if e.errno in _UNSUPPORTED_ERRNOS:
+                    raise MethodNotSupported() from e
+                raise
+            return temp_file_path
+
+        fd, temp_file_path = tempfile.mkstemp(prefix=".", suffix=TEMP_FILE_SUFFIX, dir=destination_folder)
+        try:
+            with open(source_path, "rb", buffering=0) as source_file, os.fdopen(fd, "wb", buffering=0) as temp_file:
+                if method == 'reflink':
+                    _reflink(source_file, temp_file)
+                else:
+                    _kernel_copy(source_file, temp_file, method == 'copy_file_range')
+            shutil.copystat(source_path, temp_file_path)
+        except BaseException:
+            discard_temp_file(temp_file_path)
+            raise
+        return temp_file_path
+
+    def _device_pair(self, source_path: str, destination_folder: str) -> tuple:
+        # Return the pair of devices of the source file and the destination folder, and the methods to try.
+        source_device = os.stat(source_path).st_dev
+        with self._lock:
+            destination_device = self._folder_devices.get(destination_folder)
+            if destination_device is None:
+                destination_device = os.stat(destination_folder).st_dev
+                self._folder_devices[destination_folder] = destination_device
+
+            device_pair = (source_device, destination_device)
+            methods = self._device_pair_methods.get(device_pair)
+            if methods is None:
+                methods = _METHOD_CHAINS[self._strategy]
+                if source_device != destination_device:
+                    methods = tuple(method for method in methods if method not in _SAME_DEVICE_METHODS)
+                self._device_pair_methods[device_pair] = methods
+        return (device_pair, methods)
+
+    def _drop_method(self, device_pair: tuple, method: str):
+        # Remember that a method does not work for a pair of devices.
+        with self._lock:
+            methods = self._device_pair_methods.get(device_pair, ())
+            self._device_pair_methods[device_pair] = tuple(m for m in methods if m != method) or ('buffered',)
@@ -0,0 +1,131 @@
+import os
+import mmap
+import hashlib
+from Helpers.hashing_copy import get_copy_buffer
+
+# Content hash backends used for the duplicate check.
+#
+# The backends from hashlib are always available (md5, sha256 and blake2b with a 256 bit
+# digest). xxh3_128 (package xxhash) and blake3 (package blake3) are used when installed.
+# New target folders use the fastest available backend, and the name of the backend is
+# recorded in the header of the hash index, so hashes made by different backends are never
+# mixed. Hash indexes from earlier versions (without a header) are md5.
+#
+# Files are read with readinto into a buffer that is reused for every file hashed by the
+# same thread, and large files are hashed through mmap, so no new bytes object is allocated
+# per chunk. A file that can not be read raises a HashError instead of getting the hash of
+# an empty file.
+
+HASH_BUFFER_SIZE = 1024 * 1024
+MMAP_THRESHOLD = 64 * 1024 * 1024
+MMAP_CHUNK_SIZE = 8 * 1024 * 1024
+
+LEGACY_HASH_ALGORITHM = 'md5'
+
+
+class HashError(Exception):
+    # Raised when a file can not be hashed.
+    pass
+
+
+class HashBackend:
+    # This class is used to describe a content hash backend.
+
+    def __init__(self, name: str, factory):
+        super().__init__()
+        self._name = name
+        self._factory = factory
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    def new(self):
+        # Return a new hash object (with update() and hexdigest()).
+        return self._factory()
+
+
+def _optional_backends() -> list:
+    backends = []
+    try:
+        import blake3
+        backends.append(HashBackend('blake3', blake3.blake3))
+    except ImportError:
+        pass
+    try:
+        import xxhash
+        backends.append(HashBackend('xxh3_128', xxhash.xxh3_128))
+    except ImportError:
+        pass
+    return backends
+
+
+# The available backends, fastest first.
+HASH_BACKENDS = {backend.name: backend for backend in _optional_backends() + [
+    HashBackend('blake2b', lambda: hashlib.blake2b(digest_size=32)),
+    HashBackend('md5', hashlib.md5),
+    HashBackend('sha256', hashlib.sha256),
+]}
+
+
+def available_hash_algorithms() -> tuple:
+    return tuple(HASH_BACKENDS)
+
+
+def fastest_hash_backend() -> HashBackend:
+    return next(iter(HASH_BACKENDS.values()))
+
+
+def get_hash_backend(name: str=None) -> HashBackend:
+    # Return the backend with the given name, or the fastest available backend if no name is given.
+    if not name:
+        return fastest_hash_backend()
+    try:
+        return HASH_BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Hash algorithm '{name}' is not available. Available: {', '.join(HASH_BACKENDS)}") from None
+
+
+def hash_file(file_path: str, hash_backend: HashBackend, file_size: int=None, buffer_size: int=HASH_BUFFER_SIZE,
+              hash_object=None) -> str:
+    # Calculate the hash of a file with the given backend (or update the given hash object of the backend).
+    # Return the hash as a hex string. Raise a HashError if the file can not be read.
+    if hash_object is None:
+        hash_object = hash_backend.new()
+    try:
+        with open(file_path, "rb", buffering=0) as f:
+            if file_size is None:
+                file_size = os.fstat(f.fileno()).st_size
+
+            if file_size >= MMAP_THRESHOLD:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file, memoryview(mapped_file) as view:
+                    for offset in range(0, len(view), MMAP_CHUNK_SIZE):
+                        hash_object.update(view[offset:offset + MMAP_CHUNK_SIZE])
+            else:
+                _update_from_file_object(hash_object, f, buffer_size)
+
+    except (OSError, ValueError) as e:
+        raise HashError(f"Error reading file '{file_path}': {e}") from e
+
+    return hash_object.hexdigest()
+
+
+def hash_file_object(file_object, hash_backend: HashBackend, name: str="", buffer_size: int=HASH_BUFFER_SIZE) -> str:
+    # Calculate the hash of the data of a binary file object (like a file in an archive) with the given backend.
+    # Return the hash as a hex string. Raise a HashError if the data can not be read.
+    hash_object = hash_backend.new()
+    try:
+        _update_from_file_object(hash_object, file_object, buffer_size)
+    except (OSError, ValueError) as e:
+        raise HashError(f"Error reading file '{name}': {e}") from e
+    return hash_object.hexdigest()
+
+
+def _update_from_file_object(hash_object, file_object, buffer_size: int):
+    buffer = get_copy_buffer(buffer_size)
+    with memoryview(buffer) as view:
+        while True:
+            read_count = file_object.readinto(buffer)
+            if not read_count:
+                break
+            hash_object.update(view[:read_count])
@@ -0,0 +1,197 @@
+import os
+import time
+import threading
+
+# Append-only journal used for the hash index of a target folder (hashes/hashes.jllog).
+#
+# The file holds one record per line. New records are appended at the end of the file,
+# so adding a hash costs the same no matter how many hashes are already stored.
+# A line starting with '-' removes a record that was added earlier (tombstone), and a
+# line starting with '#' is a header line. Files written by earlier versions (one hash
+# per line) are valid journals.
+#
+# If the program crashes while writing, the last line may be incomplete (no trailing
+# newline). Such a torn line is ignored when loading and cut off before appending again.
+# When the file holds a lot more lines than live records (tombstones and repeats), it is
+# compacted: the live records are written to a temporary file which then atomically
+# replaces the journal.
+
+
+def load_journal_records(file_path: str) -> tuple:
+    # Read the records from a journal file.
+    # Return a tuple with the set of live records, the header lines, the number of record
+    # lines in the file and the length in bytes of the valid (newline terminated) part.
+    records = set()
+    header = []
+    line_count = 0
+    valid_length = 0
+
+    with open(file_path, 'rb') as f:
+        for raw_line in f:
+            if not raw_line.endswith(b'\n'):
+                # Torn last line from an interrupted write.
+                break
+            valid_length += len(raw_line)
+            line = raw_line.decode('utf-8').strip()
+            if not line:
+                continue
+            if line.startswith('#'):
+                header.append(line[1:])
+                continue
+            line_count += 1
+            if line.startswith('-'):
+                records.discard(line[1:])
+            else:
+                records.add(line)
+
+    return (records, header, line_count, valid_length)
+
+
+class HashJournal:
+    # This class is used to keep a set of records (hashes) in an append-only journal file.
+    # It is safe to use from several threads.
+
+    def __init__(self, file_path: str, header: list=None, fsync_every: int=256, fsync_interval_s: float=2.0,
+                 compact_min_lines: int=4096, compact_ratio: float=2.0):
+        super().__init__()
+        self._file_path = file_path
+        self._fsync_every = fsync_every
+        self._fsync_interval_s = fsync_interval_s
+        self._compact_min_lines = compact_min_lines
+        self._compact_ratio = compact_ratio
+        self._lock = threading.RLock()
+
+        self._records = set()
+        self._header = []
+        self._line_count = 0
+        valid_length = 0
+        try:
+            self._records, self._header, self._line_count, valid_length = load_journal_records(file_path)
+        except FileNotFoundError:
+            pass
+
+        self._file = open(file_path, 'ab')
+        if self._file.tell() != valid_length:
+            # Cut off a torn last line, so the next record starts on a fresh line.
+            self._file.truncate(valid_length)
+            self._file.seek(valid_length)
+
+        if header and not self._header and self._file.tell() == 0:
+            self._write_header(header)
+
+        self._unsynced_count = 0
+        self._last_sync_time = time.monotonic()
+
+    @property
+    def file_path(self) -> str:
+        return self._file_path
+
+    @property
+    def records(self) -> set:
+        return self._records
+
+    @property
+    def header(self) -> list:
+        return self._header
+
+    def __contains__(self, record) -> bool:
+        return record in self._records
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, record: str) -> bool:
+        # Add a record to the journal.
+        # Return False if the record was already in the journal.
+        with self._lock:
+            if record in self._records:
+                return False
+            self._records.add(record)
+            self._append_line(record)
+            return True
+
+    def discard(self, record: str) -> bool:
+        # Remove a record from the journal.
+        # Return False if the record was not in the journal.
+        with self._lock:
+            if record not in self._records:
+                return False
+            self._records.discard(record)
+            self._append_line(f"-{record}")
+            return True
+
+    def reset(self, header: list=None):
+        # Remove all records from the journal.
+        # The empty journal (with only the header) replaces the file atomically, so a crash never leaves
+        # a journal without its header behind.
+        self.rewrite((), header)
+
+    def rewrite(self, records, header: list=None):
+        # Replace all records in the journal with the given records, in a single write.
+        with self._lock:
+            self._records = set(records)
+            self._header = list(header) if header else []
+            self.compact()
+
+    def sync(self):
+        # Flush the written records to the disk.
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._unsynced_count = 0
+            self._last_sync_time = time.monotonic()
+
+    def compact(self):
+        # Rewrite the journal so that it only holds the live records.
+        with self._lock:
+            temp_file_path = f"{self._file_path}.tmp"
+            with open(temp_file_path, 'wb') as f:
+                for line in self._header:
+                    f.write(f"#{line}\n".encode('utf-8'))
+                for record in self._records:
+                    f.write(f"{record}\n".encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+
+            self._file.close()
+            os.replace(temp_file_path, self._file_path)
+            self._file = open(self._file_path, 'ab')
+            self._line_count = len(self._records)
+            self._unsynced_count = 0
+            self._last_sync_time = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            if self._file.closed:
+                return
+            if self._needs_compaction():
+                self.compact()
+            else:
+                self.sync()
+            self._file.close()
+
+    def _write_header(self, header: list):
+        self._header = list(header)
+        for line in self._header:
+            self._file.write(f"#{line}\n".encode('utf-8'))
+
+    def _append_line(self, line: str):
+        self._file.write(f"{line}\n".encode('utf-8'))
+        self._line_count += 1
+        self._unsynced_count += 1
+
+        # Batched fsync: sync after a number of records or after some time has passed.
+        if self._unsynced_count >= self._fsync_every or time.monotonic() - self._last_sync_time >= self._fsync_interval_s:
+            self.sync()
+
+        if self._needs_compaction():
+            self.compact()
+
+    def _needs_compaction(self) -> bool:
+        return self._line_count >= self._compact_min_lines and self._line_count > self._compact_ratio * len(self._records)
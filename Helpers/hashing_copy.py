@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+import threading
+
+# Single-pass copy that hashes a file while copying it.
+#
+# The source file is read once through a large buffer that is reused for every file copied
+# by the same thread. Each chunk updates the hash and is written to a temporary file in the
+# destination folder. The caller then either moves the temporary file into place (the hash
+# is new) or removes it (the file is a duplicate). Since the destination file only gets its
+# final name when it is complete, a crash never leaves a half-written file behind under a
+# real name.
+#
+# The file metadata is copied like shutil.copy2 does (permission bits, timestamps, flags).
+# Data that is not a file (like a file in an archive) is copied from a file object the same
+# way, and gets the permission bits and modification time given for it.
+
+COPY_BUFFER_SIZE = 1024 * 1024
+TEMP_FILE_SUFFIX = ".jlpart"
+
+_thread_buffers = threading.local()
+
+
+def get_copy_buffer(buffer_size: int) -> bytearray:
+    # Return the copy buffer of the current thread, so no new buffer is allocated per chunk or file.
+    buffer = getattr(_thread_buffers, 'buffer', None)
+    if buffer is None or len(buffer) != buffer_size:
+        buffer = bytearray(buffer_size)
+        _thread_buffers.buffer = buffer
+    return buffer
+
+
+def copy_file_hashing(source_path: str, destination_folder: str, hash_object=None, buffer_size: int=COPY_BUFFER_SIZE) -> str:
+    # Copy a file to a temporary file in the destination folder, updating the hash object
+    # (if given) with the content in the same pass.
+    # Return the path of the temporary file.
+    fd, temp_file_path = tempfile.mkstemp(prefix=".", suffix=TEMP_FILE_SUFFIX, dir=destination_folder)
+    try:
+        with open(source_path, "rb", buffering=0) as source_file, os.fdopen(fd, "wb", buffering=0) as temp_file:
+            _copy_data_hashing(source_file, temp_file, hash_object, buffer_size)
+
+        shutil.copystat(source_path, temp_file_path)
+    except BaseException:
+        discard_temp_file(temp_file_path)
+        raise
+
+    return temp_file_path
+
+
+def copy_stream_hashing(source_file, destination_folder: str, hash_object=None, mode: int=None, mtime_ns: int=None,
+                        buffer_size: int=COPY_BUFFER_SIZE) -> str:
+    # Copy the data of a binary file object to a temporary file in the destination folder, updating
+    # the hash object (if given) in the same pass, and set the permission bits and modification time (if given).
+    # Return the path of the temporary file.
+    fd, temp_file_path = tempfile.mkstemp(prefix=".", suffix=TEMP_FILE_SUFFIX, dir=destination_folder)
+    try:
+        with os.fdopen(fd, "wb", buffering=0) as temp_file:
+            _copy_data_hashing(source_file, temp_file, hash_object, buffer_size)
+
+        if mode is not None:
+            os.chmod(temp_file_path, mode)
+        if mtime_ns:
+            os.utime(temp_file_path, ns=(mtime_ns, mtime_ns))
+    except BaseException:
+        discard_temp_file(temp_file_path)
+        raise
+
+    return temp_file_path
+
+
+def _copy_data_hashing(source_file, temp_file, hash_object, buffer_size: int):
+    buffer = get_copy_buffer(buffer_size)
+    with memoryview(buffer) as view:
+        while True:
+            read_count = source_file.readinto(buffer)
+            if not read_count:
+                break
+            chunk = view[:read_count]
+            if hash_object is not None:
+                hash_object.update(chunk)
+            written_count = 0
+            while written_count < read_count:
+                written_count += temp_file.write(chunk[written_count:])
+
+
+def commit_temp_file(temp_file_path: str, destination_path: str):
+    # Give the complete temporary file its final name.
+    os.replace(temp_file_path, destination_path)
+
+
+def discard_temp_file(temp_file_path: str):
+    # Remove a temporary file (for instance because the file turned out to be a duplicate).
+    try:
+        os.remove(temp_file_path)
+    except FileNotFoundError:
+        pass
+
+
+def remove_stale_temp_files(folder: str) -> int:
+    # Remove the temporary files left behind in a folder by an interrupted run.
+    # Return the number of files removed.
+    removed_count = 0
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.name.startswith(".") and entry.name.endswith(TEMP_FILE_SUFFIX) and entry.is_file(follow_symlinks=False):
+                discard_temp_file(entry.path)
+                removed_count += 1
+    return removed_count
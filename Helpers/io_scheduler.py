@@ -0,0 +1,181 @@
+import os
+import time
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+# Per-device I/O scheduler for the copy engine.
+#
+# The files of a run are grouped by the device (st_dev) they are on. Every device gets its
+# own hash and copy workers and its own limit of concurrent reads and writes, so a slow device
+# never holds up the workers of a fast one, and all devices are busy at the same time:
+# - spinning disks (rotational): one read or write at a time (rotational_workers), since
+#   concurrent requests make the heads seek back and forth. Files are read in inode order
+#   within each folder, which is close to the order on the disk.
+# - other devices (SSD, network, unknown): as many as the number of hash workers.
+# A copy holds an I/O slot of the source device and of the target device.
+#
+# One scheduler can be shared by several runs at the same time (the jobs of a batch), so the
+# limits of a device hold over all of them. Each run then gives the device of its own target
+# folder when it copies.
+#
+# Each device also has a limit of files in flight (admit() / release()), so the files of a
+# slow device can not fill up the queue of the run. Optionally, the reads of every device are
+# limited to a bandwidth (bytes per second).
+#
+# Whether a device is rotational is read from /sys/dev/block on Linux. Elsewhere it is not
+# known and the device is handled like an SSD.
+
+DEFAULT_ROTATIONAL_WORKERS = 1
+FILES_IN_FLIGHT_PER_WORKER = 8
+
+
+def is_rotational_device(device: int) -> bool:
+    # Return True for a spinning disk, False for an SSD, or None if it is not known.
+    try:
+        sys_path = os.path.realpath(f"/sys/dev/block/{os.major(device)}:{os.minor(device)}")
+    except AttributeError:
+        # No os.major on Windows.
+        return None
+    # A partition has no queue folder of its own: the disk is the parent folder.
+    for path in (sys_path, os.path.dirname(sys_path)):
+        try:
+            with open(os.path.join(path, "queue", "rotational"), "r") as f:
+                return f.read().strip() == "1"
+        except OSError:
+            continue
+    return None
+
+
+def device_of(path: str) -> int:
+    # Return the device (st_dev) of a file or folder.
+    return os.stat(path).st_dev
+
+
+class TokenBucket:
+    # This class is used to limit the bandwidth of reads (bytes per second).
+    # It is safe to use from several threads.
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self._rate = rate
+        self._tokens = rate
+        self._last_time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, count: int):
+        # Take count bytes from the bucket, and wait until the bandwidth allows them.
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._rate, self._tokens + (now - self._last_time) * self._rate)
+            self._last_time = now
+            self._tokens -= count
+            wait_time = -self._tokens / self._rate if self._tokens < 0 else 0
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
+class DeviceQueue:
+    # This class is used to keep the workers and limits of one device.
+
+    def __init__(self, device: int, rotational: bool, workers: int, copy_workers: int, max_read_bytes_per_s: float=None):
+        super().__init__()
+        self.device = device
+        self.rotational = rotational
+        self.workers = workers
+        self.io_slots = threading.Semaphore(workers)
+        self.files_in_flight = threading.Semaphore(FILES_IN_FLIGHT_PER_WORKER * (workers + copy_workers))
+        self.bandwidth = TokenBucket(max_read_bytes_per_s) if max_read_bytes_per_s else None
+        self.hash_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"hash-{device}")
+        self.copy_pool = ThreadPoolExecutor(max_workers=copy_workers, thread_name_prefix=f"copy-{device}")
+
+
+class IOScheduler:
+    # This class is used to schedule the hashing and copying of files per device.
+    # It is safe to use from several threads. The files must have a device attribute (ScanRecord).
+
+    def __init__(self, hash_workers: int, copy_workers: int, target_folder: str=None, rotational_workers: int=DEFAULT_ROTATIONAL_WORKERS,
+                 max_read_bytes_per_s: float=None):
+        # target_folder: the target folder of the copies (None for a scheduler shared by runs with different target folders).
+        super().__init__()
+        self._hash_workers = hash_workers
+        self._copy_workers = copy_workers
+        self._rotational_workers = rotational_workers
+        self._max_read_bytes_per_s = max_read_bytes_per_s
+        self._lock = threading.Lock()
+        self._devices = {}
+        self._target_device = self.device_queue(device_of(target_folder)) if target_folder is not None else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    def device_queue(self, device: int) -> DeviceQueue:
+        # Return the queue of a device (created the first time).
+        with self._lock:
+            device_queue = self._devices.get(device)
+            if device_queue is None:
+                rotational = is_rotational_device(device)
+                workers = self._rotational_workers if rotational else self._hash_workers
+                copy_workers = self._rotational_workers if rotational else self._copy_workers
+                device_queue = DeviceQueue(device, bool(rotational), workers, copy_workers, self._max_read_bytes_per_s)
+                self._devices[device] = device_queue
+            return device_queue
+
+    def is_rotational(self, device: int) -> bool:
+        return self.device_queue(device).rotational
+
+    def max_files_in_flight(self) -> int:
+        # Return the number of files in flight when all devices known so far are busy.
+        with self._lock:
+            return sum(FILES_IN_FLIGHT_PER_WORKER * (device_queue.workers + self._copy_workers) for device_queue in self._devices.values())
+
+    def admit(self, record, timeout: float=None) -> bool:
+        # Wait until the device of the file has room for one more file in flight.
+        # Return False if the timeout passed first.
+        return self.device_queue(record.device).files_in_flight.acquire(timeout=timeout)
+
+    def release(self, record):
+        # Give back the room taken by a file that is done.
+        self.device_queue(record.device).files_in_flight.release()
+
+    def hash_pool(self, record) -> ThreadPoolExecutor:
+        return self.device_queue(record.device).hash_pool
+
+    def copy_pool(self, record) -> ThreadPoolExecutor:
+        return self.device_queue(record.device).copy_pool
+
+    @contextlib.contextmanager
+    def reading(self, record):
+        # Hold an I/O slot of the device of the file while reading it.
+        device_queue = self.device_queue(record.device)
+        with device_queue.io_slots:
+            if device_queue.bandwidth is not None:
+                device_queue.bandwidth.consume(record.size)
+            yield
+
+    @contextlib.contextmanager
+    def copying(self, record, target_device: int=None):
+        # Hold an I/O slot of the device of the file and of the target device (default: the device of the
+        # target folder of the scheduler) while copying it.
+        # The slots are always taken in the order of the devices, so two copies never wait for each other.
+        source_queue = self.device_queue(record.device)
+        target_queue = self.device_queue(target_device) if target_device is not None else self._target_device
+        device_queues = sorted({source_queue, target_queue or source_queue}, key=lambda device_queue: device_queue.device)
+        with contextlib.ExitStack() as stack:
+            for device_queue in device_queues:
+                stack.enter_context(device_queue.io_slots)
+            if source_queue.bandwidth is not None:
+                source_queue.bandwidth.consume(record.size)
+            yield
+
+    def shutdown(self):
+        # Shut down the hash pools first, since their workers hand over files to the copy pools.
+        with self._lock:
+            device_queues = list(self._devices.values())
+        for device_queue in device_queues:
+            device_queue.hash_pool.shutdown(wait=True)
+        for device_queue in device_queues:
+            device_queue.copy_pool.shutdown(wait=True)
@@ -0,0 +1,221 @@
+import os
+import queue
+import threading
+import collections
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Concurrent engine for hashing and copying files.
+#
+# Files are hashed by a pool of hash workers and copied by a separate pool of copy workers.
+# Threads are used for both pools: hashlib and file I/O release the GIL, so the work scales
+# over the cores until the disks are saturated.
+#
+# The engine is the single owner of the dedup decision. When a hash is ready, the digest is
+# claimed under a lock. A digest that is already in the target hashes, or that is claimed by
+# a file still being copied, is a duplicate. This way two identical source files finishing at
+# the same moment are never both copied.
+#
+# The hash function may return None for a file that is known to be new without its full hash
+# (see the size index). Such a file is copied right away, and the copy function calculates the
+# hash and claims it with the claim callable before keeping the copy. If the claim fails, the
+# copy function removes the copy again and the file is a duplicate.
+#
+# The results are returned in the same order as the files were given, so the log file is
+# deterministic. Only a bounded number of files is in flight at any time.
+#
+# With an I/O scheduler (see io_scheduler.py), every device has its own hash and copy workers
+# instead of the two shared pools. The results can then be returned as soon as they are ready
+# (ordered=False), so a slow device does not hold up the results of a fast one. The files must
+# be admitted by the scheduler (IOScheduler.admit) before they are given to the engine.
+#
+# Engines that collect into a shared dedup domain (the jobs of a batch run) share their hash
+# claims, so a digest claimed by a file of one job is a duplicate for the files of the others.
+
+
+def default_hash_workers() -> int:
+    return min(8, os.cpu_count() or 1)
+
+
+class HashClaims:
+    # This class is used to store the digests claimed by the files being copied, under one lock.
+    # It is safe to use from several threads.
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._hashes = set()
+
+    @property
+    def lock(self) -> threading.Lock:
+        return self._lock
+
+    @property
+    def hashes(self) -> set:
+        # The claimed digests (only to be used while holding the lock).
+        return self._hashes
+
+
+class ParallelCopyEngine:
+    # This class is used to hash and copy files with a bounded number of worker threads.
+    #
+    # hash_func(file) -> digest, or None if the file is known to be new.
+    # copy_func(file, digest, claim) -> tuple ('Copied', 'Duplicate' or an error text, digest).
+    #   When digest is None, copy_func must call claim(digest) before keeping the copy.
+    # precheck_func(file) -> a result text for files that should not be hashed or copied, or None.
+    # claims: the hash claims shared with other engines (default: claims of this engine only).
+
+    def __init__(self, hash_func, copy_func, target_hashes, hash_workers: int=None, copy_workers: int=2,
+                 precheck_func=None, max_pending: int=None, scheduler=None, ordered: bool=True,
+                 claims: HashClaims=None):
+        super().__init__()
+        self._hash_func = hash_func
+        self._copy_func = copy_func
+        self._precheck_func = precheck_func
+        self._target_hashes = target_hashes
+        self._hash_workers = max(1, hash_workers or default_hash_workers())
+        self._copy_workers = max(1, copy_workers)
+        self._max_pending = max_pending or 4 * (self._hash_workers + self._copy_workers)
+        self._scheduler = scheduler
+        self._ordered = ordered
+
+        self._claims = claims if claims is not None else HashClaims()
+
+    @property
+    def hash_workers(self) -> int:
+        return self._hash_workers
+
+    @property
+    def copy_workers(self) -> int:
+        return self._copy_workers
+
+    def run(self, files):
+        # Hash and copy the files.
+        # Yield a tuple (file, result) for each file, in the same order as the files (unless not ordered).
+        if self._scheduler is not None:
+            # The scheduler owns the worker pools (one hash and one copy pool per device).
+            yield from self._collect(files, self._submit_scheduled)
+            return
+
+        # The hash pool is shut down first, since its workers hand over files to the copy pool.
+        with ThreadPoolExecutor(max_workers=self._copy_workers, thread_name_prefix="copy") as copy_pool, \
+             ThreadPoolExecutor(max_workers=self._hash_workers, thread_name_prefix="hash") as hash_pool:
+            yield from self._collect(files, lambda file: self._submit(file, hash_pool, copy_pool))
+
+    def _collect(self, files, submit):
+        if not self._ordered:
+            yield from self._collect_unordered(files, submit)
+            return
+
+        pending = collections.deque()
+        for file in files:
+            pending.append((file, submit(file)))
+
+            # Backpressure: wait for the oldest file before taking in more files.
+            while len(pending) >= self._max_pending:
+                done_file, result = pending.popleft()
+                yield (done_file, result.result())
+
+        while pending:
+            done_file, result = pending.popleft()
+            yield (done_file, result.result())
+
+    def _collect_unordered(self, files, submit):
+        done = queue.SimpleQueue()
+        pending_count = 0
+        for file in files:
+            submit(file).add_done_callback(lambda result, file=file: done.put((file, result.result())))
+            pending_count += 1
+
+            # Backpressure: wait for any file before taking in more files.
+            while pending_count >= self._max_pending:
+                yield done.get()
+                pending_count -= 1
+
+        while pending_count:
+            yield done.get()
+            pending_count -= 1
+
+    def _submit_scheduled(self, file) -> Future:
+        # The files are admitted by the scheduler before they are given to the engine, and released
+        # as soon as they are done (not when the result is taken), so admitting never waits for the consumer.
+        result = self._submit(file, self._scheduler.hash_pool(file), self._scheduler.copy_pool(file))
+        result.add_done_callback(lambda _: self._scheduler.release(file))
+        return result
+
+    def _submit(self, file, hash_pool, copy_pool) -> Future:
+        result = Future()
+
+        if self._precheck_func is not None:
+            precheck_result = self._precheck_func(file)
+            if precheck_result is not None:
+                result.set_result(precheck_result)
+                return result
+
+        def on_hashed(hash_future):
+            # A done callback must not raise (the result would never be set and the run would wait forever),
+            # for example when the copy pool is already shut down.
+            try:
+                hand_over(hash_future)
+            except Exception as e:
+                if not result.done():
+                    result.set_exception(e)
+
+        def hand_over(hash_future):
+            try:
+                file_hash = hash_future.result()
+            except Exception as e:
+                result.set_result(f"Error hashing: {e}")
+                return
+
+            if file_hash is not None and not self._claim(file_hash):
+                result.set_result('Duplicate')
+                return
+
+            try:
+                copy_future = copy_pool.submit(self._copy, file, file_hash)
+            except Exception:
+                if file_hash is not None:
+                    with self._claims.lock:
+                        self._claims.hashes.discard(file_hash)
+                raise
+            copy_future.add_done_callback(on_copied)
+
+        def on_copied(copy_future):
+            try:
+                result.set_result(copy_future.result())
+            except Exception as e:
+                if not result.done():
+                    result.set_exception(e)
+
+        hash_pool.submit(self._hash_func, file).add_done_callback(on_hashed)
+        return result
+
+    def _claim(self, file_hash: str) -> bool:
+        # Claim a digest for copying.
+        # Return False if the digest is already in the target or claimed by another file.
+        with self._claims.lock:
+            if file_hash in self._target_hashes or file_hash in self._claims.hashes:
+                return False
+            self._claims.hashes.add(file_hash)
+            return True
+
+    def _copy(self, file, file_hash: str) -> str:
+        claimed_hashes = [file_hash] if file_hash is not None else []
+
+        def claim(new_file_hash: str) -> bool:
+            if not self._claim(new_file_hash):
+                return False
+            claimed_hashes.append(new_file_hash)
+            return True
+
+        try:
+            copy_result, file_hash = self._copy_func(file, file_hash, claim)
+        except Exception as e:
+            copy_result = f"Error copying: {e}"
+
+        with self._claims.lock:
+            if copy_result == 'Copied':
+                self._target_hashes.add(file_hash)
+            for claimed_hash in claimed_hashes:
+                self._claims.hashes.discard(claimed_hash)
+        return copy_result
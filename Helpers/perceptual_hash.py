@@ -0,0 +1,143 @@
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    # Pillow is needed to decode images (no near-duplicate check without it).
+    Image = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Perceptual hashes of images, used to find near-duplicates (the same photo saved again,
+# resized, recompressed or without its EXIF data) that have a different content hash.
+#
+# - dhash: difference hash. The image is reduced to 9x8 gray pixels, and each bit tells if a
+#          pixel is brighter than its neighbour to the left.
+# - phash: DCT hash. The image is reduced to 32x32 gray pixels, and each bit tells if one of
+#          the 8x8 lowest frequencies of its DCT is above their median. More robust than the
+#          dhash against changes of contrast and gamma, but slower. Needs numpy.
+#
+# Both hashes have 64 bits, and similar images have hashes that differ in only a few bits
+# (Hamming distance). Decoding is done by Pillow: JPEG files are decoded at a reduced scale
+# (draft mode), which is many times faster than decoding the full image, and the EXIF
+# orientation is applied so a rotated copy gets the same hash. The hashes of a batch of
+# thumbnails are calculated with a few numpy operations on the whole batch (without numpy,
+# the dhash is calculated pixel by pixel).
+#
+# A file that can not be decoded (unknown format, raw camera files, broken files) gets no
+# perceptual hash (None).
+
+PERCEPTUAL_ALGORITHMS = ('dhash', 'phash')
+DEFAULT_PERCEPTUAL_ALGORITHM = 'dhash'
+PERCEPTUAL_HASH_BITS = 64
+THUMBNAIL_BATCH_SIZE = 256
+
+_THUMBNAIL_SIZES = {
+    'dhash': (9, 8),
+    'phash': (32, 32),
+}
+_DCT_SIZE = 32
+_DCT_LOW_FREQUENCIES = 8
+
+if hasattr(int, 'bit_count'):
+    def hamming_distance(hash_a: int, hash_b: int) -> int:
+        # Return the number of bits that differ between two perceptual hashes.
+        return (hash_a ^ hash_b).bit_count()
+else:
+    def hamming_distance(hash_a: int, hash_b: int) -> int:
+        # Return the number of bits that differ between two perceptual hashes.
+        return bin(hash_a ^ hash_b).count('1')
+
+
+def available_perceptual_algorithms() -> tuple:
+    # Return the names of the perceptual hash algorithms that can be used with the installed packages.
+    if Image is None:
+        return ()
+    if numpy is None:
+        return ('dhash',)
+    return PERCEPTUAL_ALGORITHMS
+
+
+def load_thumbnail(file_path: str, algorithm: str=DEFAULT_PERCEPTUAL_ALGORITHM):
+    # Decode an image (a path, or a binary file object that can seek) to the gray thumbnail used by the perceptual hash algorithm.
+    # Return the thumbnail (a Pillow image), or None if the file can not be decoded.
+    size = _THUMBNAIL_SIZES[algorithm]
+    try:
+        with Image.open(file_path) as image:
+            # Let the JPEG decoder scale the image down while decoding (to at least the thumbnail size).
+            image.draft('L', size)
+            image = ImageOps.exif_transpose(image)
+            return image.convert('L').resize(size, Image.Resampling.BOX)
+    except Exception:
+        # Pillow raises many kinds of errors for files it can not decode.
+        return None
+
+
+def _dct_matrix():
+    # The DCT-II matrix (without scaling, which does not change the order of the coefficients).
+    rows = numpy.arange(_DCT_SIZE).reshape(-1, 1)
+    columns = numpy.arange(_DCT_SIZE).reshape(1, -1)
+    return numpy.cos(numpy.pi * (2 * columns + 1) * rows / (2 * _DCT_SIZE)).astype(numpy.float32)
+
+
+def _pack_bits(bits) -> list:
+    # Pack an (n, 64) array of bits into a list of n integers (first bit = highest bit).
+    return [int(value) for value in numpy.packbits(bits, axis=1).view('>u8').ravel()]
+
+
+def hash_thumbnails(thumbnails: list, algorithm: str=DEFAULT_PERCEPTUAL_ALGORITHM) -> list:
+    # Calculate the perceptual hashes of a batch of thumbnails (from load_thumbnail).
+    # Return a list with the hashes as 64 bit integers.
+    if not thumbnails:
+        return []
+
+    if numpy is None:
+        if algorithm != 'dhash':
+            raise ValueError(f"The perceptual hash algorithm '{algorithm}' needs numpy.")
+        hashes = []
+        for thumbnail in thumbnails:
+            pixels = list(thumbnail.getdata())
+            perceptual_hash = 0
+            for row in range(0, len(pixels), 9):
+                for column in range(row, row + 8):
+                    perceptual_hash = (perceptual_hash << 1) | (pixels[column + 1] > pixels[column])
+            hashes.append(perceptual_hash)
+        return hashes
+
+    pixels = numpy.stack([numpy.asarray(thumbnail, dtype=numpy.float32) for thumbnail in thumbnails])
+    if algorithm == 'dhash':
+        bits = pixels[:, :, 1:] > pixels[:, :, :-1]
+    else:
+        dct = _dct_matrix()
+        coefficients = (dct @ pixels @ dct.T)[:, :_DCT_LOW_FREQUENCIES, :_DCT_LOW_FREQUENCIES]
+        coefficients = coefficients.reshape(len(thumbnails), -1)
+        # The median leaves out the first coefficient (the average brightness).
+        medians = numpy.median(coefficients[:, 1:], axis=1, keepdims=True)
+        bits = coefficients > medians
+    return _pack_bits(bits.reshape(len(thumbnails), PERCEPTUAL_HASH_BITS))
+
+
+def perceptual_hash_files(file_paths: list, algorithm: str=DEFAULT_PERCEPTUAL_ALGORITHM, workers: int=1) -> list:
+    # Calculate the perceptual hashes of a list of files, decoding the images with a number of threads
+    # (Pillow releases the GIL while decoding) and hashing them in batches.
+    # Return a list with a hash (or None if the file can not be decoded) for each file.
+    hashes = []
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="thumbnail") as pool:
+        for start in range(0, len(file_paths), THUMBNAIL_BATCH_SIZE):
+            thumbnails = list(pool.map(lambda file_path: load_thumbnail(file_path, algorithm),
+                                       file_paths[start:start + THUMBNAIL_BATCH_SIZE]))
+            decoded_hashes = iter(hash_thumbnails([thumbnail for thumbnail in thumbnails if thumbnail is not None], algorithm))
+            hashes.extend(None if thumbnail is None else next(decoded_hashes) for thumbnail in thumbnails)
+    return hashes
+
+
+def perceptual_hash_file(file_path: str, algorithm: str=DEFAULT_PERCEPTUAL_ALGORITHM) -> int:
+    # Calculate the perceptual hash of an image (a path, or a binary file object that can seek).
+    # Return the hash as a 64 bit integer, or None if the file can not be decoded.
+    thumbnail = load_thumbnail(file_path, algorithm)
+    if thumbnail is None:
+        return None
+    return hash_thumbnails([thumbnail], algorithm)[0]
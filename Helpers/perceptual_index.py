@@ -0,0 +1,219 @@
+import os
+import itertools
+import threading
+from Helpers.hash_journal import HashJournal
+from Helpers.perceptual_hash import PERCEPTUAL_HASH_BITS, hamming_distance, perceptual_hash_files
+
+# Perceptual hash index of a target folder (hashes/perceptual.jllog, next to the hash journal).
+#
+# Each record holds the perceptual hash and the content hash of a file in the target folder:
+# "<perceptual hash in hex>:<content hash>", or "none:<content hash>" for a file that has no
+# perceptual hash (not an image, or an image that can not be decoded). So the index covers the
+# target folder when it has a record for every content hash in the hash list. The perceptual
+# hash algorithm is recorded in the header ("#algo=dhash"); an index of another algorithm is
+# started over.
+#
+# Near-duplicates are found with multi-index hashing: the 64 bits of a hash are split into 4
+# chunks of 16 bits, and the hashes are stored in one table per chunk, keyed by the bits of the
+# chunk. When two hashes differ in at most threshold bits, at least one of their chunks differs
+# in at most threshold // 4 bits. So only the hashes in the table entries within that distance
+# of the chunks of the hash looked up need to be compared (a few hundred entries), instead of
+# all hashes in the index.
+
+PERCEPTUAL_INDEX_FILE_NAME = "perceptual.jllog"
+DEFAULT_NEAR_DUPLICATE_THRESHOLD = 6
+CHUNK_BITS = 16
+NO_PERCEPTUAL_HASH = "none"
+ALGORITHM_HEADER_PREFIX = "algo="
+
+
+class HammingIndex:
+    # This class is used to find the hashes within a Hamming distance (threshold) of a hash.
+
+    def __init__(self, threshold: int, bits: int=PERCEPTUAL_HASH_BITS):
+        super().__init__()
+        if not 0 <= threshold < bits:
+            raise ValueError(f"The near-duplicate threshold must be between 0 and {bits - 1}.")
+        self._threshold = threshold
+
+        # Split the bits into chunks, and find the masks of the bits to flip to get every chunk value within the
+        # distance a chunk of a near-duplicate can have.
+        chunk_mask = (1 << CHUNK_BITS) - 1
+        self._chunks = [(shift, chunk_mask) for shift in range(0, bits, CHUNK_BITS)]
+        chunk_threshold = threshold // len(self._chunks)
+        self._flip_masks = [sum(1 << bit for bit in flipped_bits)
+                            for count in range(chunk_threshold + 1)
+                            for flipped_bits in itertools.combinations(range(CHUNK_BITS), count)]
+        self._tables = [{} for _ in self._chunks]
+        # The number of times each hash was added (different files can have the same hash).
+        self._counts = {}
+
+    @property
+    def threshold(self) -> int:
+        return self._threshold
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def add(self, perceptual_hash: int):
+        count = self._counts.get(perceptual_hash, 0)
+        self._counts[perceptual_hash] = count + 1
+        if count == 0:
+            for table, (shift, mask) in zip(self._tables, self._chunks):
+                table.setdefault((perceptual_hash >> shift) & mask, set()).add(perceptual_hash)
+
+    def remove(self, perceptual_hash: int):
+        count = self._counts.get(perceptual_hash, 0)
+        if count > 1:
+            self._counts[perceptual_hash] = count - 1
+            return
+        if count == 0:
+            return
+        del self._counts[perceptual_hash]
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            key = (perceptual_hash >> shift) & mask
+            candidates = table[key]
+            candidates.discard(perceptual_hash)
+            if not candidates:
+                del table[key]
+
+    def find(self, perceptual_hash: int) -> tuple:
+        # Find the closest hash within the threshold.
+        # Return a tuple with the hash and its distance, or None if there is no such hash.
+        if perceptual_hash in self._counts:
+            return (perceptual_hash, 0)
+        closest = None
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            key = (perceptual_hash >> shift) & mask
+            for flip_mask in self._flip_masks:
+                for candidate in table.get(key ^ flip_mask, ()):
+                    distance = hamming_distance(perceptual_hash, candidate)
+                    if distance <= self._threshold and (closest is None or distance < closest[1]):
+                        closest = (candidate, distance)
+        return closest
+
+
+class PerceptualIndex:
+    # This class is used to store the perceptual hashes of the files in the target folder and find near-duplicates.
+    # It is safe to use from several threads.
+
+    def __init__(self, file_path: str, algorithm: str, threshold: int=DEFAULT_NEAR_DUPLICATE_THRESHOLD):
+        super().__init__()
+        self._algorithm = algorithm
+        self._lock = threading.Lock()
+        self._index = HammingIndex(threshold)
+        self._hashes_by_content = {}
+
+        self._journal = HashJournal(file_path, header=self._journal_header())
+        if self._journal.header != self._journal_header():
+            # Hashes of another algorithm can not be compared: start over.
+            self._journal.rewrite((), header=self._journal_header())
+        for record in self._journal.records:
+            self._add_to_memory(record)
+
+    @property
+    def algorithm(self) -> str:
+        return self._algorithm
+
+    @property
+    def threshold(self) -> int:
+        return self._index.threshold
+
+    def __len__(self) -> int:
+        # The number of files in the target folder covered by the index.
+        return len(self._hashes_by_content)
+
+    def claim(self, perceptual_hash: int) -> int:
+        # Look up the closest near-duplicate of an image that is about to be copied.
+        # Return the hash of the near-duplicate, or None if there is none. In that case the hash is
+        # added to the index right away, so a near-duplicate being copied at the same time is found.
+        # The hash must be given to add() if the image is copied, or to release() if it is not.
+        with self._lock:
+            closest = self._index.find(perceptual_hash)
+            if closest is not None:
+                return closest[0]
+            self._index.add(perceptual_hash)
+            return None
+
+    def release(self, perceptual_hash: int):
+        # Remove a claimed hash of an image that was not copied.
+        with self._lock:
+            self._index.remove(perceptual_hash)
+
+    def add(self, content_hash: str, perceptual_hash: int=None):
+        # Record the perceptual hash (claimed before) of a file copied to the target folder,
+        # or that the file has no perceptual hash.
+        with self._lock:
+            if content_hash in self._hashes_by_content:
+                return
+            self._hashes_by_content[content_hash] = perceptual_hash
+            self._journal.add(self._record(perceptual_hash, content_hash))
+
+    def is_synced(self, catalog_entries) -> bool:
+        # Check if the index holds a record for exactly the files in the catalog of the target folder
+        # (so sync() has nothing to do and no file needs to be decoded).
+        entries = {entry.file_hash: entry for entry in catalog_entries}
+        with self._lock:
+            stale_hashes, missing_entries = self._compare(entries)
+        return not stale_hashes and not missing_entries
+
+    def sync(self, target_folder: str, catalog_entries, extensions, workers: int=1, progress_callback=None) -> tuple:
+        # Bring the index up to date with the catalog of the target folder: images that have no record
+        # yet are decoded and hashed (in batches), and files that are no longer in the catalog are dropped.
+        # Return a tuple with the number of files added and the number of files dropped.
+        extensions = frozenset(extensions)
+        entries = {entry.file_hash: entry for entry in catalog_entries}
+        with self._lock:
+            stale_hashes, missing_entries = self._compare(entries)
+            if not stale_hashes and not missing_entries:
+                return (0, 0)
+
+            for content_hash in stale_hashes:
+                perceptual_hash = self._hashes_by_content.pop(content_hash)
+                if perceptual_hash is not None:
+                    self._index.remove(perceptual_hash)
+
+            image_entries = []
+            for entry in missing_entries:
+                if os.path.splitext(entry.path)[1].lower() in extensions:
+                    image_entries.append(entry)
+                else:
+                    self._hashes_by_content[entry.file_hash] = None
+
+            file_paths = [os.path.join(target_folder, entry.path) for entry in image_entries]
+            for index, (entry, perceptual_hash) in enumerate(zip(image_entries, perceptual_hash_files(file_paths, self._algorithm, workers))):
+                self._hashes_by_content[entry.file_hash] = perceptual_hash
+                if perceptual_hash is not None:
+                    self._index.add(perceptual_hash)
+                if progress_callback is not None:
+                    progress_callback(index, len(image_entries), file_paths[index])
+
+            self._journal.rewrite((self._record(perceptual_hash, content_hash)
+                                   for content_hash, perceptual_hash in self._hashes_by_content.items()),
+                                  header=self._journal_header())
+        return (len(missing_entries), len(stale_hashes))
+
+    def close(self):
+        self._journal.close()
+
+    def _journal_header(self) -> list:
+        return [f"{ALGORITHM_HEADER_PREFIX}{self._algorithm}"]
+
+    def _compare(self, entries: dict) -> tuple:
+        # Return the hashes that are no longer in the catalog and the catalog entries that have no record yet.
+        stale_hashes = [content_hash for content_hash in self._hashes_by_content if content_hash not in entries]
+        missing_entries = [entry for content_hash, entry in entries.items() if content_hash not in self._hashes_by_content]
+        return (stale_hashes, missing_entries)
+
+    def _record(self, perceptual_hash: int, content_hash: str) -> str:
+        perceptual_text = NO_PERCEPTUAL_HASH if perceptual_hash is None else f"{perceptual_hash:016x}"
+        return f"{perceptual_text}:{content_hash}"
+
+    def _add_to_memory(self, record: str):
+        perceptual_text, content_hash = record.split(':', 1)
+        perceptual_hash = None if perceptual_text == NO_PERCEPTUAL_HASH else int(perceptual_text, 16)
+        if content_hash in self._hashes_by_content:
+            return
+        self._hashes_by_content[content_hash] = perceptual_hash
+        if perceptual_hash is not None:
+            self._index.add(perceptual_hash)
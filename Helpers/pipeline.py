@@ -0,0 +1,112 @@
+import queue
+import threading
+
+# Helpers for running the stages of a collection run as a streaming pipeline.
+#
+# A stage is a generator. iterate_in_thread runs a stage in its own thread and hands its items
+# over to the next stage through a bounded queue. When the queue is full the producing stage
+# waits (backpressure), so the memory used stays the same no matter how many items flow
+# through the pipeline. merge_in_threads does the same for several stages at once (for instance
+# one scan stage per source device) and hands over their items as they come.
+
+_END_OF_STAGE = object()
+
+
+def iterate_in_thread(iterable, max_queued: int=1024, thread_name: str="pipeline-stage"):
+    # Iterate over the iterable in a separate thread.
+    # Yield the items in the same order. Exceptions raised by the iterable are raised again here.
+    items = queue.Queue(maxsize=max_queued)
+    stopped = threading.Event()
+    errors = []
+
+    def produce():
+        try:
+            for item in iterable:
+                while not stopped.is_set():
+                    try:
+                        items.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stopped.is_set():
+                    return
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            while not stopped.is_set():
+                try:
+                    items.put(_END_OF_STAGE, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+
+    producer = threading.Thread(target=produce, name=thread_name, daemon=True)
+    producer.start()
+
+    try:
+        while True:
+            item = items.get()
+            if item is _END_OF_STAGE:
+                break
+            yield item
+        if errors:
+            raise errors[0]
+    finally:
+        # Stop the producer if the consumer stops early.
+        stopped.set()
+        producer.join()
+
+
+def merge_in_threads(iterables, max_queued: int=1024, admit=None, thread_name: str="pipeline-stage"):
+    # Iterate over several iterables at the same time, each in its own thread.
+    # Yield the items in the order they become available. Exceptions raised by an iterable are
+    # raised again here (after the other iterables are stopped).
+    # admit(item, timeout) -> bool is called before an item is handed over and may wait (for
+    # instance until the device of the item has room for more work); it is called again until
+    # it returns True.
+    items = queue.Queue(maxsize=max_queued)
+    stopped = threading.Event()
+    errors = []
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce(iterable):
+        try:
+            for item in iterable:
+                if admit is not None:
+                    while not stopped.is_set() and not admit(item, 0.1):
+                        continue
+                if not put(item):
+                    return
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            put(_END_OF_STAGE)
+
+    producers = [threading.Thread(target=produce, args=(iterable,), name=f"{thread_name}-{index}", daemon=True)
+                 for index, iterable in enumerate(iterables)]
+    for producer in producers:
+        producer.start()
+
+    try:
+        running_count = len(producers)
+        while running_count:
+            item = items.get()
+            if item is _END_OF_STAGE:
+                running_count -= 1
+                continue
+            yield item
+        if errors:
+            raise errors[0]
+    finally:
+        # Stop the producers if the consumer stops early.
+        stopped.set()
+        for producer in producers:
+            producer.join()
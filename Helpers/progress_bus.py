@@ -0,0 +1,165 @@
+import os
+import sys
+import collections
+import threading
+
+# Progress event bus between the worker threads of a collection run and the user interface.
+#
+# Workers post small progress events (counters and the current file) to the bus. They never
+# touch the user interface themselves. The bus only keeps the latest state: every event is
+# merged into it under a lock, so the memory used stays the same no matter how many events are
+# posted, also when nothing reads the bus (headless runs, library callers). The user interface
+# drains the bus at a fixed rate (for example 10 times per second from a Tk root.after timer)
+# and shows the latest state, so the cost of the user interface does not grow with the number
+# of files. Log texts are kept in the order they were posted until they are drained (up to
+# MAX_PENDING_LOG_TEXTS, the oldest are dropped first).
+#
+# The same bus feeds the TtyProgressRenderer, which shows the progress on a terminal.
+
+PROGRESS_REFRESH_RATE_HZ = 10
+MAX_PENDING_LOG_TEXTS = 1000
+
+
+class ProgressState:
+    # This class is used to store the latest progress of a run, as shown by the user interface.
+
+    def __init__(self):
+        super().__init__()
+        self.status_text = ""
+        self.folder_text = ""
+        self.file_text = ""
+        self.progress_percent = 0.0
+        self.log_text = None
+        self.finished_text = None
+
+    def set_progress(self, progress_index: int, total: int, info_text_ending: str, file):
+        # Set the progress counters and the current file (progress_index is zero based).
+        progress_index += 1
+        self.progress_percent = progress_index / total * 100 if total else 0.0
+        self.status_text = f"{self.progress_percent:.2f}% ({progress_index}/{total}) {info_text_ending}"
+        self.folder_text = f"-> Folder: {os.path.dirname(file)}"
+        self.file_text = f"-> File: {os.path.basename(file)}"
+
+
+class ProgressBus:
+    # This class is used to pass progress events from worker threads to the user interface.
+    # post_* may be called from any thread, drain() from the user interface thread.
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._state = ProgressState()
+        # The latest progress, only formatted when it is drained.
+        self._progress = None
+        self._log_texts = collections.deque(maxlen=MAX_PENDING_LOG_TEXTS)
+        self._finished_text = None
+        self._changed = False
+
+    def post_reset(self, status_text: str=""):
+        # Start over with an empty progress state (for a new run).
+        with self._lock:
+            self._progress = None
+            self._state.status_text, self._state.folder_text, self._state.file_text = status_text, "", ""
+            self._state.progress_percent = 0.0
+            self._changed = True
+
+    def post_status(self, status_text: str="", folder_text: str="", file_text: str=""):
+        with self._lock:
+            self._progress = None
+            self._state.status_text, self._state.folder_text, self._state.file_text = status_text, folder_text, file_text
+            self._changed = True
+
+    def post_progress(self, progress_index: int, total: int, info_text_ending: str, file):
+        with self._lock:
+            self._progress = (progress_index, total, info_text_ending, file)
+            self._changed = True
+
+    def post_log_text(self, log_text: str):
+        with self._lock:
+            self._log_texts.append(log_text)
+            self._changed = True
+
+    def post_finished(self, finished_text: str):
+        with self._lock:
+            self._apply_progress()
+            self._state.progress_percent = 100.0
+            self._finished_text = finished_text
+            self._changed = True
+
+    def drain(self) -> ProgressState:
+        # Take the state posted since the last call.
+        # Return a copy of the latest progress state, or None if nothing was posted.
+        # The log_text (all log texts posted, one per line) and finished_text of the returned state
+        # are only set if they were posted.
+        with self._lock:
+            if not self._changed:
+                return None
+            self._apply_progress()
+            state = ProgressState()
+            state.status_text = self._state.status_text
+            state.folder_text = self._state.folder_text
+            state.file_text = self._state.file_text
+            state.progress_percent = self._state.progress_percent
+            state.log_text = "\n".join(self._log_texts) if self._log_texts else None
+            state.finished_text = self._finished_text
+            self._log_texts.clear()
+            self._finished_text = None
+            self._changed = False
+            return state
+
+    def _apply_progress(self):
+        # Only the latest progress is shown, so it is formatted when it is applied (called while holding the lock).
+        if self._progress is not None:
+            self._state.set_progress(*self._progress)
+            self._progress = None
+
+
+class TtyProgressRenderer:
+    # This class is used to show the progress posted to a progress bus on a terminal.
+
+    def __init__(self, progress_bus: ProgressBus, stream=None, refresh_rate_hz: float=PROGRESS_REFRESH_RATE_HZ):
+        super().__init__()
+        self._progress_bus = progress_bus
+        self._stream = stream if stream is not None else sys.stderr
+        self._interval_s = 1 / refresh_rate_hz
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="progress", daemon=True)
+        self._line_length = 0
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        self._render()
+        if self._line_length:
+            self._stream.write("\n")
+            self._stream.flush()
+
+    def _run(self):
+        while not self._stopped.wait(self._interval_s):
+            self._render()
+
+    def _render(self):
+        state = self._progress_bus.drain()
+        if state is None:
+            return
+
+        if state.log_text:
+            self._write_line("")
+            self._stream.write(f"{state.log_text}\n")
+
+        line = f"{state.status_text} {state.file_text}".strip()
+        if state.finished_text:
+            line = state.finished_text
+        self._write_line(line)
+        self._stream.flush()
+
+    def _write_line(self, line: str):
+        # Overwrite the current terminal line.
+        padding = " " * max(0, self._line_length - len(line))
+        self._stream.write(f"\r{line}{padding}")
+        if not line:
+            self._stream.write("\r")
+        self._line_length = len(line)
@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import threading
+
+# Write-ahead journal of a collection run (hashes/run.jljob in the target folder).
+#
+# Every file that enters the copy engine is recorded before it is hashed or copied, so an
+# interrupted run (closed app, crash, power loss) can be resumed:
+#   {"i": 12, "p": "/photos/a.jpg", "z": 123456, "m": 1700000000000000000}   planned (source metadata)
+#   {"i": 12, "s": "copy"}                                                   copying
+#   {"i": 12, "r": "Copied", "h": "ab12..."}                                 completed (with the hash)
+# The first line is the job description ({"job": {...}}: source folders, extensions, ...).
+# The journal is removed when the run finishes. When the next run has the same job
+# description, the files that were completed (copied or skipped as a duplicate) and have not changed
+# since (same size and modification time) get their earlier result without being hashed
+# again. Files that failed or were in flight are processed again.
+#
+# Lines are written with batched fsync like the hash journal, and a torn last line is cut off.
+# The run journal and the hash journal are synced independently, so after a crash the run journal
+# can hold a copy whose hash never reached the hash journal. With the target hashes given, a copied
+# or duplicate file is therefore only resumed if its hash is (still) in the target folder.
+
+RUN_JOURNAL_FILE_NAME = "run.jljob"
+RESUMABLE_RESULTS = ('Copied', 'Duplicate', 'Near duplicate')
+
+
+class RunJournal:
+    # This class is used to record the progress of a collection run and resume an interrupted run.
+    # It is safe to use from several threads.
+
+    def __init__(self, file_path: str, job: dict, resume: bool=True, fsync_every: int=256, fsync_interval_s: float=2.0,
+                 target_hashes=None):
+        super().__init__()
+        self._file_path = file_path
+        self._job = job
+        self._target_hashes = target_hashes
+        self._fsync_every = fsync_every
+        self._fsync_interval_s = fsync_interval_s
+        self._lock = threading.Lock()
+
+        self._completed = {}
+        self._in_flight = {}
+        self._next_index = 0
+        valid_length = 0
+        if resume:
+            valid_length = self._load()
+
+        self._file = open(file_path, 'ab')
+        if valid_length == 0:
+            # A new job (or a journal of another job): start a new journal.
+            self._completed = {}
+            self._next_index = 0
+            self._file.truncate(0)
+            self._write_line({"job": job})
+        elif self._file.tell() != valid_length:
+            # Cut off a torn last line, so the next line starts on a fresh line.
+            self._file.truncate(valid_length)
+            self._file.seek(valid_length)
+
+        self._unsynced_count = 0
+        self._last_sync_time = time.monotonic()
+
+    @property
+    def file_path(self) -> str:
+        return self._file_path
+
+    @property
+    def resumed_count(self) -> int:
+        # The number of files completed by the interrupted run that is resumed.
+        return len(self._completed)
+
+    def completed_result(self, record) -> str:
+        # Return the result of a file completed by the interrupted run, or None if the file
+        # was not completed or has changed since.
+        completed = self._completed.get(record.path)
+        if completed is None:
+            return None
+        size, mtime_ns, result, file_hash = completed
+        if size != record.size or mtime_ns != record.mtime_ns:
+            return None
+        if self._target_hashes is not None and result in ('Copied', 'Duplicate') and (file_hash is None or file_hash not in self._target_hashes):
+            return None
+        return result
+
+    def plan(self, record):
+        # Record a file that enters the run, with its source metadata.
+        with self._lock:
+            index = self._next_index
+            self._next_index += 1
+            self._in_flight[record.path] = index
+            self._append({"i": index, "p": record.path, "z": record.size, "m": record.mtime_ns})
+
+    def start(self, record):
+        # Record that a file is being copied.
+        with self._lock:
+            index = self._in_flight.get(record.path)
+            if index is not None:
+                self._append({"i": index, "s": "copy"})
+
+    def complete(self, record, result: str, file_hash: str=None):
+        # Record the result of a file (with its hash, if known).
+        with self._lock:
+            index = self._in_flight.pop(record.path, None)
+            if index is not None:
+                entry = {"i": index, "r": result}
+                if file_hash is not None:
+                    entry["h"] = file_hash
+                self._append(entry)
+
+    def sync(self):
+        # Flush the written lines to the disk.
+        with self._lock:
+            self._sync()
+
+    def close(self, remove: bool=False):
+        # Close the journal. With remove, the run is finished and the journal is removed.
+        with self._lock:
+            if self._file.closed:
+                return
+            if remove:
+                self._file.close()
+                try:
+                    os.remove(self._file_path)
+                except FileNotFoundError:
+                    pass
+            else:
+                self._sync()
+                self._file.close()
+
+    def _load(self) -> int:
+        # Load the completed files of an interrupted run of the same job.
+        # Return the length in bytes of the valid part of the journal, or 0 to start a new journal.
+        planned = {}
+        valid_length = 0
+        try:
+            with open(self._file_path, 'rb') as f:
+                for line_number, raw_line in enumerate(f):
+                    if not raw_line.endswith(b'\n'):
+                        # Torn last line from an interrupted write.
+                        break
+                    valid_length += len(raw_line)
+                    try:
+                        entry = json.loads(raw_line)
+                    except ValueError:
+                        entry = {}
+                    if line_number == 0:
+                        if entry.get("job") != self._job:
+                            return 0
+                        continue
+
+                    index = entry.get("i")
+                    if "p" in entry:
+                        planned[index] = (entry["p"], entry["z"], entry["m"])
+                        self._next_index = max(self._next_index, index + 1)
+                    elif entry.get("r") in RESUMABLE_RESULTS and index in planned:
+                        path, size, mtime_ns = planned[index]
+                        self._completed[path] = (size, mtime_ns, entry["r"], entry.get("h"))
+        except FileNotFoundError:
+            return 0
+        except OSError as e:
+            print(f"Warning: Could not read the run journal '{self._file_path}'. Error: {e}")
+            return 0
+        return valid_length
+
+    def _append(self, entry: dict):
+        self._write_line(entry)
+        self._unsynced_count += 1
+
+        # Batched fsync: sync after a number of lines or after some time has passed.
+        if self._unsynced_count >= self._fsync_every or time.monotonic() - self._last_sync_time >= self._fsync_interval_s:
+            self._sync()
+
+    def _write_line(self, entry: dict):
+        self._file.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n')
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced_count = 0
+        self._last_sync_time = time.monotonic()
@@ -0,0 +1,166 @@
+import io
+import os
+import csv
+import gzip
+import json
+
+try:
+    # Python 3.14 and later.
+    from compression import zstd
+except ImportError:
+    zstd = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Streaming log of a collection run (log_files folder of the target folder).
+#
+# Each file handled by the run gets one record, written through a large buffer as soon as its
+# result is known, so the log never has to be read back or written twice:
+#   path     the source file
+#   status   copied, duplicate, near_duplicate, too_small or error
+#   detail   the error message (error), or empty
+#   size     the size of the file in bytes
+#   digest   the content hash of the file (when it was calculated)
+#   seconds  the time spent hashing and copying the file
+# The formats are JSON lines (jsonl, one object per line), CSV with a header row (csv), or the
+# text lines of earlier versions ("<path> --> OK"). The summary of the run is written to a
+# sidecar file (<log name>.summary.json) when the run is done.
+#
+# The log can be compressed while it is written (gzip, or zstd with Python 3.14 or the
+# zstandard package) and rotated: a new part is started when a part holds more than about a
+# number of bytes (counted as characters, before compression). Each part is a complete file in
+# the chosen format.
+
+LOG_FORMATS = ('jsonl', 'csv', 'text')
+DEFAULT_LOG_FORMAT = 'jsonl'
+LOG_COMPRESSIONS = ('gzip', 'zstd')
+LOG_FIELDS = ('path', 'status', 'detail', 'size', 'digest', 'seconds')
+LOG_BUFFER_SIZE = 1024 * 1024
+SUMMARY_FILE_SUFFIX = ".summary.json"
+
+_FILE_EXTENSIONS = {'jsonl': ".jsonl", 'csv': ".csv", 'text': ".txt"}
+_COMPRESSION_EXTENSIONS = {'gzip': ".gz", 'zstd': ".zst"}
+
+# The text of each status in the text format.
+_TEXT_STATUSES = {
+    'copied': "OK",
+    'duplicate': "Skipped (duplicate)",
+    'near_duplicate': "Skipped (near-duplicate)",
+}
+
+
+def available_log_compressions() -> tuple:
+    # Return the compressions that can be used with the installed packages.
+    if zstd is None and zstandard is None:
+        return ('gzip',)
+    return LOG_COMPRESSIONS
+
+
+def _open_text_file(file_path: str, compression: str):
+    if compression == 'gzip':
+        return io.TextIOWrapper(io.BufferedWriter(gzip.open(file_path, 'wb', compresslevel=6), LOG_BUFFER_SIZE),
+                                encoding='utf-8', newline='')
+    if compression == 'zstd':
+        if zstd is not None:
+            return io.TextIOWrapper(io.BufferedWriter(zstd.open(file_path, 'wb'), LOG_BUFFER_SIZE), encoding='utf-8', newline='')
+        return io.TextIOWrapper(io.BufferedWriter(zstandard.ZstdCompressor().stream_writer(open(file_path, 'wb')), LOG_BUFFER_SIZE),
+                                encoding='utf-8', newline='')
+    return open(file_path, 'w', encoding='utf-8', newline='', buffering=LOG_BUFFER_SIZE)
+
+
+def write_summary_file(file_path: str, summary: dict):
+    # Write the summary of a run to the sidecar file of its log (replaced atomically).
+    temp_file_path = f"{file_path}.tmp"
+    with open(temp_file_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    os.replace(temp_file_path, file_path)
+
+
+class RunLogWriter:
+    # This class is used to write the log of a run. It is used from one thread.
+
+    def __init__(self, folder: str, base_name: str, log_format: str=DEFAULT_LOG_FORMAT, compression: str=None, rotate_bytes: int=None):
+        super().__init__()
+        if log_format not in LOG_FORMATS:
+            raise ValueError(f"Unknown log format '{log_format}'. Available: {', '.join(LOG_FORMATS)}")
+        if compression and compression not in available_log_compressions():
+            print(f"Warning: The log compression '{compression}' is not available (it needs the zstandard package). Using gzip.")
+            compression = 'gzip'
+        self._folder = folder
+        self._base_name = base_name
+        self._log_format = log_format
+        self._compression = compression or None
+        self._rotate_bytes = rotate_bytes or None
+        self._file_paths = []
+        self._file = None
+        self._csv_writer = None
+        self._part_bytes = 0
+        self._open_part()
+
+    @property
+    def file_paths(self) -> list:
+        # The paths of the parts of the log written so far.
+        return list(self._file_paths)
+
+    @property
+    def log_format(self) -> str:
+        return self._log_format
+
+    @property
+    def compression(self) -> str:
+        return self._compression
+
+    @property
+    def summary_file_path(self) -> str:
+        return os.path.join(self._folder, f"{self._base_name}{SUMMARY_FILE_SUFFIX}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, path: str, status: str, detail: str="", size: int=None, digest: str=None, seconds: float=None):
+        # Write the record of a file to the log.
+        if self._log_format == 'jsonl':
+            line = json.dumps({'path': path, 'status': status, 'detail': detail, 'size': size, 'digest': digest,
+                               'seconds': round(seconds, 6) if seconds is not None else None}, ensure_ascii=False) + "\n"
+            self._file.write(line)
+            self._part_bytes += len(line)
+        elif self._log_format == 'csv':
+            self._part_bytes += self._csv_writer.writerow((path, status, detail, size, digest,
+                                                           f"{seconds:.6f}" if seconds is not None else ""))
+        else:
+            line = f"{os.path.normpath(path)} --> {self._status_text(status, detail, size)}\n"
+            self._file.write(line)
+            self._part_bytes += len(line)
+
+        if self._rotate_bytes and self._part_bytes >= self._rotate_bytes:
+            self._file.close()
+            self._open_part()
+
+    def close(self):
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+
+    def _open_part(self):
+        extension = _FILE_EXTENSIONS[self._log_format] + _COMPRESSION_EXTENSIONS.get(self._compression, "")
+        # With rotation, every part has a number (the parts sort in the order they were written).
+        part_name = f".{len(self._file_paths) + 1:04d}" if self._rotate_bytes else ""
+        file_path = os.path.join(self._folder, f"{self._base_name}{part_name}{extension}")
+        self._file = _open_text_file(file_path, self._compression)
+        self._file_paths.append(file_path)
+        self._part_bytes = 0
+        if self._log_format == 'csv':
+            self._csv_writer = csv.writer(self._file, lineterminator="\n")
+            self._part_bytes += self._csv_writer.writerow(LOG_FIELDS)
+
+    def _status_text(self, status: str, detail: str, size: int) -> str:
+        if status == 'too_small':
+            return f"Too small ({size / 1024} kb)"
+        if status == 'error':
+            return f"!{detail}"
+        return _TEXT_STATUSES.get(status, status)
@@ -0,0 +1,248 @@
+import os
+import sys
+import json
+import time
+import bisect
+import pstats
+import cProfile
+import threading
+import contextlib
+import tracemalloc
+
+# Metrics of a collection run: where the time of a run goes.
+#
+# Each phase of the run (scan, hash, copy, index writes, log writes, ...) is timed per call.
+# A phase keeps the number of calls, the busy time in seconds (the sum over all worker threads,
+# so it can be more than the wall time of the run), the bytes handled, and a histogram of the
+# latencies of the calls. Counters keep the numbers of events (files skipped by the size index,
+# ...). Timing a call costs two perf_counter calls and a short lock, so the metrics are always on.
+#
+# The metrics can be written as JSON lines (one line per phase, appended to a file, so the runs
+# of a scheduled job add up to a history) and as a Prometheus textfile (for the textfile
+# collector of node_exporter, replaced atomically after every run).
+#
+# RunProfiler is an opt-in hook to profile a run: cProfile for every thread of the run (saved
+# as a pstats file, see python -m pstats) and/or tracemalloc (peak memory and the lines that
+# allocated the most memory, added to the metrics).
+
+# Upper bounds of the latency histogram buckets in seconds (the last bucket is +Inf).
+LATENCY_BUCKETS_S = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                     10.0, 30.0, 60.0)
+PROMETHEUS_PREFIX = "jl_image_collector"
+TRACEMALLOC_TOP_COUNT = 10
+
+
+class PhaseMetrics:
+    # This class is used to store the calls, time, bytes and latency histogram of a phase.
+
+    __slots__ = ('count', 'seconds', 'byte_count', 'bucket_counts')
+
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+        self.seconds = 0.0
+        self.byte_count = 0
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS_S) + 1)
+
+    def observe(self, seconds: float, byte_count: int):
+        self.count += 1
+        self.seconds += seconds
+        self.byte_count += byte_count
+        self.bucket_counts[bisect.bisect_left(LATENCY_BUCKETS_S, seconds)] += 1
+
+    def quantile(self, fraction: float) -> float:
+        # Return the upper bound of the bucket that holds the given fraction of the calls (None above the last bucket).
+        rank = fraction * self.count
+        total = 0
+        for bucket_index, bucket_count in enumerate(self.bucket_counts):
+            total += bucket_count
+            if total >= rank and bucket_count:
+                return LATENCY_BUCKETS_S[bucket_index] if bucket_index < len(LATENCY_BUCKETS_S) else None
+        return None
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'seconds': round(self.seconds, 6),
+            'bytes': self.byte_count,
+            'mb_per_s': round(self.byte_count / self.seconds / (1024 * 1024), 3) if self.seconds and self.byte_count else None,
+            'p50_s': self.quantile(0.5),
+            'p95_s': self.quantile(0.95),
+            'p99_s': self.quantile(0.99),
+            'buckets': {('+Inf' if bucket_index == len(LATENCY_BUCKETS_S) else str(LATENCY_BUCKETS_S[bucket_index])): bucket_count
+                        for bucket_index, bucket_count in enumerate(self.bucket_counts) if bucket_count},
+        }
+
+
+class RunMetrics:
+    # This class is used to collect the metrics of a run.
+    # It is safe to use from several threads.
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._phases = {}
+        self._counters = {}
+        self._values = {}
+        self._start_time = time.time()
+        self._start_counter = time.perf_counter()
+
+    def observe(self, phase: str, seconds: float, byte_count: int=0):
+        # Record a call of a phase that took the given time.
+        with self._lock:
+            phase_metrics = self._phases.get(phase)
+            if phase_metrics is None:
+                phase_metrics = self._phases[phase] = PhaseMetrics()
+            phase_metrics.observe(seconds, byte_count)
+
+    @contextlib.contextmanager
+    def timer(self, phase: str, byte_count: int=0):
+        # Time the code in the with block as a call of a phase.
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(phase, time.perf_counter() - start, byte_count)
+
+    def count(self, counter: str, increment: int=1):
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + increment
+
+    def set_value(self, name: str, value):
+        # Record a value of the run (like the peak memory).
+        with self._lock:
+            self._values[name] = value
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                'start_time': self._start_time,
+                'wall_seconds': round(time.perf_counter() - self._start_counter, 6),
+                'phases': {phase: phase_metrics.to_dict() for phase, phase_metrics in sorted(self._phases.items())},
+                'counters': dict(sorted(self._counters.items())),
+                'values': dict(self._values),
+            }
+
+    def write_json_lines(self, file_path: str, run_info: dict=None):
+        # Append the metrics to a JSON lines file: a line for the run, and a line per phase.
+        metrics = self.to_dict()
+        run_id = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(metrics['start_time']))
+        lines = [{'type': 'run', 'run': run_id, 'wall_seconds': metrics['wall_seconds'], 'counters': metrics['counters'],
+                  'values': metrics['values'], **(run_info or {})}]
+        lines.extend({'type': 'phase', 'run': run_id, 'phase': phase, **phase_metrics} for phase, phase_metrics in metrics['phases'].items())
+        with open(file_path, 'a', encoding='utf-8') as f:
+            for line in lines:
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+    def write_prometheus_textfile(self, file_path: str, labels: dict=None):
+        # Write the metrics in the Prometheus text format. The file is written to a temporary file first
+        # and then replaces the old file, so the collector never reads a half written file.
+        with self._lock:
+            phases = sorted(self._phases.items())
+            counters = sorted(self._counters.items())
+            values = sorted((name, value) for name, value in self._values.items() if isinstance(value, (int, float)))
+        run_labels = dict(labels or {})
+
+        def series(name: str, **series_labels) -> str:
+            all_labels = {**run_labels, **series_labels}
+            if not all_labels:
+                return f"{PROMETHEUS_PREFIX}_{name}"
+            label_text = ",".join(f'{label}="{_escape_label(value)}"' for label, value in all_labels.items())
+            return f"{PROMETHEUS_PREFIX}_{name}{{{label_text}}}"
+
+        def describe(name: str, metric_type: str, help_text: str) -> list:
+            return [f"# HELP {PROMETHEUS_PREFIX}_{name} {help_text}", f"# TYPE {PROMETHEUS_PREFIX}_{name} {metric_type}"]
+
+        lines = describe('last_run_timestamp_seconds', 'gauge', "Start time of the last run.")
+        lines.append(f"{series('last_run_timestamp_seconds')} {self._start_time}")
+        lines.extend(describe('last_run_duration_seconds', 'gauge', "Wall time of the last run."))
+        lines.append(f"{series('last_run_duration_seconds')} {time.perf_counter() - self._start_counter}")
+        lines.extend(describe('phase_duration_seconds', 'histogram', "Latency of the calls of a phase in the last run."))
+        for phase, phase_metrics in phases:
+            total = 0
+            for bucket_index, bucket_count in enumerate(phase_metrics.bucket_counts):
+                total += bucket_count
+                upper_bound = "+Inf" if bucket_index == len(LATENCY_BUCKETS_S) else str(LATENCY_BUCKETS_S[bucket_index])
+                lines.append(f"{series('phase_duration_seconds_bucket', phase=phase, le=upper_bound)} {total}")
+            lines.append(f"{series('phase_duration_seconds_sum', phase=phase)} {phase_metrics.seconds}")
+            lines.append(f"{series('phase_duration_seconds_count', phase=phase)} {phase_metrics.count}")
+        lines.extend(describe('phase_bytes', 'gauge', "Bytes handled by a phase in the last run."))
+        lines.extend(f"{series('phase_bytes', phase=phase)} {phase_metrics.byte_count}" for phase, phase_metrics in phases)
+        lines.extend(describe('events', 'gauge', "Number of events in the last run."))
+        lines.extend(f"{series('events', event=counter)} {count}" for counter, count in counters)
+        for name, value in values:
+            lines.extend(describe(name, 'gauge', f"{name.replace('_', ' ').capitalize()} of the last run."))
+            lines.append(f"{series(name)} {value}")
+
+        temp_file_path = f"{file_path}.tmp"
+        with open(temp_file_path, 'w', encoding='utf-8', newline='\n') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(temp_file_path, file_path)
+
+
+def _escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RunProfiler:
+    # This class is used to profile a run (opt-in): with cpu_profile_path, every thread started during
+    # the run is profiled with cProfile and the combined statistics are saved to the file; with
+    # trace_memory, the peak memory and the top allocating lines are added to the metrics.
+
+    def __init__(self, metrics: RunMetrics, cpu_profile_path: str=None, trace_memory: bool=False):
+        super().__init__()
+        self._metrics = metrics
+        self._cpu_profile_path = cpu_profile_path
+        self._trace_memory = trace_memory
+        self._lock = threading.Lock()
+        self._profilers = []
+        self._profiler = None
+
+    def __enter__(self):
+        if self._trace_memory:
+            tracemalloc.start()
+        if self._cpu_profile_path:
+            # New threads call the hook once when they start, which starts a profiler for the thread.
+            threading.setprofile(self._profile_thread)
+            self._profiler = self._start_profiler()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._cpu_profile_path:
+            threading.setprofile(None)
+            # Worker threads have finished at this point; the profiler of this thread is still running.
+            if self._profiler is not None:
+                self._profiler.disable()
+                self._profiler = None
+            with self._lock:
+                profilers = self._profilers
+                self._profilers = []
+            stats = pstats.Stats(*profilers)
+            stats.dump_stats(self._cpu_profile_path)
+            self._metrics.set_value('cpu_profile', self._cpu_profile_path)
+        if self._trace_memory:
+            _, peak_bytes = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            self._metrics.set_value('peak_traced_memory_bytes', peak_bytes)
+            self._metrics.set_value('top_allocations', [
+                {'line': f"{statistic.traceback[0].filename}:{statistic.traceback[0].lineno}", 'bytes': statistic.size,
+                 'blocks': statistic.count}
+                for statistic in snapshot.statistics('lineno')[:TRACEMALLOC_TOP_COUNT]])
+
+    def _profile_thread(self, frame, event, arg):
+        sys.setprofile(None)
+        self._start_profiler()
+
+    def _start_profiler(self) -> cProfile.Profile:
+        # Start a profiler for the current thread.
+        # Return the profiler, or None if another profiler is active.
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12 and later allow one active profiler, which already sees every thread.
+            return None
+        with self._lock:
+            self._profilers.append(profiler)
+        return profiler
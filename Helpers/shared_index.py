@@ -0,0 +1,100 @@
+import os
+from Helpers.hash_backends import get_hash_backend
+from Helpers.digest_store import DigestStore
+from Helpers.target_index import ALGORITHM_HEADER_PREFIX, TargetIndex, read_hash_algorithm
+
+# Shared digest index of a batch run (see ImageCollector/batch.py): the hashes of the files in all
+# target folders of the batch, in one digest store (digests.bin and hashes.jllog in the index folder).
+#
+# The targets of a batch form one dedup domain: a file that is in any of the target folders is a
+# duplicate for all of them. The hashes of the target folders are added to the shared index before
+# the jobs start (their digest files are merged in one pass, and the hashes in their journals are
+# added one by one), and the files copied by the jobs are added to their target index and the shared
+# index at the same time. All target folders must use the hash algorithm of the shared index, which
+# is recorded in its header ("#algo=<name>") like in a target index.
+#
+# Hashes of files removed from a target folder stay in the shared index until it is rebuilt (the
+# hashes of all target folders of the batch are then added again).
+
+SHARED_INDEX_JOURNAL_FILE_NAME = "hashes.jllog"
+SHARED_INDEX_DIGEST_FILE_NAME = "digests.bin"
+
+
+class SharedDigestIndex:
+    # This class is used to keep the hashes of the files in all target folders of a batch run.
+    # It is safe to use from several threads.
+
+    def __init__(self, index_folder: str, hash_algorithm: str=None, rebuild: bool=False):
+        # hash_algorithm: the hash algorithm for a new (or rebuilt) index (default: the fastest available).
+        super().__init__()
+        self._index_folder = index_folder
+        os.makedirs(index_folder, exist_ok=True)
+        self._hashes = DigestStore(os.path.join(index_folder, SHARED_INDEX_JOURNAL_FILE_NAME),
+                                   os.path.join(index_folder, SHARED_INDEX_DIGEST_FILE_NAME))
+
+        current_hash_algorithm = read_hash_algorithm(self._hashes.header)
+        if current_hash_algorithm is None or rebuild:
+            self._hash_algorithm = get_hash_backend(hash_algorithm or current_hash_algorithm).name
+            self._hashes.rewrite((), header=[f"{ALGORITHM_HEADER_PREFIX}{self._hash_algorithm}"])
+        else:
+            if hash_algorithm and hash_algorithm != current_hash_algorithm:
+                print(f"Warning: The shared index uses the hash algorithm '{current_hash_algorithm}', not '{hash_algorithm}'. "
+                      f"Rebuild the shared index to switch.")
+            self._hash_algorithm = current_hash_algorithm
+
+    @property
+    def index_folder(self) -> str:
+        return self._index_folder
+
+    @property
+    def hash_algorithm(self) -> str:
+        return self._hash_algorithm
+
+    def __contains__(self, file_hash: str) -> bool:
+        return file_hash in self._hashes
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def add(self, file_hash: str) -> bool:
+        return self._hashes.add(file_hash)
+
+    def check_target(self, target_index: TargetIndex):
+        # Raise a ValueError if a target folder does not use the hash algorithm of the shared index.
+        if target_index.hash_backend.name != self._hash_algorithm:
+            raise ValueError(f"The target folder '{target_index.target_folder}' uses the hash algorithm "
+                             f"'{target_index.hash_backend.name}', not the '{self._hash_algorithm}' of the shared index. "
+                             f"Update its hash list from scratch to switch.")
+
+    def add_targets(self, target_indexes: list) -> int:
+        # Add the hashes of the files in the target folders (checked with check_target).
+        # Return the number of hashes that were not in the shared index yet.
+        for target_index in target_indexes:
+            self.check_target(target_index)
+        return self._hashes.merge_stores([target_index.hashes for target_index in target_indexes])
+
+    def add_target(self, target_index: TargetIndex) -> int:
+        # Add the hashes of the files in a target folder.
+        # Return the number of hashes that were not in the shared index yet.
+        return self.add_targets([target_index])
+
+    def close(self):
+        self._hashes.close()
+
+
+class SharedTargetHashes:
+    # This class is used as the target hashes of a job in a batch run (see ParallelCopyEngine): a hash
+    # is known if it is in any target folder of the batch, and the hashes of copied files are added to
+    # the target index of the job and the shared index.
+
+    def __init__(self, target_index: TargetIndex, shared_index: SharedDigestIndex):
+        super().__init__()
+        self._target_index = target_index
+        self._shared_index = shared_index
+
+    def __contains__(self, file_hash: str) -> bool:
+        return file_hash in self._shared_index or file_hash in self._target_index
+
+    def add(self, file_hash: str) -> bool:
+        self._shared_index.add(file_hash)
+        return self._target_index.add(file_hash)
@@ -0,0 +1,255 @@
+import os
+import threading
+
+# Sharing the work on the source folders between the jobs of a batch run (see ImageCollector/batch.py).
+#
+# A SharedScan runs the scan of a source folder once, in its own thread, for all the jobs that
+# collect from it while they run at the same time. Every job iterates over the same records
+# (filtered by its own extensions); a job that is ahead of the scan waits for the next records,
+# and records are dropped as soon as every job has taken them. So a share that feeds three target
+# folders is listed once.
+#
+# The scan keeps at most max_buffered_records records for the slowest job, and waits when it is that
+# far ahead. A job that has not started by then (it waits for a free job slot, or another of its
+# source folders comes first) is detached from the shared scan: the records are no longer kept for
+# it, and it scans the source folder on its own when it gets there.
+#
+# The SourceHashCache keeps the content hash of the source files that more than one job gets from a
+# shared scan (by path, size and modification time), so such a file is read and hashed once. A job
+# that needs a hash that another job is calculating right now waits for it. The hash is dropped
+# when every one of these jobs is done with the file.
+
+# Records taken by all consumers are dropped in steps of this many records.
+TRIM_STEP = 1024
+# The number of records the scan keeps for the slowest consumer before it waits.
+MAX_BUFFERED_RECORDS = 16 * TRIM_STEP
+
+
+class SharedScan:
+    # This class is used to hand the records of one scan to a fixed set of consumers.
+    # It is safe to use from several threads.
+
+    def __init__(self, scan_factory, consumer_extensions: list, hash_cache=None, thread_name: str="shared-scan",
+                 max_buffered_records: int=None):
+        # scan_factory() -> an iterable of ScanRecord objects (called in the scan thread).
+        # consumer_extensions: the extensions of the files each consumer takes (None: all files).
+        # hash_cache: the SourceHashCache that keeps the hashes of the files taken by more than one consumer.
+        # max_buffered_records: default MAX_BUFFERED_RECORDS.
+        super().__init__()
+        self._scan_factory = scan_factory
+        self._consumer_extensions = [frozenset(extension.lower() for extension in extensions) if extensions else None
+                                     for extensions in consumer_extensions]
+        self._hash_cache = hash_cache
+        self._thread_name = thread_name
+        self._max_buffered_records = max(max_buffered_records or MAX_BUFFERED_RECORDS, TRIM_STEP)
+        self._condition = threading.Condition()
+        self._records = []
+        self._first_index = 0
+        # The position of every consumer (None: finished or detached), consumers that did not start yet are at 0.
+        self._positions = [0] * len(consumer_extensions)
+        self._started_consumers = set()
+        self._started = False
+        self._done = False
+        self._error = None
+
+    @property
+    def consumer_count(self) -> int:
+        return len(self._positions)
+
+    @property
+    def buffered_count(self) -> int:
+        # The number of records kept for the consumers.
+        with self._condition:
+            return len(self._records)
+
+    def records(self, consumer: int):
+        # Yield the records of the scan for a consumer (only the files with its extensions).
+        # The scan starts when the first consumer asks for the records. A consumer that was detached
+        # scans on its own.
+        with self._condition:
+            shared = consumer not in self._started_consumers and self._positions[consumer] is not None
+            self._started_consumers.add(consumer)
+            if shared and not self._started:
+                self._started = True
+                threading.Thread(target=self._scan, name=self._thread_name, daemon=True).start()
+
+        if not shared:
+            yield from (record for record in self._scan_factory() if self._accepts(consumer, record))
+            return
+
+        position = 0
+        records = []
+        next_index = 0
+        try:
+            while True:
+                with self._condition:
+                    while position >= self._first_index + len(self._records) and not self._done:
+                        self._condition.wait()
+                    records = self._records[position - self._first_index:]
+                    if not records:
+                        if self._error is not None:
+                            raise self._error
+                        return
+                    position += len(records)
+                    self._positions[consumer] = position
+                    self._trim()
+
+                for index, record in enumerate(records):
+                    if self._accepts(consumer, record):
+                        next_index = index + 1
+                        yield record
+                next_index = len(records)
+        finally:
+            with self._condition:
+                # The records this consumer stopped before are not handed to it.
+                undelivered = records[next_index:] + self._records[position - self._first_index:]
+                self._drop_consumer(consumer, undelivered)
+
+    def detach(self, consumer: int):
+        # Stop keeping the records for a consumer that has not started (it scans on its own if it starts later).
+        with self._condition:
+            if consumer not in self._started_consumers and self._positions[consumer] is not None:
+                self._drop_consumer(consumer, self._records[self._positions[consumer] - self._first_index:])
+
+    def _scan(self):
+        try:
+            for record in self._scan_factory():
+                with self._condition:
+                    while len(self._records) >= self._max_buffered_records and any(position is not None for position in self._positions):
+                        waiting_consumers = [consumer for consumer, position in enumerate(self._positions)
+                                             if position is not None and consumer not in self._started_consumers]
+                        if not waiting_consumers:
+                            self._condition.wait()
+                        # Consumers that did not start yet must not hold up the others.
+                        for consumer in waiting_consumers:
+                            self._drop_consumer(consumer, self._records[self._positions[consumer] - self._first_index:])
+
+                    if not any(position is not None for position in self._positions):
+                        # Every consumer stopped early.
+                        break
+                    consumers = [consumer for consumer, position in enumerate(self._positions)
+                                 if position is not None and self._accepts(consumer, record)]
+                    if self._hash_cache is not None and len(consumers) > 1:
+                        # Before the record is handed out, so no consumer is done with it before the cache knows it.
+                        self._hash_cache.expect(record, len(consumers))
+                    self._records.append(record)
+                    self._condition.notify_all()
+        except Exception as e:
+            self._error = e
+        finally:
+            with self._condition:
+                self._done = True
+                self._condition.notify_all()
+
+    def _accepts(self, consumer: int, record) -> bool:
+        extensions = self._consumer_extensions[consumer]
+        return extensions is None or os.path.splitext(record.path)[1].lower() in extensions
+
+    def _drop_consumer(self, consumer: int, undelivered_records):
+        # Take a consumer out of the scan (called while holding the lock): the records it did not
+        # get are no longer needed for it.
+        self._positions[consumer] = None
+        if self._hash_cache is not None:
+            for record in undelivered_records:
+                if self._accepts(consumer, record):
+                    self._hash_cache.release(record)
+        self._trim()
+        self._condition.notify_all()
+
+    def _trim(self):
+        # Drop the records that every consumer has taken (called while holding the lock).
+        positions = [position for position in self._positions if position is not None]
+        first_needed = min(positions) if positions else self._first_index + len(self._records)
+        drop_count = first_needed - self._first_index
+        if drop_count >= TRIM_STEP or (drop_count > 0 and not positions):
+            del self._records[:drop_count]
+            self._first_index = first_needed
+            # The scan may be waiting for room.
+            self._condition.notify_all()
+
+
+class _CachedHash:
+    # The hash of a source file in the SourceHashCache.
+
+    __slots__ = ('user_count', 'calculated', 'file_hash')
+
+    def __init__(self, user_count: int):
+        super().__init__()
+        # The number of consumers that are not done with the file yet.
+        self.user_count = user_count
+        # Set when the hash was calculated (None: nobody calculates it yet).
+        self.calculated = None
+        self.file_hash = None
+
+
+class SourceHashCache:
+    # This class is used to calculate the hash of each source file once for all jobs of a batch run.
+    # It is safe to use from several threads.
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._hit_count = 0
+
+    @property
+    def hit_count(self) -> int:
+        # The number of hashes that were taken from the cache instead of calculated.
+        return self._hit_count
+
+    def __len__(self) -> int:
+        # The number of files whose hash is kept.
+        with self._lock:
+            return len(self._entries)
+
+    def expect(self, record, user_count: int):
+        # Keep the hash of the file of the record until user_count more consumers are done with it (see release()).
+        key = (record.path, record.size, record.mtime_ns)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._entries[key] = _CachedHash(user_count)
+            else:
+                entry.user_count += user_count
+
+    def release(self, record):
+        # A consumer is done with the file of the record (whether it needed the hash or not).
+        key = (record.path, record.size, record.mtime_ns)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.user_count -= 1
+                if entry.user_count <= 0:
+                    del self._entries[key]
+
+    def hash_once(self, record, calculate) -> tuple:
+        # Return the hash of the file of the record: calculate() is called if no other job has
+        # calculated it (or is calculating it) yet, or if the file is not expected by several consumers.
+        # Return a tuple with the hash and True if it was calculated by this call.
+        key = (record.path, record.size, record.mtime_ns)
+        with self._lock:
+            entry = self._entries.get(key)
+            owner = entry is not None and entry.calculated is None
+            if owner:
+                entry.calculated = threading.Event()
+
+        if entry is None:
+            return (calculate(), True)
+        if owner:
+            try:
+                entry.file_hash = calculate()
+            finally:
+                # If the hash could not be calculated, the jobs waiting for it try for themselves.
+                entry.calculated.set()
+            return (entry.file_hash, True)
+
+        entry.calculated.wait()
+        if entry.file_hash is None:
+            return (calculate(), True)
+        with self._lock:
+            self._hit_count += 1
+        return (entry.file_hash, False)
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
@@ -0,0 +1,141 @@
+import zlib
+import hashlib
+import threading
+from Helpers.hash_journal import HashJournal
+
+# Size index for the files in a target folder (hashes/sizes.jllog, next to the hash journal).
+#
+# Each record holds the size in bytes, a partial hash (first and last block of the file), the
+# full hash and, if it is known, the CRC-32 of a file in the target folder:
+# "<size>:<partial hash>:<full hash>[:<crc in hex>]". The CRC-32 is known for the files that
+# were hashed while copying, hashed when the target folder was cataloged, or collected from a
+# zip archive (which stores it).
+#
+# The index is used for a staged duplicate check of a source file:
+# 1. If no file in the target has the same size, the file is new.
+# 2. If no file in the target with the same size has the same partial hash, the file is new.
+#    For a file in an archive (whose partial hash is not cheap), the CRC-32 stored in the archive
+#    is compared instead: if the CRC-32 of every file in the target with the same size is known
+#    and none of them matches, the file is new (without decompressing it).
+# 3. Only then the full hash of the file is needed to tell if it is a duplicate.
+#
+# The size index can only rule out duplicates if it covers every hash in the hash journal.
+# This is recorded with a "complete" header line, written when the index is built together
+# with the hash journal. An index created next to an existing hash journal (from an earlier
+# version) is not complete until the hash list is updated from scratch.
+
+PARTIAL_HASH_BLOCK_SIZE = 64 * 1024
+COMPLETE_HEADER = "complete"
+
+
+def partial_hash(file_path: str, file_size: int, block_size: int=PARTIAL_HASH_BLOCK_SIZE) -> str:
+    # Calculate a cheap hash of the first and the last block of a file.
+    hash_partial = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        if file_size <= 2 * block_size:
+            hash_partial.update(f.read())
+        else:
+            hash_partial.update(f.read(block_size))
+            f.seek(file_size - block_size)
+            hash_partial.update(f.read(block_size))
+    return hash_partial.hexdigest()
+
+
+class Crc32Hash:
+    # This class is used to calculate the CRC-32 of a file together with its hash, in the same pass.
+    # It has the methods of the hash object it wraps that are used while copying (update() and hexdigest()).
+
+    __slots__ = ('_hash_object', '_crc')
+
+    def __init__(self, hash_object):
+        super().__init__()
+        self._hash_object = hash_object
+        self._crc = 0
+
+    @property
+    def crc(self) -> int:
+        return self._crc
+
+    def update(self, data):
+        self._hash_object.update(data)
+        self._crc = zlib.crc32(data, self._crc)
+
+    def hexdigest(self) -> str:
+        return self._hash_object.hexdigest()
+
+
+def size_index_record(file_size: int, file_partial_hash: str, file_hash: str, crc: int=None) -> str:
+    record = f"{file_size}:{file_partial_hash}:{file_hash}"
+    return record if crc is None else f"{record}:{crc:08x}"
+
+
+class SizeIndex:
+    # This class is used to store the size and partial hash of the files in the target folder.
+
+    def __init__(self, file_path: str, complete: bool=False):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._journal = HashJournal(file_path, header=[COMPLETE_HEADER] if complete else None)
+        self._partials_by_size = {}
+        self._crcs_by_size = {}
+        for record in self._journal.records:
+            self._add_to_memory(record)
+
+    @property
+    def complete(self) -> bool:
+        return COMPLETE_HEADER in self._journal.header
+
+    def __len__(self) -> int:
+        return len(self._journal)
+
+    def add(self, file_size: int, file_partial_hash: str, file_hash: str, crc: int=None):
+        # Add a file in the target folder to the size index (with its CRC-32, if it is known).
+        record = size_index_record(file_size, file_partial_hash, file_hash, crc)
+        with self._lock:
+            if self._journal.add(record):
+                self._add_to_memory(record)
+
+    def reset(self):
+        # Remove all files from the size index. The empty index is complete.
+        with self._lock:
+            self._journal.reset(header=[COMPLETE_HEADER])
+            self._partials_by_size = {}
+            self._crcs_by_size = {}
+
+    def rebuild(self, entries):
+        # Replace all files in the size index with the given (size, partial hash, full hash, CRC-32 or None) entries.
+        # The rebuilt index is complete.
+        with self._lock:
+            records = [size_index_record(*entry) for entry in entries]
+            self._journal.rewrite(records, header=[COMPLETE_HEADER])
+            self._partials_by_size = {}
+            self._crcs_by_size = {}
+            for record in self._journal.records:
+                self._add_to_memory(record)
+
+    def needs_full_hash(self, file_path: str, file_size: int, crc: int=None) -> bool:
+        # Check if a file could be a duplicate of a file in the target folder.
+        # Return False if the file is known to be new without calculating its full hash.
+        # Without a file path (a file in an archive, whose partial hash is not cheap), the size and
+        # the CRC-32 (if given) are checked.
+        if not self.complete:
+            return True
+
+        partials = self._partials_by_size.get(file_size)
+        if not partials:
+            return False
+        if file_path is None:
+            # A CRC-32 that is unknown for some file of the same size (None in the set) can not rule it out.
+            crcs = self._crcs_by_size[file_size]
+            return crc is None or None in crcs or crc in crcs
+
+        return partial_hash(file_path, file_size) in partials
+
+    def close(self):
+        self._journal.close()
+
+    def _add_to_memory(self, record: str):
+        fields = record.split(':')
+        file_size = int(fields[0])
+        self._partials_by_size.setdefault(file_size, set()).add(fields[1])
+        self._crcs_by_size.setdefault(file_size, set()).add(int(fields[3], 16) if len(fields) > 3 else None)
@@ -0,0 +1,218 @@
+import os
+import bisect
+
+# Fast scanner for the files in a source folder and all its subfolders.
+#
+# The scanner is built on os.scandir, so the file type and size come from the directory
+# entries (on Windows without any extra system call, elsewhere with one cached stat call).
+# Folders to avoid and folders covered by a forbidden path are pruned before descending into
+# them, and the files found are yielded one by one as ScanRecord objects.
+#
+# With a source snapshot (incremental runs, see source_snapshot.py), folders that did not change
+# since the last run are not listed, and only files that are new or changed are yielded.
+#
+# With an archive scanner (see archive_source.py), ZIP and TAR archives are scanned like
+# subfolders: the files in them are yielded as ArchiveMember records.
+#
+# Forbidden paths are matched as lower case path prefixes with '/' as separator (like
+# "c:/users/me/private"). The matcher keeps the prefixes sorted, so checking a path costs a
+# binary search instead of a loop over all forbidden paths.
+
+
+def normalize_path(path: str) -> str:
+    # Return the path in the form used for matching forbidden paths.
+    return path.replace('\\', '/').lower()
+
+
+def read_forbidden_paths(forbidden_paths_file: str) -> set:
+    # Read the forbidden paths from the database file and store them in a set.
+    forbidden_paths = set()
+    try:
+        with open(forbidden_paths_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                forbidden_path = normalize_path(line.strip())
+                if forbidden_path:
+                    forbidden_paths.add(forbidden_path)
+
+    except (FileNotFoundError, PermissionError) as e:
+        print(f"Warning: Could not read forbidden paths from file '{forbidden_paths_file}'. Error: {e}")
+
+    return forbidden_paths
+
+
+class ScanRecord:
+    # This class is used to store a file found by the scanner.
+
+    __slots__ = ('path', 'size', 'mtime_ns', 'device')
+
+    def __init__(self, path: str, size: int, mtime_ns: int, device: int=0):
+        super().__init__()
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        # The device (st_dev) of the source folder the file was found in (used by the I/O scheduler).
+        self.device = device
+
+    def __repr__(self) -> str:
+        return f"ScanRecord({self.path!r}, {self.size}, {self.mtime_ns})"
+
+
+class ForbiddenPathMatcher:
+    # This class is used to check paths against a set of forbidden path prefixes.
+
+    def __init__(self, forbidden_paths):
+        super().__init__()
+        # Drop the prefixes that are covered by a shorter prefix. Then no prefix is the prefix of
+        # another one, and the only prefix that can match a path is the largest prefix that sorts
+        # before (or equal to) the path.
+        prefixes = []
+        for forbidden_path in sorted(normalize_path(p) for p in forbidden_paths if p):
+            if prefixes and forbidden_path.startswith(prefixes[-1]):
+                continue
+            prefixes.append(forbidden_path)
+        self._prefixes = prefixes
+
+    def __len__(self) -> int:
+        return len(self._prefixes)
+
+    def matches(self, normalized_path: str) -> bool:
+        # Check if the (normalized) path starts with any of the forbidden paths.
+        index = bisect.bisect_right(self._prefixes, normalized_path) - 1
+        return index >= 0 and normalized_path.startswith(self._prefixes[index])
+
+    def has_prefixes_under(self, normalized_folder: str) -> bool:
+        # Check if any of the forbidden paths starts with the (normalized) folder path, so that
+        # files in the folder must be checked one by one. Only valid for a folder that is not
+        # matched itself (a folder that is matched is pruned anyway).
+        index = bisect.bisect_left(self._prefixes, normalized_folder)
+        return index < len(self._prefixes) and self._prefixes[index].startswith(normalized_folder)
+
+
+def scan_source(source_folder: str, extensions, forbidden_path_matcher: ForbiddenPathMatcher=None, folders_2_avoid=(),
+                progress_callback=None, snapshot=None, order_by_inode: bool=False, archive_scanner=None):
+    # Find all files in a folder and its subfolders that match the specified extensions.
+    # Folders in the folders_2_avoid list and folders covered by a forbidden path are not scanned.
+    # Yield a ScanRecord for each file found (with a snapshot: each file that is new or changed).
+    # With order_by_inode, the files of each folder are yielded in inode order (close to the order
+    # on a spinning disk) instead of the order they were listed.
+    # With an archive scanner, the files in the archives are yielded too (after the files of the folder).
+    # progress_callback(files_examined_count, files_found_count) is called once per folder.
+    extensions = frozenset(extensions)
+    folders_2_avoid = frozenset(folders_2_avoid)
+    if forbidden_path_matcher is None:
+        forbidden_path_matcher = ForbiddenPathMatcher(())
+
+    try:
+        device = os.stat(source_folder).st_dev
+    except OSError as e:
+        print(f"Warning: Could not scan folder '{source_folder}'. Error: {e}")
+        return
+
+    files_examined_count = 0
+    files_found_count = 0
+    folders = [source_folder]
+
+    while folders:
+        folder = folders.pop()
+
+        if os.path.basename(folder) in folders_2_avoid:
+            continue
+
+        normalized_folder = normalize_path(os.path.join(folder, ''))
+        if forbidden_path_matcher.matches(normalized_folder):
+            # Every file in this folder and its subfolders starts with a forbidden path.
+            continue
+        check_files = forbidden_path_matcher.has_prefixes_under(normalized_folder)
+
+        if archive_scanner is not None and archive_scanner.is_archive(folder):
+            for record in archive_scanner.scan(folder, device, extensions, forbidden_path_matcher, folders_2_avoid, snapshot):
+                files_found_count += 1
+                yield record
+            if progress_callback is not None:
+                progress_callback(files_examined_count, files_found_count)
+            continue
+
+        if snapshot is not None:
+            # The modification time is read before listing, so changes made while listing are seen next time.
+            try:
+                folder_mtime_ns = os.stat(folder).st_mtime_ns
+            except OSError as e:
+                print(f"Warning: Could not scan folder '{folder}'. Error: {e}")
+                continue
+
+            if snapshot.folder_unchanged(folder, folder_mtime_ns):
+                for file_path in snapshot.pending_files(folder):
+                    try:
+                        stat_result = os.stat(file_path)
+                    except OSError:
+                        continue
+                    record = ScanRecord(file_path, stat_result.st_size, stat_result.st_mtime_ns, device)
+                    snapshot.update_file(record)
+                    files_found_count += 1
+                    yield record
+
+                folders.extend(reversed(snapshot.known_subfolders(folder)))
+                if progress_callback is not None:
+                    progress_callback(files_examined_count, files_found_count)
+                continue
+
+        collect_records = snapshot is not None or order_by_inode
+        records = []
+        try:
+            with os.scandir(folder) as entries:
+                subfolders = []
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subfolders.append(entry.path)
+                            continue
+                        if not entry.is_file():
+                            continue
+                    except OSError:
+                        continue
+
+                    files_examined_count += 1
+
+                    if archive_scanner is not None and archive_scanner.is_archive(entry.path):
+                        # An archive is scanned like a subfolder.
+                        subfolders.append(entry.path)
+                        continue
+
+                    if os.path.splitext(entry.name)[1].lower() not in extensions:
+                        continue
+
+                    if check_files and forbidden_path_matcher.matches(normalize_path(entry.path)):
+                        continue
+
+                    try:
+                        stat_result = entry.stat()
+                    except OSError as e:
+                        print(f"Warning: Could not read file '{entry.path}'. Error: {e}")
+                        continue
+
+                    record = ScanRecord(entry.path, stat_result.st_size, stat_result.st_mtime_ns, device)
+                    if collect_records:
+                        records.append((entry.inode() if order_by_inode else 0, record))
+                        continue
+                    files_found_count += 1
+                    yield record
+
+        except OSError as e:
+            print(f"Warning: Could not scan folder '{folder}'. Error: {e}")
+            continue
+
+        if collect_records:
+            if order_by_inode:
+                records.sort(key=lambda inode_record: inode_record[0])
+            records = [record for _, record in records]
+            if snapshot is not None:
+                records = snapshot.update_folder(folder, folder_mtime_ns, subfolders, records)
+            for record in records:
+                files_found_count += 1
+                yield record
+
+        # Scan the subfolders in the order they were listed.
+        folders.extend(reversed(subfolders))
+
+        if progress_callback is not None:
+            progress_callback(files_examined_count, files_found_count)
@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+# Snapshot of the source folders for incremental runs (hashes/sources.sqlite3 in the target folder).
+#
+# The snapshot holds the modification time of every source folder scanned, its subfolders,
+# and the files found in it (size, modification time, and whether the file was handled).
+# On the next run, a folder whose modification time did not change is not listed again:
+# only its known subfolders are visited and the files that were not handled yet (because of
+# an error) are returned. In a folder that did change, only files that are new or changed
+# are returned.
+#
+# The modification time of a folder changes when files are added, removed or renamed in it,
+# but not when a file is changed in place. Camera uploads only add files; a full run (not
+# incremental) picks up everything else. Folders changed during the last seconds before the
+# scan are always listed again, since the time resolution of some file systems is 2 seconds.
+#
+# The snapshot belongs to a job (source folders, extensions, filters): a snapshot of another
+# job is discarded. All changes of a run are made in one transaction that is only committed
+# when the run finishes, so an interrupted run leaves the snapshot of the last finished run.
+
+SNAPSHOT_FILE_NAME = "sources.sqlite3"
+RECENT_CHANGE_WINDOW_NS = 2 * 1000 * 1000 * 1000
+
+
+class SourceSnapshot:
+    # This class is used to keep the snapshot of the source folders of a job.
+    # It is safe to use from several threads.
+
+    def __init__(self, file_path: str, job: dict):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._scan_time_ns = time.time_ns()
+        self._unchanged_count = 0
+
+        self._connection = sqlite3.connect(file_path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS folders (path TEXT PRIMARY KEY, parent TEXT, mtime_ns INTEGER)")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS files ("
+                                 "path TEXT PRIMARY KEY, folder TEXT NOT NULL, size INTEGER NOT NULL, "
+                                 "mtime_ns INTEGER NOT NULL, done INTEGER NOT NULL)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS folders_parent ON folders (parent)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS files_folder ON files (folder)")
+
+        job_text = json.dumps(job, sort_keys=True)
+        row = self._connection.execute("SELECT value FROM meta WHERE key = 'job'").fetchone()
+        if row is None or row[0] != job_text:
+            self._connection.execute("DELETE FROM folders")
+            self._connection.execute("DELETE FROM files")
+            self._connection.execute("INSERT OR REPLACE INTO meta VALUES ('job', ?)", (job_text,))
+        self._connection.commit()
+
+    @property
+    def unchanged_count(self) -> int:
+        # The number of files skipped because they were handled by an earlier run and did not change.
+        return self._unchanged_count
+
+    def folder_unchanged(self, folder: str, mtime_ns: int) -> bool:
+        # Check if the folder did not change since it was scanned (its files do not need to be listed).
+        with self._lock:
+            row = self._connection.execute("SELECT mtime_ns FROM folders WHERE path = ?", (folder,)).fetchone()
+        return row is not None and row[0] is not None and row[0] == mtime_ns
+
+    def known_subfolders(self, folder: str) -> list:
+        # Return the subfolders of an unchanged folder.
+        with self._lock:
+            rows = self._connection.execute("SELECT path FROM folders WHERE parent = ? ORDER BY path", (folder,)).fetchall()
+        return [row[0] for row in rows]
+
+    def pending_files(self, folder: str) -> list:
+        # Return the paths of the files in an unchanged folder that were not handled yet.
+        with self._lock:
+            rows = self._connection.execute("SELECT path, done FROM files WHERE folder = ?", (folder,)).fetchall()
+        pending_paths = [path for path, done in rows if not done]
+        self._unchanged_count += len(rows) - len(pending_paths)
+        return pending_paths
+
+    def update_file(self, record):
+        # Store the size and modification time of a pending file as found now (it may have been
+        # rewritten in place), so mark_done matches it.
+        with self._lock:
+            self._connection.execute("UPDATE files SET size = ?, mtime_ns = ? WHERE path = ?",
+                                     (record.size, record.mtime_ns, record.path))
+
+    def update_folder(self, folder: str, mtime_ns: int, subfolders: list, records: list) -> list:
+        # Store a folder that was listed, with its subfolders and the files found in it.
+        # Return the records of the files that are new or changed, or were not handled yet.
+        if self._scan_time_ns - mtime_ns < RECENT_CHANGE_WINDOW_NS:
+            # Changed right before the scan: list the folder again next time.
+            mtime_ns = None
+
+        with self._lock:
+            connection = self._connection
+            old_files = {row[0]: row[1:] for row in connection.execute(
+                "SELECT path, size, mtime_ns, done FROM files WHERE folder = ?", (folder,))}
+
+            connection.execute("INSERT OR REPLACE INTO folders VALUES (?, ?, ?)",
+                               (folder, self._parent_of(folder), mtime_ns))
+            old_subfolders = {row[0] for row in connection.execute("SELECT path FROM folders WHERE parent = ?", (folder,))}
+            for subfolder in old_subfolders.difference(subfolders):
+                # Drop the removed subfolder with everything below it.
+                prefix = os.path.join(subfolder, "")
+                connection.execute("DELETE FROM folders WHERE path = ? OR substr(path, 1, ?) = ?",
+                                   (subfolder, len(prefix), prefix))
+                connection.execute("DELETE FROM files WHERE folder = ? OR substr(folder, 1, ?) = ?",
+                                   (subfolder, len(prefix), prefix))
+            # New subfolders are listed when they are visited (no modification time yet).
+            connection.executemany("INSERT OR IGNORE INTO folders VALUES (?, ?, NULL)",
+                                   ((subfolder, folder) for subfolder in subfolders))
+
+            connection.execute("DELETE FROM files WHERE folder = ?", (folder,))
+            changed_records = []
+            for record in records:
+                old_file = old_files.get(record.path)
+                done = old_file is not None and old_file[2] and old_file[0] == record.size and old_file[1] == record.mtime_ns
+                if done:
+                    self._unchanged_count += 1
+                else:
+                    changed_records.append(record)
+                connection.execute("INSERT INTO files VALUES (?, ?, ?, ?, ?)",
+                                   (record.path, folder, record.size, record.mtime_ns, 1 if done else 0))
+        return changed_records
+
+    def mark_done(self, record):
+        # Mark a file as handled (it is skipped by the next run unless it changes).
+        with self._lock:
+            self._connection.execute("UPDATE files SET done = 1 WHERE path = ? AND size = ? AND mtime_ns = ?",
+                                     (record.path, record.size, record.mtime_ns))
+
+    def close(self, commit: bool=False):
+        # Close the snapshot. With commit, the changes of the run are kept (the run finished).
+        with self._lock:
+            if commit:
+                self._connection.commit()
+            else:
+                self._connection.rollback()
+            self._connection.close()
+
+    def _parent_of(self, folder: str) -> str:
+        row = self._connection.execute("SELECT parent FROM folders WHERE path = ?", (folder,)).fetchone()
+        return row[0] if row is not None else None
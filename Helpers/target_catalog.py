@@ -0,0 +1,108 @@
+import os
+import sqlite3
+import threading
+
+# Catalog of the files in a target folder (hashes/catalog.sqlite3).
+#
+# The catalog maps the path of each file in the target folder (relative to the target folder)
+# to its size, modification time, inode, partial hash, full hash and CRC-32 (NULL if it is not
+# known, see size_index.py). When the hash list of the
+# target folder is validated, only files whose size, modification time or inode changed since
+# they were cataloged need to be hashed again, and files that were removed from the target
+# folder are dropped from the catalog.
+
+COMMIT_EVERY = 1000
+
+
+class CatalogEntry:
+    # This class is used to store the catalog information of a file in the target folder.
+
+    __slots__ = ('path', 'size', 'mtime_ns', 'inode', 'partial_hash', 'file_hash', 'crc')
+
+    def __init__(self, path: str, size: int, mtime_ns: int, inode: int, partial_hash: str, file_hash: str, crc: int=None):
+        super().__init__()
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.inode = inode
+        self.partial_hash = partial_hash
+        self.file_hash = file_hash
+        self.crc = crc
+
+    def matches_stat(self, stat_result) -> bool:
+        # Check if the file is unchanged since it was cataloged.
+        return self.size == stat_result.st_size and self.mtime_ns == stat_result.st_mtime_ns and self.inode == stat_result.st_ino
+
+
+class TargetCatalog:
+    # This class is used to store the catalog of a target folder in an SQLite database.
+    # It is safe to use from several threads.
+
+    def __init__(self, file_path: str):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._uncommitted_count = 0
+        self._connection = sqlite3.connect(file_path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS files ("
+                                 "path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, "
+                                 "inode INTEGER NOT NULL, partial_hash TEXT NOT NULL, hash TEXT NOT NULL, crc INTEGER)")
+        # A catalog of an earlier version has no CRC-32 column.
+        columns = [row[1] for row in self._connection.execute("PRAGMA table_info(files)")]
+        if 'crc' not in columns:
+            self._connection.execute("ALTER TABLE files ADD COLUMN crc INTEGER")
+        self._connection.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def entries(self) -> dict:
+        # Return a dictionary with all catalog entries, keyed by path.
+        with self._lock:
+            rows = self._connection.execute("SELECT path, size, mtime_ns, inode, partial_hash, hash, crc FROM files").fetchall()
+        return {row[0]: CatalogEntry(*row) for row in rows}
+
+    def put(self, entry: CatalogEntry):
+        # Add or update the catalog entry of a file.
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                     (entry.path, entry.size, entry.mtime_ns, entry.inode, entry.partial_hash, entry.file_hash,
+                                      entry.crc))
+            self._count_change()
+
+    def remove(self, path: str):
+        # Remove the catalog entry of a file.
+        with self._lock:
+            self._connection.execute("DELETE FROM files WHERE path = ?", (path,))
+            self._count_change()
+
+    def clear(self):
+        # Remove all catalog entries.
+        with self._lock:
+            self._connection.execute("DELETE FROM files")
+            self._connection.commit()
+            self._uncommitted_count = 0
+
+    def commit(self):
+        with self._lock:
+            self._connection.commit()
+            self._uncommitted_count = 0
+
+    def close(self):
+        with self._lock:
+            self._connection.commit()
+            self._connection.close()
+
+    def _count_change(self):
+        # Batched commits: commit after a number of changes.
+        self._uncommitted_count += 1
+        if self._uncommitted_count >= COMMIT_EVERY:
+            self._connection.commit()
+            self._uncommitted_count = 0
+
+
+def catalog_path(target_folder: str, file_path: str) -> str:
+    # Return the path of a file relative to the target folder, as stored in the catalog.
+    return os.path.relpath(file_path, target_folder).replace('\\', '/')
@@ -0,0 +1,230 @@
+import os
+from Helpers.hash_backends import LEGACY_HASH_ALGORITHM, HashBackend, HashError, get_hash_backend, hash_file, hash_file_object
+from Helpers.digest_store import DigestStore
+from Helpers.size_index import Crc32Hash, SizeIndex, partial_hash
+from Helpers.target_catalog import TargetCatalog, CatalogEntry, catalog_path
+from Helpers.target_layout import DEFAULT_LAYOUT
+from Helpers.run_metrics import RunMetrics
+
+# The index of a target folder, stored in the hashes folder of the target folder:
+# - digests.bin and hashes.jllog: the digest store with the hashes of all files collected in the
+#   target folder (a sorted binary file and a journal with the hashes added since the last merge).
+# - sizes.jllog: the size index used for the staged duplicate check.
+# - catalog.sqlite3: the catalog that maps the files in the target folder to their hashes.
+#
+# The index is used as the target hashes by the copy engine ('in' and add()).
+#
+# The hash algorithm of the target folder is recorded in the header of the hash journal
+# ("#algo=<name>"). A hash journal without it (from an earlier version) holds md5 hashes.
+# The hash journal is kept when its hashes are merged into digests.bin, so the header is never lost.
+# The layout of the target folder is recorded the same way ("#layout=<name>"); without it the
+# target folder is flat.
+#
+# The work on the index is timed in the run metrics: hashing the target folder (harvest_hash),
+# and writing the index (index_write, index_rewrite and index_close).
+
+HASH_FOLDER_NAME = "hashes"
+ALGORITHM_HEADER_PREFIX = "algo="
+LAYOUT_HEADER_PREFIX = "layout="
+# The CRC index of an earlier version (the CRC-32 is now kept in the size index and the catalog).
+LEGACY_CRC_INDEX_FILE_NAME = "crcs.jllog"
+
+
+def read_header_value(header: list, prefix: str) -> str:
+    # Return the value of a header line of a hash journal (like "algo=md5"), or None.
+    for line in header:
+        if line.startswith(prefix):
+            return line[len(prefix):]
+    return None
+
+
+def read_hash_algorithm(header: list) -> str:
+    # Return the hash algorithm recorded in the header of a hash journal, or None.
+    return read_header_value(header, ALGORITHM_HEADER_PREFIX)
+
+
+class TargetIndex:
+    # This class is used to keep the hash journal, size index and catalog of a target folder together.
+
+    def __init__(self, target_folder: str, hash_algorithm: str=None, rebuild: bool=False, layout_name: str=None,
+                 metrics: RunMetrics=None):
+        # hash_algorithm: the hash algorithm to use for a new target folder (default: the fastest available).
+        # layout_name: the layout to use for a new target folder (default: flat).
+        # An existing target folder keeps its hash algorithm and layout, unless the index will be rebuilt.
+        super().__init__()
+        self._target_folder = target_folder
+        self._metrics = metrics if metrics is not None else RunMetrics()
+        self._hash_folder_path = os.path.join(target_folder, HASH_FOLDER_NAME)
+        os.makedirs(self._hash_folder_path, exist_ok=True)  # Create the hashes folder if it doesn't exist
+
+        self._hashes = DigestStore(os.path.join(self._hash_folder_path, "hashes.jllog"),
+                                   os.path.join(self._hash_folder_path, "digests.bin"))
+        self._size_index = SizeIndex(os.path.join(self._hash_folder_path, "sizes.jllog"), complete=not self._hashes)
+        self._catalog = TargetCatalog(os.path.join(self._hash_folder_path, "catalog.sqlite3"))
+        try:
+            os.remove(os.path.join(self._hash_folder_path, LEGACY_CRC_INDEX_FILE_NAME))
+        except FileNotFoundError:
+            pass
+
+        # Find the hash algorithm of the target folder (recorded in the header of the hash journal).
+        current_hash_algorithm = read_hash_algorithm(self._hashes.header)
+        if current_hash_algorithm is None and self._hashes:
+            current_hash_algorithm = LEGACY_HASH_ALGORITHM
+
+        # Find the layout of the target folder.
+        self._previous_layout_name = read_header_value(self._hashes.header, LAYOUT_HEADER_PREFIX) or DEFAULT_LAYOUT
+        if current_hash_algorithm is None or rebuild:
+            self._layout_name = layout_name or self._previous_layout_name
+        else:
+            if layout_name and layout_name != self._previous_layout_name:
+                print(f"Warning: The target folder uses the layout '{self._previous_layout_name}', not '{layout_name}'. "
+                      f"Update the hash list from scratch to switch.")
+            self._layout_name = self._previous_layout_name
+
+        if current_hash_algorithm is None or (rebuild and hash_algorithm and hash_algorithm != current_hash_algorithm):
+            # A new target folder, or switching the hash algorithm: the catalog holds hashes of the old algorithm.
+            self._hash_backend = get_hash_backend(hash_algorithm)
+            self._catalog.clear()
+            self._hashes.rewrite((), header=self._journal_header())
+        else:
+            if hash_algorithm and hash_algorithm != current_hash_algorithm:
+                print(f"Warning: The target folder uses the hash algorithm '{current_hash_algorithm}', not '{hash_algorithm}'. "
+                      f"Update the hash list from scratch to switch.")
+            self._hash_backend = get_hash_backend(current_hash_algorithm)
+
+    @property
+    def target_folder(self) -> str:
+        return self._target_folder
+
+    @property
+    def hash_folder_path(self) -> str:
+        return self._hash_folder_path
+
+    @property
+    def hash_backend(self) -> HashBackend:
+        return self._hash_backend
+
+    @property
+    def layout_name(self) -> str:
+        return self._layout_name
+
+    @property
+    def previous_layout_name(self) -> str:
+        # The layout recorded for the target folder before this run (differs from layout_name when switching).
+        return self._previous_layout_name
+
+    @property
+    def hashes(self) -> DigestStore:
+        return self._hashes
+
+    @property
+    def size_index(self) -> SizeIndex:
+        return self._size_index
+
+    @property
+    def catalog(self) -> TargetCatalog:
+        return self._catalog
+
+    def __contains__(self, file_hash: str) -> bool:
+        return file_hash in self._hashes
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def add(self, file_hash: str) -> bool:
+        with self._metrics.timer('index_write'):
+            return self._hashes.add(file_hash)
+
+    def needs_full_hash(self, file_path: str, file_size: int, crc: int=None) -> bool:
+        return self._size_index.needs_full_hash(file_path, file_size, crc)
+
+    def hash_file(self, file_path: str, file_size: int=None) -> str:
+        # Calculate the hash of a file with the hash algorithm of the target folder.
+        # Raise a HashError if the file can not be read.
+        return hash_file(file_path, self._hash_backend, file_size)
+
+    def hash_file_object(self, file_object, name: str="") -> str:
+        # Calculate the hash of the data of a binary file object (like a file in an archive).
+        # Raise a HashError if the data can not be read.
+        return hash_file_object(file_object, self._hash_backend, name)
+
+    def new_hash(self):
+        # Return a new hash object of the hash algorithm of the target folder.
+        return self._hash_backend.new()
+
+    def add_file(self, file_path: str, file_hash: str, crc: int=None):
+        # Add a file that was copied to the target folder to the size index and the catalog (with its CRC-32, if it is known).
+        with self._metrics.timer('index_write'):
+            stat_result = os.stat(file_path)
+            file_partial_hash = partial_hash(file_path, stat_result.st_size)
+            self._size_index.add(stat_result.st_size, file_partial_hash, file_hash, crc)
+            self._catalog.put(CatalogEntry(catalog_path(self._target_folder, file_path), stat_result.st_size,
+                                           stat_result.st_mtime_ns, stat_result.st_ino, file_partial_hash, file_hash, crc))
+
+    def rebuild(self, file_paths: list, progress_callback=None) -> tuple:
+        # Validate the index against the files in the target folder.
+        # Only files that are new or changed since they were cataloged are hashed.
+        # Files that are no longer in the target folder are dropped, and the hash journal and size
+        # index are rewritten from the catalog.
+        # Return a tuple with the number of files hashed and the number of files dropped.
+        entries = self._catalog.entries()
+        hashed_count = 0
+        total_files = len(file_paths)
+
+        for index, file_path in enumerate(file_paths):
+            path = catalog_path(self._target_folder, file_path)
+            try:
+                stat_result = os.stat(file_path)
+            except (FileNotFoundError, NotADirectoryError):
+                # The file was removed after the folder was listed; its entry is dropped with the other missing files.
+                continue
+            except OSError as e:
+                # Keep the entry of a file that can not be read right now.
+                entries.pop(path, None)
+                print(f"Warning: Could not read file '{file_path}'. Error: {e}")
+                continue
+
+            entry = entries.pop(path, None)
+            if entry is None or not entry.matches_stat(stat_result):
+                old_entry = entry
+                try:
+                    with self._metrics.timer('harvest_hash', stat_result.st_size):
+                        # The CRC-32 is calculated in the same pass as the hash.
+                        crc_hash = Crc32Hash(self.new_hash())
+                        file_hash = hash_file(file_path, self._hash_backend, stat_result.st_size, hash_object=crc_hash)
+                        entry = CatalogEntry(path, stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino,
+                                             partial_hash(file_path, stat_result.st_size), file_hash, crc_hash.crc)
+                except (HashError, OSError) as e:
+                    if not os.path.lexists(file_path):
+                        # The file was removed while it was hashed.
+                        if old_entry is not None:
+                            entries[path] = old_entry
+                        continue
+                    print(f"Warning: Could not hash file '{file_path}'. Error: {e}")
+                    continue
+                self._catalog.put(entry)
+                hashed_count += 1
+
+            if progress_callback is not None:
+                progress_callback(index, total_files, file_path)
+
+        # The files left in the entries are no longer in the target folder.
+        for path in entries:
+            self._catalog.remove(path)
+        self._catalog.commit()
+
+        with self._metrics.timer('index_rewrite'):
+            catalog_entries = self._catalog.entries().values()
+            self._hashes.rewrite((entry.file_hash for entry in catalog_entries), header=self._journal_header())
+            self._size_index.rebuild((entry.size, entry.partial_hash, entry.file_hash, entry.crc) for entry in catalog_entries)
+
+        return (hashed_count, len(entries))
+
+    def _journal_header(self) -> list:
+        return [f"{ALGORITHM_HEADER_PREFIX}{self._hash_backend.name}", f"{LAYOUT_HEADER_PREFIX}{self._layout_name}"]
+
+    def close(self):
+        with self._metrics.timer('index_close'):
+            self._hashes.close()
+            self._size_index.close()
+            self._catalog.close()
@@ -0,0 +1,212 @@
+import os
+import re
+import datetime
+import threading
+from Helpers.exif_reader import read_exif_datetime
+from Helpers.archive_source import ArchiveMember
+
+# Layouts of the files in a target folder.
+#
+# - flat:   all files directly in the target folder (the layout of earlier versions).
+# - date:   one folder per year and month ("2024/05"), from the EXIF date the photo was taken,
+#           or the modification time of the file.
+# - hash:   two levels of folders from the first characters of the hash ("ab/cd").
+# - bucket: numbered folders ("00000", "00001", ...) that hold a limited number of files each.
+#
+# The sharded layouts keep the number of files per folder small, since directory operations
+# get slow when a folder holds hundreds of thousands of files.
+#
+# Unique destination names ("name(1).ext", "name(2).ext", ...) are handed out by a name
+# allocator. It lists each destination folder once and then keeps the taken names and the
+# next free number per name in memory, so a new name costs O(1) instead of one exists()
+# check for every name that is already taken.
+#
+# The source of a file is its path, or an ArchiveMember for a file in an archive (see
+# archive_source.py).
+
+LAYOUT_NAMES = ('flat', 'date', 'hash', 'bucket')
+DEFAULT_LAYOUT = 'flat'
+DEFAULT_BUCKET_SIZE = 10000
+UNDATED_FOLDER_NAME = "undated"
+
+_NUMBERED_NAME_PATTERN = re.compile(r"^(.*)\((\d+)\)$")
+# The names of the bucket folders (at least 5 digits, so year folders of the date layout are not taken for buckets).
+_BUCKET_NAME_PATTERN = re.compile(r"^\d{5,}$")
+
+
+class UniqueNameAllocator:
+    # This class is used to hand out unique file names in destination folders.
+    # It is safe to use from several threads.
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._folders = {}
+
+    def allocate(self, folder: str, basename: str) -> str:
+        # Reserve a unique name for the file in the folder (the folder is created if needed).
+        # Return the path of the destination file.
+        filename, extension = os.path.splitext(basename)
+        key = (os.path.normcase(filename), os.path.normcase(extension))
+
+        with self._lock:
+            folder_names = self._folders.get(folder)
+            if folder_names is None:
+                folder_names = self._load_folder(folder)
+            taken_names, next_numbers = folder_names
+
+            number = next_numbers.get(key, 0)
+            name = basename if number == 0 else f"{filename}({number}){extension}"
+            while os.path.normcase(name) in taken_names:
+                number += 1
+                name = f"{filename}({number}){extension}"
+            next_numbers[key] = number + 1
+            self._register_name(folder_names, name)
+
+        return os.path.join(folder, name)
+
+    def _load_folder(self, folder: str) -> tuple:
+        os.makedirs(folder, exist_ok=True)
+        folder_names = (set(), {})
+        for name in os.listdir(folder):
+            self._register_name(folder_names, name)
+        self._folders[folder] = folder_names
+        return folder_names
+
+    def _register_name(self, folder_names: tuple, name: str):
+        taken_names, next_numbers = folder_names
+        taken_names.add(os.path.normcase(name))
+
+        filename, extension = os.path.splitext(os.path.normcase(name))
+        key = (filename, extension)
+        next_numbers[key] = max(next_numbers.get(key, 0), 1)
+
+        # A numbered name: the next number for the original name is at least one higher.
+        match = _NUMBERED_NAME_PATTERN.match(filename)
+        if match:
+            key = (match.group(1), extension)
+            next_numbers[key] = max(next_numbers.get(key, 0), int(match.group(2)) + 1)
+
+
+def list_target_files(target_folder: str, extensions, recursive: bool, excluded_folders=()) -> list:
+    # List the files in the target folder that match the specified extensions.
+    # With recursive, the files in the subfolders are listed too, except for the excluded
+    # folders directly in the target folder (like the hashes and log folders).
+    target_files = []
+    folders = [target_folder]
+    while folders:
+        folder = folders.pop()
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive and not (folder == target_folder and entry.name in excluded_folders):
+                        folders.append(entry.path)
+                elif entry.name.lower().endswith(extensions):
+                    target_files.append(entry.path)
+    return target_files
+
+
+class TargetLayout:
+    # This class is used to place the files in a target folder (the flat layout).
+    # Subclasses choose another folder for each file.
+
+    name = 'flat'
+    sharded = False
+
+    def __init__(self, target_folder: str, allocator: UniqueNameAllocator=None):
+        super().__init__()
+        self._target_folder = target_folder
+        self._allocator = allocator if allocator is not None else UniqueNameAllocator()
+
+    @property
+    def target_folder(self) -> str:
+        return self._target_folder
+
+    def folder_for(self, source_path: str, file_hash: str) -> str:
+        # Return the folder for a file.
+        return self._target_folder
+
+    def destination_path(self, source_path: str, file_hash: str) -> str:
+        # Reserve a unique destination path for a file.
+        name = os.path.basename(source_path.path if isinstance(source_path, ArchiveMember) else source_path)
+        return self._allocator.allocate(self.folder_for(source_path, file_hash), name)
+
+    def file_committed(self, destination_path: str):
+        # Called when a file got its final name at the destination path.
+        pass
+
+
+class DateLayout(TargetLayout):
+    name = 'date'
+    sharded = True
+
+    def folder_for(self, source_path: str, file_hash: str) -> str:
+        if isinstance(source_path, ArchiveMember):
+            date = source_path.read_exif_datetime()
+            if date is None and source_path.mtime_ns:
+                date = datetime.datetime.fromtimestamp(source_path.mtime_ns / 1000000000)
+        else:
+            date = read_exif_datetime(source_path)
+            if date is None:
+                try:
+                    date = datetime.datetime.fromtimestamp(os.stat(source_path).st_mtime)
+                except (OSError, ValueError):
+                    pass
+        if date is None:
+            return os.path.join(self._target_folder, UNDATED_FOLDER_NAME)
+        return os.path.join(self._target_folder, f"{date.year:04d}", f"{date.month:02d}")
+
+
+class HashPrefixLayout(TargetLayout):
+    name = 'hash'
+    sharded = True
+
+    def folder_for(self, source_path: str, file_hash: str) -> str:
+        return os.path.join(self._target_folder, file_hash[:2], file_hash[2:4])
+
+
+class BucketLayout(TargetLayout):
+    name = 'bucket'
+    sharded = True
+
+    def __init__(self, target_folder: str, allocator: UniqueNameAllocator=None, bucket_size: int=DEFAULT_BUCKET_SIZE):
+        super().__init__(target_folder, allocator)
+        self._bucket_size = bucket_size
+        self._lock = threading.Lock()
+
+        # Continue with the last bucket of an earlier run.
+        bucket_numbers = [int(name) for name in os.listdir(target_folder)
+                          if _BUCKET_NAME_PATTERN.match(name) and os.path.isdir(os.path.join(target_folder, name))]
+        self._bucket_number = max(bucket_numbers, default=0)
+        bucket_folder = self._bucket_folder(self._bucket_number)
+        self._bucket_count = len(os.listdir(bucket_folder)) if os.path.isdir(bucket_folder) else 0
+
+    def folder_for(self, source_path: str, file_hash: str) -> str:
+        # Files are only counted when they are committed, so a bucket can get a few more files than the
+        # bucket size (at most the number of copies in flight), but failed copies are never counted.
+        with self._lock:
+            if self._bucket_count >= self._bucket_size:
+                self._bucket_number += 1
+                self._bucket_count = 0
+            return self._bucket_folder(self._bucket_number)
+
+    def file_committed(self, destination_path: str):
+        with self._lock:
+            if os.path.dirname(destination_path) == self._bucket_folder(self._bucket_number):
+                self._bucket_count += 1
+
+    def _bucket_folder(self, bucket_number: int) -> str:
+        return os.path.join(self._target_folder, f"{bucket_number:05d}")
+
+
+def create_target_layout(name: str, target_folder: str, bucket_size: int=DEFAULT_BUCKET_SIZE) -> TargetLayout:
+    # Create the layout with the given name for a target folder.
+    if name == 'flat':
+        return TargetLayout(target_folder)
+    if name == 'date':
+        return DateLayout(target_folder)
+    if name == 'hash':
+        return HashPrefixLayout(target_folder)
+    if name == 'bucket':
+        return BucketLayout(target_folder, bucket_size=bucket_size)
+    raise ValueError(f"Unknown target layout '{name}'. Available: {', '.join(LAYOUT_NAMES)}")
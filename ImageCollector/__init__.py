@@ -0,0 +1,14 @@
+# jl{ImageCollector} core package: collect images and videos from source folders into a target
+# folder without duplicates. Importing the package has no user interface side effects.
+#
+# Usage from Python:
+#   from ImageCollector import ImageCollector, CollectorSettings
+#   summary = ImageCollector(CollectorSettings(["/photos/in"], "/photos/archive")).run()
+#
+# Usage from the command line:
+#   python -m ImageCollector --source /photos/in --target /photos/archive --json
+#   python -m ImageCollector --batch jobs.json --json
+
+from ImageCollector.collector import (CollectorSettings, FileTypes2Copy, ImageCollector, RunSummary, copy_file_if_unique,
+                                      find_files_in_folder, md5, read_hashes_from_file)
+from ImageCollector.batch import BatchRunner, BatchSettings, BatchSummary, load_batch_file
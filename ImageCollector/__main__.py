@@ -0,0 +1,4 @@
+import sys
+from ImageCollector.cli import main
+
+sys.exit(main())
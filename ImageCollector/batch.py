@@ -0,0 +1,402 @@
+import os
+import json
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from Helpers.io_scheduler import IOScheduler
+from Helpers.parallel_copy_engine import HashClaims, default_hash_workers
+from Helpers.progress_bus import ProgressBus
+from Helpers.run_metrics import RunMetrics, RunProfiler
+from Helpers.shared_index import SharedDigestIndex, SharedTargetHashes
+from Helpers.shared_scan import SharedScan, SourceHashCache
+from Helpers.target_index import TargetIndex
+from Helpers.target_layout import TargetLayout
+from ImageCollector.collector import CollectorSettings, ImageCollector, find_files_in_folder, prepare_target
+
+# Batch runs of jl{ImageCollector}: many jobs (source folders into a target folder) run together,
+# described in a job file (JSON):
+#
+#   {
+#     "index_folder": "/archive/index",
+#     "workers": 8,
+#     "parallel_jobs": 3,
+#     "defaults": {"min_file_size_kb": 10},
+#     "jobs": [
+#       {"source_folders": ["/share/photos"], "target_folder": "/archive/photos"},
+#       {"source_folders": ["/share/photos", "/share/phone"], "target_folder": "/archive/videos", "file_types": "videos"}
+#     ]
+#   }
+#
+# The settings of a job are the arguments of CollectorSettings, the defaults apply to every job.
+# Relative folders are relative to the folder of the job file. Every target folder can be the
+# target of one job (list all its source folders in that job).
+#
+# - The target folders form one dedup domain: a shared digest index (in the index folder) holds the
+#   hashes of the files in all of them, so a file that is in any target folder, or that is copied by
+#   any job of the batch, is not copied again. All target folders use the hash algorithm of the
+#   shared index ("hash_algorithm" for a new index, default: the fastest available).
+# - A source folder that several jobs collect from (with the same forbidden paths and folders to
+#   avoid) is scanned once for all of them while they run at the same time, and every source file
+#   they share is hashed once (see shared_scan.py). A job that has not started when the scan is far
+#   ahead, incremental jobs and jobs that read archives scan their source folders on their own.
+# - At most "parallel_jobs" jobs run at the same time, and at most "workers" files are hashed or
+#   copied at the same time over all jobs.
+# - The jobs with device scheduling share one I/O scheduler, so the limits of a device (like one
+#   read at a time on a spinning disk) hold over all jobs. It uses the largest numbers of hash and
+#   copy workers, and the smallest number of workers for a spinning disk and read bandwidth of the jobs.
+
+BATCH_FILE_KEYS = ('index_folder', 'workers', 'parallel_jobs', 'hash_algorithm', 'rebuild_index', 'profile_file', 'trace_memory',
+                   'defaults', 'jobs')
+BATCH_FOLDER_KEYS = ('target_folder', 'forbidden_paths_file', 'metrics_file', 'prometheus_textfile')
+
+
+class BatchSettings:
+    # This class is used to store the settings of a batch run.
+
+    def __init__(self, jobs, index_folder: str, workers: int=None, parallel_jobs: int=None, hash_algorithm: str=None,
+                 rebuild_index: bool=False, profile_file: str=None, trace_memory: bool=False):
+        super().__init__()
+        self.jobs = list(jobs)
+        if not self.jobs:
+            raise ValueError("A batch needs at least one job")
+        # The folder of the shared digest index of all target folders.
+        self.index_folder = index_folder
+        # The global budget of files hashed or copied at the same time, and the number of jobs run at the same time.
+        self.workers = max(1, workers or default_hash_workers() + 2)
+        self.parallel_jobs = max(1, parallel_jobs or len(self.jobs))
+        # The hash algorithm for a new shared index (default: the fastest available).
+        self.hash_algorithm = hash_algorithm
+        # Rebuild the shared index from the target folders (also done when a job updates its hash list from scratch).
+        self.rebuild_index = rebuild_index or any(job.update_hash_list_from_scratch for job in self.jobs)
+        # Opt-in profiling of the whole batch (see RunProfiler); the jobs can not be profiled on their own.
+        self.profile_file = profile_file
+        self.trace_memory = trace_memory
+
+        target_folders = set()
+        for job in self.jobs:
+            if job.profile_file or job.trace_memory:
+                raise ValueError("The jobs of a batch can not be profiled on their own (profile the batch instead)")
+            target_folder = os.path.normcase(os.path.abspath(job.target_folder))
+            if target_folder in target_folders:
+                raise ValueError(f"The target folder '{job.target_folder}' is the target of more than one job")
+            target_folders.add(target_folder)
+
+
+def load_batch_file(file_path: str) -> BatchSettings:
+    # Read the settings of a batch run from a job file.
+    # Raise a ValueError if the job file is not valid, and an OSError if it can not be read.
+    with open(file_path, 'r', encoding='utf-8') as f:
+        try:
+            batch = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"The job file '{file_path}' is not valid JSON: {e}") from None
+
+    if not isinstance(batch, dict) or not isinstance(batch.get('jobs'), list) or 'index_folder' not in batch:
+        raise ValueError(f"The job file '{file_path}' needs an index_folder and a list of jobs")
+    unknown_keys = set(batch) - set(BATCH_FILE_KEYS)
+    if unknown_keys:
+        raise ValueError(f"Unknown settings in the job file '{file_path}': {', '.join(sorted(unknown_keys))}")
+
+    base_folder = os.path.dirname(os.path.abspath(file_path))
+
+    def resolve(path):
+        return os.path.join(base_folder, os.path.expanduser(path)) if path else path
+
+    jobs = []
+    for number, job in enumerate(batch['jobs'], 1):
+        if not isinstance(job, dict):
+            raise ValueError(f"Job {number} in the job file '{file_path}' is not an object")
+        job_settings = {**batch.get('defaults', {}), **job}
+        job_settings['source_folders'] = [resolve(folder) for folder in
+                                          ([job_settings['source_folders']] if isinstance(job_settings.get('source_folders'), str)
+                                           else job_settings.get('source_folders', []))]
+        for key in BATCH_FOLDER_KEYS:
+            if job_settings.get(key):
+                job_settings[key] = resolve(job_settings[key])
+        try:
+            jobs.append(CollectorSettings(**job_settings))
+        except (TypeError, KeyError) as e:
+            raise ValueError(f"Job {number} in the job file '{file_path}' is not valid: {e}") from None
+
+    return BatchSettings(jobs, resolve(batch['index_folder']), batch.get('workers'), batch.get('parallel_jobs'),
+                         batch.get('hash_algorithm'), batch.get('rebuild_index', False), resolve(batch.get('profile_file')),
+                         batch.get('trace_memory', False))
+
+
+def _scan_key(settings: CollectorSettings, source_folder: str) -> tuple:
+    # Return the key of the scan of a source folder, or None if the scan can not be shared with other jobs.
+    if settings.incremental or settings.scan_archives:
+        return None
+    return (os.path.normcase(os.path.abspath(source_folder)), settings.forbidden_paths_file, settings.folders_2_avoid)
+
+
+class BatchContext:
+    # This class is used to share the target folders, the dedup domain, the scans, the hashes and the
+    # worker budget between the jobs of a batch run (see ImageCollector).
+    # It is safe to use from several threads.
+
+    def __init__(self, shared_index: SharedDigestIndex, workers: int, io_scheduler: IOScheduler=None):
+        super().__init__()
+        self._shared_index = shared_index
+        self._io_scheduler = io_scheduler
+        self._claims = HashClaims()
+        self._hash_cache = SourceHashCache()
+        self._worker_slot = threading.BoundedSemaphore(workers)
+        self._targets = {}
+        self._scans = {}
+
+    @property
+    def shared_index(self) -> SharedDigestIndex:
+        return self._shared_index
+
+    @property
+    def claims(self) -> HashClaims:
+        return self._claims
+
+    @property
+    def hash_cache(self) -> SourceHashCache:
+        return self._hash_cache
+
+    @property
+    def io_scheduler(self) -> IOScheduler:
+        # The I/O scheduler of the jobs with device scheduling (None if no job uses it).
+        return self._io_scheduler
+
+    @property
+    def worker_slot(self) -> threading.BoundedSemaphore:
+        # Held while a file is hashed or copied (used as a context manager).
+        return self._worker_slot
+
+    @property
+    def shared_scan_count(self) -> int:
+        return len(self._scans)
+
+    def add_target(self, target_folder: str, target_index: TargetIndex, target_layout: TargetLayout):
+        self._targets[os.path.normcase(os.path.abspath(target_folder))] = (target_index, target_layout)
+
+    def target(self, target_folder: str) -> tuple:
+        # Return a tuple with the TargetIndex and the TargetLayout of a target folder of the batch.
+        return self._targets[os.path.normcase(os.path.abspath(target_folder))]
+
+    def target_hashes(self, target_index: TargetIndex) -> SharedTargetHashes:
+        # Return the target hashes for the copy engine of a job: the shared index of the batch.
+        return SharedTargetHashes(target_index, self._shared_index)
+
+    def plan_scans(self, jobs: list):
+        # Find the source folders that are used by more than one job, and prepare one scan for each of them
+        # (over the extensions of all the jobs that use it).
+        jobs_by_scan = {}
+        for settings in jobs:
+            for source_folder in settings.source_folders:
+                scan_key = _scan_key(settings, source_folder)
+                if scan_key is not None:
+                    scan_jobs = jobs_by_scan.setdefault(scan_key, [])
+                    if settings not in scan_jobs:
+                        scan_jobs.append(settings)
+
+        for scan_key, scan_jobs in jobs_by_scan.items():
+            if len(scan_jobs) < 2:
+                continue
+            source_folder, forbidden_paths_file, folders_2_avoid = scan_key
+            self._scans[scan_key] = _PlannedScan(source_folder, forbidden_paths_file, folders_2_avoid, scan_jobs, self._hash_cache)
+
+    def scan(self, settings: CollectorSettings, source_folder: str, order_by_inode: bool=False):
+        # Return the records of the shared scan of a source folder for a job (only the files with its extensions),
+        # or None if the job scans the source folder on its own.
+        planned_scan = self._scans.get(_scan_key(settings, source_folder))
+        if planned_scan is None:
+            return None
+        return planned_scan.records(settings, order_by_inode)
+
+    def job_finished(self, settings: CollectorSettings):
+        # Stop keeping the records of the shared scans for a job that is done (or failed before it got to them).
+        for source_folder in settings.source_folders:
+            planned_scan = self._scans.get(_scan_key(settings, source_folder))
+            if planned_scan is not None:
+                planned_scan.detach(settings)
+
+    def close(self):
+        # Stop the workers of the I/O scheduler and close the indexes of all target folders.
+        if self._io_scheduler is not None:
+            self._io_scheduler.shutdown()
+        targets = list(self._targets.values())
+        self._targets = {}
+        for target_index, _ in targets:
+            target_index.close()
+        self._hash_cache.clear()
+
+
+class _PlannedScan:
+    # A scan of a source folder shared by several jobs (the first job to ask for it decides the order).
+
+    def __init__(self, source_folder: str, forbidden_paths_file: str, folders_2_avoid: tuple, jobs: list, hash_cache: SourceHashCache):
+        super().__init__()
+        self._jobs = jobs
+        self._lock = threading.Lock()
+        self._order_by_inode = None
+        extensions = sorted({extension.lower() for settings in jobs for extension in settings.extensions})
+        self._shared_scan = SharedScan(lambda: find_files_in_folder(source_folder, extensions, forbidden_paths_file, folders_2_avoid,
+                                                                    order_by_inode=self._order_by_inode),
+                                       [settings.extensions for settings in jobs], hash_cache, thread_name="shared-scan")
+
+    def records(self, settings: CollectorSettings, order_by_inode: bool):
+        with self._lock:
+            if self._order_by_inode is None:
+                self._order_by_inode = order_by_inode
+        return self._shared_scan.records(self._consumer(settings))
+
+    def detach(self, settings: CollectorSettings):
+        self._shared_scan.detach(self._consumer(settings))
+
+    def _consumer(self, settings: CollectorSettings) -> int:
+        return next(index for index, job in enumerate(self._jobs) if job is settings)
+
+
+class BatchSummary:
+    # This class is used to store the outcome of a batch run.
+
+    def __init__(self):
+        super().__init__()
+        # One entry per job: the source and target folders, and the RunSummary or the error of the job.
+        self.jobs = []
+        self.shared_index_size = 0
+        self.shared_scan_count = 0
+        self.shared_hash_hits = 0
+        self.metrics = None
+        self.start_time = None
+        self.end_time = None
+
+    @property
+    def failed_job_count(self) -> int:
+        return sum(1 for job in self.jobs if job['error'] is not None)
+
+    @property
+    def error_count(self) -> int:
+        return sum(job['summary'].error_count for job in self.jobs if job['summary'] is not None)
+
+    def to_dict(self) -> dict:
+        summaries = [job['summary'] for job in self.jobs if job['summary'] is not None]
+        return {
+            'jobs': [{'source_folders': job['settings'].source_folders, 'target_folder': job['settings'].target_folder,
+                      'error': job['error'], **(job['summary'].to_dict() if job['summary'] is not None else {})}
+                     for job in self.jobs],
+            'files_found': sum(summary.files_found for summary in summaries),
+            'copied': sum(summary.copied_count for summary in summaries),
+            'bytes_copied': sum(summary.bytes_copied for summary in summaries),
+            'skipped': sum(summary.skipped_count for summary in summaries),
+            'errors': self.error_count,
+            'failed_jobs': self.failed_job_count,
+            'shared_index_size': self.shared_index_size,
+            'shared_scans': self.shared_scan_count,
+            'shared_hash_hits': self.shared_hash_hits,
+            'start_time': self.start_time.isoformat() if self.start_time else None,
+            'end_time': self.end_time.isoformat() if self.end_time else None,
+            'metrics': self.metrics,
+        }
+
+
+class BatchRunner:
+    # This class is used to run the jobs of a batch.
+
+    def __init__(self, settings: BatchSettings, progress_bus: ProgressBus=None):
+        super().__init__()
+        self._settings = settings
+        self._progress_bus = progress_bus if progress_bus is not None else ProgressBus()
+
+    @property
+    def settings(self) -> BatchSettings:
+        return self._settings
+
+    @property
+    def progress_bus(self) -> ProgressBus:
+        return self._progress_bus
+
+    def run(self) -> BatchSummary:
+        # Run all jobs of the batch.
+        # Return a BatchSummary with the summaries of the jobs. A job that fails does not stop the other jobs.
+        # Raise a NotADirectoryError if a source or target folder is not valid (before any job is started).
+        settings = self._settings
+        metrics = RunMetrics()
+        summary = BatchSummary()
+        summary.start_time = datetime.datetime.now()
+
+        for job in settings.jobs:
+            for folder in job.source_folders + [job.target_folder]:
+                if not os.path.isdir(folder):
+                    raise NotADirectoryError(f"Not a valid directory: {folder}")
+
+        with RunProfiler(metrics, settings.profile_file, settings.trace_memory):
+            shared_index = SharedDigestIndex(settings.index_folder, settings.hash_algorithm, settings.rebuild_index)
+            context = BatchContext(shared_index, settings.workers, self._create_io_scheduler())
+            try:
+                # A job whose target folder can not be prepared fails, the other jobs still run.
+                failed_jobs = self._prepare_targets(context, metrics)
+                jobs = [job for job in settings.jobs if job not in failed_jobs]
+                context.plan_scans(jobs)
+                summary.shared_scan_count = context.shared_scan_count
+
+                with ThreadPoolExecutor(max_workers=settings.parallel_jobs, thread_name_prefix="job") as job_pool:
+                    futures = {}
+                    for job in jobs:
+                        future = job_pool.submit(ImageCollector(job, self._progress_bus, context).run)
+                        future.add_done_callback(lambda _, job=job: context.job_finished(job))
+                        futures[job] = future
+                    for job in settings.jobs:
+                        if job in failed_jobs:
+                            summary.jobs.append({'settings': job, 'summary': None, 'error': failed_jobs[job]})
+                            continue
+                        try:
+                            summary.jobs.append({'settings': job, 'summary': futures[job].result(), 'error': None})
+                        except Exception as e:
+                            print(f"Warning: The job for the target folder '{job.target_folder}' failed. Error: {e}")
+                            summary.jobs.append({'settings': job, 'summary': None, 'error': str(e)})
+            finally:
+                context.close()
+                summary.shared_index_size = len(shared_index)
+                shared_index.close()
+
+        summary.shared_hash_hits = context.hash_cache.hit_count
+        metrics.count('shared_hash_hits', summary.shared_hash_hits)
+        metrics.count('failed_jobs', summary.failed_job_count)
+        summary.metrics = metrics.to_dict()
+        summary.end_time = datetime.datetime.now()
+        self._progress_bus.post_finished(f"End time:  {summary.end_time.strftime('%d.%m.%Y %H:%M:%S')}")
+        return summary
+
+    def _create_io_scheduler(self) -> IOScheduler:
+        # Create the I/O scheduler shared by the jobs with device scheduling, or return None if no job uses it.
+        jobs = [job for job in self._settings.jobs if job.device_scheduling]
+        if not jobs:
+            return None
+        read_limits = [job.max_read_mb_s for job in jobs if job.max_read_mb_s]
+        return IOScheduler(max(job.hash_workers for job in jobs), max(job.copy_workers for job in jobs), None,
+                           min(job.rotational_workers for job in jobs), min(read_limits) * 1024 * 1024 if read_limits else None)
+
+    def _prepare_targets(self, context: BatchContext, metrics: RunMetrics) -> dict:
+        # Open the target folders (all with the hash algorithm of the shared index) and add their hashes to the shared index.
+        # Return a dict with the error of each job whose target folder could not be prepared (like a target folder
+        # with another hash algorithm than the shared index).
+        # The hashes of all target folders are added to the shared index at once (one merge of their digest files).
+        settings = self._settings
+        shared_index = context.shared_index
+        failed_jobs = {}
+        target_indexes = []
+        for job in settings.jobs:
+            job.hash_algorithm = shared_index.hash_algorithm
+            target_index = None
+            try:
+                target_index, target_layout = prepare_target(job, metrics, self._progress_bus)
+                shared_index.check_target(target_index)
+            except (OSError, ValueError) as e:
+                print(f"Warning: The job for the target folder '{job.target_folder}' failed. Error: {e}")
+                failed_jobs[job] = str(e)
+                if target_index is not None:
+                    target_index.close()
+                continue
+            context.add_target(job.target_folder, target_index, target_layout)
+            target_indexes.append(target_index)
+
+        self._progress_bus.post_log_text("Adding the hashes of the target folders to the shared index...")
+        with metrics.timer('shared_index_merge'):
+            shared_index.add_targets(target_indexes)
+        return failed_jobs
@@ -0,0 +1,244 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from ImageCollector.collector import FOLDERS_2_AVOID, CollectorSettings, FileTypes2Copy, ImageCollector, find_files_in_folder
+from Helpers.hash_backends import get_hash_backend, hash_file
+from Helpers.target_index import TargetIndex
+from Helpers.run_log import RunLogWriter
+
+# Benchmark harness for the hot paths of the collector (python -m ImageCollector.benchmark).
+#
+# A reproducible synthetic source tree and target folder are generated in a temporary folder
+# (same seed -> same tree). The file count, size distribution, duplicate ratio, folder depth
+# and number of forbidden paths can be varied. Each phase is timed on its own:
+# - scan:           find_files_in_folder over the source tree.
+# - harvest:        hashing the files already in the target folder (empty catalog).
+# - harvest_cached: validating the target folder again (all files in the catalog).
+# - hash:           hashing all source files with the default (fastest) hash backend.
+# - copy:           a full collection run from the source to the target folder.
+# - log_write:      writing one log record per source file (default log format).
+#
+# The results (files/s and MB/s per phase) can be saved as a baseline JSON file and compared
+# against it later, so a regression in a hot path shows up before rolling out a new version.
+# Note that the files are read from the page cache after they were generated (warm cache).
+
+PHASES = ('scan', 'harvest', 'harvest_cached', 'hash', 'copy', 'log_write')
+
+
+class BenchmarkSettings:
+    # This class is used to store the shape of the synthetic trees.
+
+    def __init__(self, file_count: int=2000, mean_file_size_kb: int=256, duplicate_ratio: float=0.3,
+                 target_ratio: float=0.3, folder_depth: int=4, files_per_folder: int=50,
+                 forbidden_path_count: int=100, seed: int=1):
+        super().__init__()
+        self.file_count = file_count
+        self.mean_file_size_kb = mean_file_size_kb
+        self.duplicate_ratio = duplicate_ratio
+        self.target_ratio = target_ratio
+        self.folder_depth = folder_depth
+        self.files_per_folder = files_per_folder
+        self.forbidden_path_count = forbidden_path_count
+        self.seed = seed
+
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+
+class PhaseResult:
+    # This class is used to store the timing of a benchmark phase.
+
+    def __init__(self, name: str, seconds: float, file_count: int, byte_count: int):
+        super().__init__()
+        self.name = name
+        self.seconds = seconds
+        self.file_count = file_count
+        self.byte_count = byte_count
+
+    @property
+    def files_per_second(self) -> float:
+        return self.file_count / self.seconds if self.seconds > 0 else 0.0
+
+    @property
+    def mb_per_second(self) -> float:
+        return self.byte_count / (1024 * 1024) / self.seconds if self.seconds > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        return {'seconds': round(self.seconds, 4), 'files': self.file_count, 'bytes': self.byte_count,
+                'files_per_s': round(self.files_per_second, 1), 'mb_per_s': round(self.mb_per_second, 2)}
+
+
+def generate_trees(benchmark_settings: BenchmarkSettings, root_folder: str) -> tuple:
+    # Generate the synthetic source folder, target folder and forbidden paths file in root_folder.
+    # Return a tuple with the source folder, the target folder and the forbidden paths file.
+    rng = random.Random(benchmark_settings.seed)
+    source_folder = os.path.join(root_folder, "source")
+    target_folder = os.path.join(root_folder, "target")
+    os.makedirs(target_folder)
+
+    images = FileTypes2Copy().file_types_extentions['images']
+    folders = []
+    unique_contents = []
+
+    for index in range(benchmark_settings.file_count):
+        if index % benchmark_settings.files_per_folder == 0:
+            # Start a new folder at a random depth.
+            depth = rng.randint(1, max(1, benchmark_settings.folder_depth))
+            folder = os.path.join(source_folder, *(f"dir_{rng.randrange(1000):03d}" for _ in range(depth)))
+            os.makedirs(folder, exist_ok=True)
+            folders.append(folder)
+
+        if unique_contents and rng.random() < benchmark_settings.duplicate_ratio:
+            content = rng.choice(unique_contents)
+        else:
+            # Log-normal file sizes, like a mix of thumbnails, photos and a few large files.
+            file_size = max(1, int(rng.lognormvariate(0, 1) * benchmark_settings.mean_file_size_kb * 1024 / 1.65))
+            content = rng.randbytes(file_size)
+            unique_contents.append(content)
+
+        file_path = os.path.join(folder, f"IMG_{index % 10000:04d}{rng.choice(images)}")
+        with open(file_path, "wb") as f:
+            f.write(content)
+
+    # Put part of the unique files in the target folder, so the copy phase finds duplicates.
+    for index, content in enumerate(unique_contents[:int(len(unique_contents) * benchmark_settings.target_ratio)]):
+        with open(os.path.join(target_folder, f"TARGET_{index:06d}.jpg"), "wb") as f:
+            f.write(content)
+
+    # Forbidden paths: about one in ten of the source folders, the rest paths that do not exist.
+    forbidden_folders = rng.sample(folders, min(len(folders) // 10, benchmark_settings.forbidden_path_count))
+    forbidden_paths_file = os.path.join(root_folder, "forbidden_paths.txt")
+    with open(forbidden_paths_file, "w", encoding='utf-8') as f:
+        for index in range(benchmark_settings.forbidden_path_count):
+            if index < len(forbidden_folders):
+                f.write(f"{forbidden_folders[index]}\n")
+            else:
+                f.write(f"{os.path.join(source_folder, f'missing_{index}', 'sub')}\n")
+
+    return (source_folder, target_folder, forbidden_paths_file)
+
+
+def timed(func) -> tuple:
+    # Run func and return a tuple with its result and the seconds it took.
+    start_time = time.perf_counter()
+    result = func()
+    return (result, time.perf_counter() - start_time)
+
+
+def run_benchmark(benchmark_settings: BenchmarkSettings, work_folder: str=None) -> dict:
+    # Generate the trees and time each phase.
+    # Return a dictionary with the settings and the phase results.
+    root_folder = tempfile.mkdtemp(prefix="jl_image_collector_benchmark_", dir=work_folder)
+    try:
+        source_folder, target_folder, forbidden_paths_file = generate_trees(benchmark_settings, root_folder)
+        extensions = FileTypes2Copy().file_types_extentions['images']
+        results = {}
+
+        records, seconds = timed(lambda: list(find_files_in_folder(source_folder, extensions, forbidden_paths_file, FOLDERS_2_AVOID)))
+        source_bytes = sum(record.size for record in records)
+        results['scan'] = PhaseResult('scan', seconds, len(records), 0)
+
+        target_files = [os.path.join(target_folder, f) for f in os.listdir(target_folder)]
+        target_bytes = sum(os.path.getsize(f) for f in target_files)
+        target_index = TargetIndex(target_folder)
+        _, seconds = timed(lambda: target_index.rebuild(target_files))
+        results['harvest'] = PhaseResult('harvest', seconds, len(target_files), target_bytes)
+        _, seconds = timed(lambda: target_index.rebuild(target_files))
+        results['harvest_cached'] = PhaseResult('harvest_cached', seconds, len(target_files), 0)
+        target_index.close()
+
+        hash_backend = get_hash_backend()
+        _, seconds = timed(lambda: [hash_file(record.path, hash_backend, record.size) for record in records])
+        results['hash'] = PhaseResult('hash', seconds, len(records), source_bytes)
+
+        settings = CollectorSettings([source_folder], target_folder, forbidden_paths_file)
+        summary, seconds = timed(lambda: ImageCollector(settings).run())
+        results['copy'] = PhaseResult('copy', seconds, summary.files_found, summary.bytes_found)
+
+        def write_log():
+            with RunLogWriter(root_folder, "log") as run_log:
+                for record in records:
+                    run_log.write(record.path, 'duplicate', "", record.size, None, 0.0)
+        _, seconds = timed(write_log)
+        results['log_write'] = PhaseResult('log_write', seconds, len(records), 0)
+
+        return {'settings': benchmark_settings.to_dict(),
+                'phases': {name: results[name].to_dict() for name in PHASES}}
+    finally:
+        shutil.rmtree(root_folder, ignore_errors=True)
+
+
+def compare_with_baseline(report: dict, baseline: dict, tolerance: float) -> list:
+    # Compare the files/s of each phase with the baseline.
+    # Return a list with a text for each phase that is slower than the baseline by more than the tolerance.
+    regressions = []
+    if baseline.get('settings') != report['settings']:
+        print("Warning: The baseline was made with other benchmark settings.", file=sys.stderr)
+    for name, phase in report['phases'].items():
+        baseline_phase = baseline.get('phases', {}).get(name)
+        if not baseline_phase or not baseline_phase.get('files_per_s'):
+            continue
+        ratio = phase['files_per_s'] / baseline_phase['files_per_s']
+        phase['vs_baseline'] = round(ratio, 3)
+        if ratio < 1 - tolerance:
+            regressions.append(f"{name}: {phase['files_per_s']} files/s vs. baseline {baseline_phase['files_per_s']} files/s ({ratio:.0%})")
+    return regressions
+
+
+def format_report(report: dict) -> str:
+    lines = [f"{'phase':<16}{'seconds':>10}{'files':>9}{'files/s':>12}{'MB/s':>10}{'vs base':>9}"]
+    for name, phase in report['phases'].items():
+        vs_baseline = f"{phase['vs_baseline']:.0%}" if 'vs_baseline' in phase else "-"
+        lines.append(f"{name:<16}{phase['seconds']:>10.3f}{phase['files']:>9}{phase['files_per_s']:>12.1f}{phase['mb_per_s']:>10.2f}{vs_baseline:>9}")
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m ImageCollector.benchmark",
+                                     description="Benchmark the collector on reproducible synthetic trees.")
+    parser.add_argument("--files", dest="file_count", type=int, default=2000, help="number of source files")
+    parser.add_argument("--mean-size-kb", dest="mean_file_size_kb", type=int, default=256, help="mean file size in KB")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.3, help="share of source files that repeat another source file")
+    parser.add_argument("--target-ratio", type=float, default=0.3, help="share of unique files already in the target folder")
+    parser.add_argument("--depth", dest="folder_depth", type=int, default=4, help="maximum folder depth")
+    parser.add_argument("--forbidden", dest="forbidden_path_count", type=int, default=100, help="number of forbidden paths")
+    parser.add_argument("--seed", type=int, default=1, help="random seed of the synthetic trees")
+    parser.add_argument("--work-folder", default=None, help="folder for the temporary trees (default: system temp folder)")
+    parser.add_argument("--baseline", default=None, help="baseline JSON file to compare with")
+    parser.add_argument("--save-baseline", default=None, help="save the results as a baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown against the baseline (default: 0.2)")
+    parser.add_argument("--json", dest="json_output", action="store_true", help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    benchmark_settings = BenchmarkSettings(file_count=args.file_count, mean_file_size_kb=args.mean_file_size_kb,
+                                           duplicate_ratio=args.duplicate_ratio, target_ratio=args.target_ratio,
+                                           folder_depth=args.folder_depth, forbidden_path_count=args.forbidden_path_count,
+                                           seed=args.seed)
+    report = run_benchmark(benchmark_settings, args.work_folder)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding='utf-8') as f:
+            regressions = compare_with_baseline(report, json.load(f), args.tolerance)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if args.json_output:
+        print(json.dumps(report, indent=2))
+    else:
+        print(format_report(report))
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+import sys
+import json
+import argparse
+import contextlib
+from ImageCollector.collector import CollectorSettings, FileTypes2Copy, ImageCollector
+from ImageCollector.batch import BatchRunner, load_batch_file
+from Helpers.hash_backends import available_hash_algorithms
+from Helpers.io_scheduler import DEFAULT_ROTATIONAL_WORKERS
+from Helpers.file_transfer import DEFAULT_TRANSFER_STRATEGY, TRANSFER_STRATEGIES
+from Helpers.perceptual_hash import DEFAULT_PERCEPTUAL_ALGORITHM, PERCEPTUAL_ALGORITHMS, PERCEPTUAL_HASH_BITS
+from Helpers.perceptual_index import DEFAULT_NEAR_DUPLICATE_THRESHOLD
+from Helpers.run_log import DEFAULT_LOG_FORMAT, LOG_COMPRESSIONS, LOG_FORMATS
+from Helpers.target_layout import DEFAULT_BUCKET_SIZE, LAYOUT_NAMES
+from Helpers.progress_bus import ProgressBus, TtyProgressRenderer
+
+# Command line interface of jl{ImageCollector} (python -m ImageCollector).
+#
+# Exit codes: 0 when the run finished without errors, 1 when some files could not be copied,
+# 2 for invalid arguments, folders or job files.
+#
+# With --batch, the jobs are read from a job file (see batch.py) and the other collection options are not used.
+
+
+def build_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m ImageCollector",
+                                     description="Copy images and videos from source folders to a target folder, skipping duplicates.")
+    parser.add_argument("--source", dest="source_folders", action="append", metavar="FOLDER",
+                        help="source folder to collect from (can be given more than once)")
+    parser.add_argument("--target", dest="target_folder", metavar="FOLDER",
+                        help="target folder to collect into")
+    parser.add_argument("--batch", dest="batch_file", default=None, metavar="FILE",
+                        help="run the jobs of a JSON job file (many sources and targets with one shared dedup index) "
+                             "instead of --source and --target")
+    parser.add_argument("--forbidden-paths", dest="forbidden_paths_file", default="", metavar="FILE",
+                        help="file with one forbidden path prefix per line")
+    parser.add_argument("--file-types", choices=FileTypes2Copy().file_types, default='images',
+                        help="the file types to collect (default: images)")
+    parser.add_argument("--extensions", default="", metavar="EXT,EXT",
+                        help="comma separated file extensions to collect instead of --file-types (e.g. .jpg,.png)")
+    parser.add_argument("--min-size-kb", dest="min_file_size_kb", type=int, default=0,
+                        help="skip files smaller than this size in KB")
+    parser.add_argument("--hash-workers", type=int, default=None, help="number of hashing threads")
+    parser.add_argument("--copy-workers", type=int, default=2, help="number of copying threads")
+    parser.add_argument("--hash-algorithm", choices=available_hash_algorithms(), default=None,
+                        help="hash algorithm for a new target folder, or when rebuilding the hash list (default: the fastest available)")
+    parser.add_argument("--layout", choices=LAYOUT_NAMES, default=None,
+                        help="layout for a new target folder, or when rebuilding the hash list (default: flat)")
+    parser.add_argument("--bucket-size", type=int, default=DEFAULT_BUCKET_SIZE,
+                        help=f"number of files per folder of the bucket layout (default: {DEFAULT_BUCKET_SIZE})")
+    parser.add_argument("--transfer", dest="transfer_strategy", choices=TRANSFER_STRATEGIES, default=DEFAULT_TRANSFER_STRATEGY,
+                        help="how files are transferred: buffered copy, kernel copy, reflink (copy-on-write clone) or hard link "
+                             f"(default: {DEFAULT_TRANSFER_STRATEGY}); falls back to a buffered copy where not supported")
+    parser.add_argument("--no-device-scheduling", dest="device_scheduling", action="store_false",
+                        help="use shared worker pools instead of per-device workers and I/O limits")
+    parser.add_argument("--hdd-workers", dest="rotational_workers", type=int, default=DEFAULT_ROTATIONAL_WORKERS,
+                        help=f"concurrent reads and writes per spinning disk (default: {DEFAULT_ROTATIONAL_WORKERS})")
+    parser.add_argument("--max-read-mb-s", type=float, default=None,
+                        help="limit the read bandwidth per source device (MB/s)")
+    parser.add_argument("--near-duplicates", action="store_true",
+                        help="also skip images that are near-duplicates of images in the target folder (resized, recompressed "
+                             "or without EXIF data); needs Pillow")
+    parser.add_argument("--perceptual-hash", dest="perceptual_algorithm", choices=PERCEPTUAL_ALGORITHMS, default=DEFAULT_PERCEPTUAL_ALGORITHM,
+                        help=f"perceptual hash for --near-duplicates (default: {DEFAULT_PERCEPTUAL_ALGORITHM}; phash needs numpy)")
+    parser.add_argument("--near-duplicate-threshold", type=near_duplicate_threshold, default=DEFAULT_NEAR_DUPLICATE_THRESHOLD,
+                        help=f"largest number of differing bits (of 64) for a near-duplicate (default: {DEFAULT_NEAR_DUPLICATE_THRESHOLD})")
+    parser.add_argument("--archives", dest="scan_archives", action="store_true",
+                        help="also collect the files in ZIP and TAR archives (.zip, .tar, .tar.gz, ...) in the source folders, "
+                             "without extracting them")
+    parser.add_argument("--rebuild-hash-list", dest="update_hash_list_from_scratch", action="store_true",
+                        help="update the hash list of the target folder from scratch")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only process files that are new or changed since the last finished run of the same job")
+    parser.add_argument("--no-resume", dest="resume", action="store_false",
+                        help="start over instead of resuming an interrupted run of the same job")
+    parser.add_argument("--log-format", choices=LOG_FORMATS, default=DEFAULT_LOG_FORMAT,
+                        help=f"format of the log of the run in the log_files folder (default: {DEFAULT_LOG_FORMAT}); "
+                             "the summary is written to a .summary.json file next to it")
+    parser.add_argument("--log-compression", choices=LOG_COMPRESSIONS, default=None,
+                        help="compress the log while it is written (zstd needs Python 3.14 or the zstandard package)")
+    parser.add_argument("--log-rotate-mb", type=float, default=None,
+                        help="start a new part of the log after this many MB")
+    parser.add_argument("--metrics-jsonl", dest="metrics_file", default=None, metavar="FILE",
+                        help="append the metrics of the run (time, bytes and latencies per phase) to a JSON lines file")
+    parser.add_argument("--prometheus-textfile", default=None, metavar="FILE",
+                        help="write the metrics of the run to a Prometheus textfile (for the node_exporter textfile collector)")
+    parser.add_argument("--profile", dest="profile_file", default=None, metavar="FILE",
+                        help="profile the run with cProfile (all threads) and save the statistics to a file (see python -m pstats)")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="trace the memory allocations of the run (peak memory and top allocating lines in the metrics)")
+    parser.add_argument("--json", dest="json_output", action="store_true",
+                        help="print a JSON summary of the run to stdout")
+    parser.add_argument("--quiet", action="store_true", help="do not show the progress on stderr")
+    return parser
+
+
+def near_duplicate_threshold(text: str) -> int:
+    # Argument type of --near-duplicate-threshold: a number of bits from 0 to 63.
+    try:
+        threshold = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid number: '{text}'")
+    if not 0 <= threshold < PERCEPTUAL_HASH_BITS:
+        raise argparse.ArgumentTypeError(f"must be between 0 and {PERCEPTUAL_HASH_BITS - 1}")
+    return threshold
+
+
+def parse_extensions(extensions_text: str) -> tuple:
+    # Return the extensions as a tuple of lower case extensions starting with a dot.
+    extensions = []
+    for extension in extensions_text.split(','):
+        extension = extension.strip().lower()
+        if extension:
+            extensions.append(extension if extension.startswith('.') else f".{extension}")
+    return tuple(extensions)
+
+
+def main(argv=None) -> int:
+    parser = build_argument_parser()
+    args = parser.parse_args(argv)
+    if args.batch_file:
+        if args.source_folders or args.target_folder:
+            parser.error("--batch can not be combined with --source and --target")
+        return run_batch(args)
+    if not args.source_folders or not args.target_folder:
+        parser.error("--source and --target are required (or --batch)")
+
+    settings = CollectorSettings(source_folders=args.source_folders,
+                                 target_folder=args.target_folder,
+                                 forbidden_paths_file=args.forbidden_paths_file,
+                                 file_types=args.file_types,
+                                 extensions=parse_extensions(args.extensions),
+                                 min_file_size_kb=args.min_file_size_kb,
+                                 hash_workers=args.hash_workers,
+                                 copy_workers=args.copy_workers,
+                                 update_hash_list_from_scratch=args.update_hash_list_from_scratch,
+                                 hash_algorithm=args.hash_algorithm,
+                                 layout=args.layout,
+                                 bucket_size=args.bucket_size,
+                                 resume=args.resume,
+                                 incremental=args.incremental,
+                                 transfer_strategy=args.transfer_strategy,
+                                 device_scheduling=args.device_scheduling,
+                                 rotational_workers=args.rotational_workers,
+                                 max_read_mb_s=args.max_read_mb_s,
+                                 near_duplicates=args.near_duplicates,
+                                 perceptual_algorithm=args.perceptual_algorithm,
+                                 near_duplicate_threshold=args.near_duplicate_threshold,
+                                 scan_archives=args.scan_archives,
+                                 metrics_file=args.metrics_file,
+                                 prometheus_textfile=args.prometheus_textfile,
+                                 profile_file=args.profile_file,
+                                 trace_memory=args.trace_memory,
+                                 log_format=args.log_format,
+                                 log_compression=args.log_compression,
+                                 log_rotate_mb=args.log_rotate_mb)
+
+    progress_bus = ProgressBus()
+    progress_renderer = start_progress_renderer(args, progress_bus)
+
+    try:
+        # Keep stdout clean for the JSON summary: warnings printed during the run go to stderr.
+        with contextlib.redirect_stdout(sys.stderr if args.json_output else sys.stdout):
+            summary = ImageCollector(settings, progress_bus).run()
+    except NotADirectoryError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        if progress_renderer is not None:
+            progress_renderer.stop()
+
+    if args.json_output:
+        print(json.dumps(summary.to_dict(), indent=2))
+    elif not args.quiet and progress_renderer is None:
+        # The progress renderer already showed the summary on stderr.
+        print(summary.summary_text)
+
+    return 1 if summary.error_count else 0
+
+
+def start_progress_renderer(args, progress_bus: ProgressBus) -> TtyProgressRenderer:
+    # Show the progress on stderr if it is a terminal (unless --quiet).
+    # Return the started renderer, or None.
+    if args.quiet or not sys.stderr.isatty():
+        return None
+    progress_renderer = TtyProgressRenderer(progress_bus)
+    progress_renderer.start()
+    return progress_renderer
+
+
+def run_batch(args) -> int:
+    try:
+        batch_settings = load_batch_file(args.batch_file)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+    progress_bus = ProgressBus()
+    progress_renderer = start_progress_renderer(args, progress_bus)
+
+    try:
+        # Keep stdout clean for the JSON summary: warnings printed during the run go to stderr.
+        with contextlib.redirect_stdout(sys.stderr if args.json_output else sys.stdout):
+            summary = BatchRunner(batch_settings, progress_bus).run()
+    except (NotADirectoryError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        if progress_renderer is not None:
+            progress_renderer.stop()
+
+    if args.json_output:
+        print(json.dumps(summary.to_dict(), indent=2))
+    elif not args.quiet and progress_renderer is None:
+        # The progress renderer already showed the summaries on stderr (failed jobs were reported as warnings).
+        for job in summary.jobs:
+            if job['summary'] is not None:
+                print(job['summary'].summary_text)
+
+    return 1 if summary.error_count or summary.failed_job_count else 0
@@ -0,0 +1,799 @@
+import os
+import time
+import datetime
+import threading
+import contextlib
+from Helpers.byte_unit_converter import format_unit_4_byte_size
+from Helpers.hash_backends import HashError, get_hash_backend, hash_file
+from Helpers.digest_store import read_digest_file
+from Helpers.hash_journal import load_journal_records
+from Helpers.parallel_copy_engine import ParallelCopyEngine, default_hash_workers
+from Helpers.target_index import HASH_FOLDER_NAME, TargetIndex
+from Helpers.size_index import Crc32Hash
+from Helpers.target_layout import DEFAULT_BUCKET_SIZE, DEFAULT_LAYOUT, TargetLayout, create_target_layout, list_target_files
+from Helpers.source_scanner import ForbiddenPathMatcher, ScanRecord, read_forbidden_paths, scan_source
+from Helpers.pipeline import iterate_in_thread, merge_in_threads
+from Helpers.io_scheduler import DEFAULT_ROTATIONAL_WORKERS, IOScheduler, device_of
+from Helpers.progress_bus import ProgressBus
+from Helpers.hashing_copy import commit_temp_file, discard_temp_file, remove_stale_temp_files
+from Helpers.file_transfer import DEFAULT_TRANSFER_STRATEGY, FileTransfer
+from Helpers.run_journal import RUN_JOURNAL_FILE_NAME, RunJournal
+from Helpers.source_snapshot import SNAPSHOT_FILE_NAME, SourceSnapshot
+from Helpers.perceptual_hash import DEFAULT_PERCEPTUAL_ALGORITHM, available_perceptual_algorithms, perceptual_hash_file
+from Helpers.perceptual_index import DEFAULT_NEAR_DUPLICATE_THRESHOLD, PERCEPTUAL_INDEX_FILE_NAME, PerceptualIndex
+from Helpers.run_metrics import RunMetrics, RunProfiler
+from Helpers.run_log import DEFAULT_LOG_FORMAT, RunLogWriter, write_summary_file
+from Helpers.archive_source import ArchiveMember, ArchiveScanner
+
+# The core of jl{ImageCollector}: copy images from one or more source folders and all their
+# subfolders to a target folder, skipping files that are already in the target folder.
+#
+# This module does not depend on any user interface. The progress of a run is posted to a
+# ProgressBus, which is shown by the GUI (Development/jl_image_collector.py) or on a terminal
+# by the command line interface (python -m ImageCollector).
+#
+# Every run collects metrics (time, bytes and latency histograms per phase, see run_metrics.py),
+# which are returned in the RunSummary and can be written as JSON lines or a Prometheus textfile.
+#
+# Optionally the ZIP and TAR archives in the source folders are read as folders (see
+# archive_source.py): the files in them are hashed and copied straight from the archives.
+#
+# A collector can also run as a job of a batch run (see batch.py): the target folder is then
+# opened by the batch, duplicates are checked against the shared index of all target folders,
+# and the scans, hashes and workers are shared with the other jobs.
+
+
+# Define the folders to avoid.
+FOLDERS_2_AVOID = ('__pycache__', 'node_modules', 'venv', '.git', '.vscode', '.idea', 'dist', 'build', 'cache', 'logs', 'temp',
+                   'tmp', 'thumbs', 'thumbnails', 'thumbs.db', 'desktop.ini', 'thumbs.db:encryptable', 'thumbs.db:encryptable$')
+
+LOG_FOLDER_NAME = "log_files"
+
+# The status of each result in the log file.
+LOG_STATUSES = {
+    'Copied': 'copied',
+    'Duplicate': 'duplicate',
+    'Near duplicate': 'near_duplicate',
+    'Too small': 'too_small',
+}
+
+
+class FileTypes2Copy:
+    # This class is used to store the file types that can be selected.
+
+    def __init__(self):
+        super().__init__()
+
+        # Define the possible file extensions.
+
+        images = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif', '.webp', '.esp', '.raw', '.cr2', '.nef', '.orf', '.sr2', '.heic')
+
+        videos = ('.mp4', '.avi', '.mov', '.thm', '.wmv', '.flv', '.webm', '.mkv', '.m4v', '.mpg', '.mpeg', '.3gp', '.3g2', '.mxf',
+                '.mts', '.m2ts', '.ts', '.vob', '.m2v', '.asf', '.rm', '.rmvb', '.ogv', '.ogm', '.ogx', '.qt', '.divx', '.xvid')
+
+        # Define the possible file types.
+        types_texts = ('images', 'videos', 'images and videos')
+
+        # Define the file type dictionary.
+        file_type_dict = {
+                            types_texts[0] : images,
+                            types_texts[1] : videos,
+                            types_texts[2] : images + videos
+                        }
+
+        # Set the values for the class properties.
+        self._file_types = types_texts
+        self._file_types_extentions = file_type_dict
+
+    @property
+    def file_types(self) -> tuple:
+        return self._file_types
+
+    @property
+    def file_types_extentions(self) -> dict:
+        return self._file_types_extentions
+
+
+# The images checked for near-duplicates (files that Pillow can not decode, like raw camera files, are skipped).
+PERCEPTUAL_EXTENSIONS = FileTypes2Copy().file_types_extentions['images']
+
+
+def md5(file_path: str) -> str:
+    # Calculate the MD5 hash of a file.
+    # Return the MD5 hash as a string. Raise a HashError if the file can not be read.
+    return hash_file(file_path, get_hash_backend('md5'))
+
+
+def read_hashes_from_file(file_path: str) -> set:
+    # Read the hashes from a hash journal file, together with the hashes that were merged into
+    # the digest file next to it (digests.bin).
+    # Return a set with the hashes.
+    hashes = set()
+    try:
+        hashes, _, _, _ = load_journal_records(file_path)
+        hashes |= read_digest_file(os.path.join(os.path.dirname(file_path), "digests.bin"))
+    except FileNotFoundError:
+        print(f"Warning: Hash file not found: {file_path}")
+    except PermissionError as e:
+        print(f"Warning: Could not read hashes from file '{file_path}'. Error: {e}")
+    return hashes
+
+
+def find_files_in_folder(source_folder: str, extensions, forbidden_paths_file: str, folders_2_avoid: list=[], progress_callback=None,
+                         snapshot: SourceSnapshot=None, order_by_inode: bool=False, archive_scanner: ArchiveScanner=None):
+    # Find all files in a folder and its subfolders that match the specified extensions.
+    # Avoid folders that are in the folders_2_avoid list (including their subfolders).
+    # Avoid files that have a path starting with any of the forbidden paths in the database file.
+    # With a source snapshot, only files that are new or changed since the last run are found.
+    # With an archive scanner, the files in the archives in the folders are found too (as ArchiveMember records).
+    # Yield a ScanRecord (path, size and modification time) for each file found.
+
+    # Read the forbidden paths from the database file and build a matcher for them.
+    forbidden_path_matcher = ForbiddenPathMatcher(read_forbidden_paths(forbidden_paths_file) if forbidden_paths_file else ())
+
+    yield from scan_source(source_folder, extensions, forbidden_path_matcher, folders_2_avoid, progress_callback, snapshot, order_by_inode,
+                           archive_scanner)
+
+
+def check_file_size(record: ScanRecord, min_file_size_kb: int=0) -> str:
+    # Check if the file is larger than the minimum file size.
+    # Return 'Too small' if it is not, else None.
+    file_size_kb = record.size / 1024
+    if (min_file_size_kb > 0 and file_size_kb >= min_file_size_kb) or (min_file_size_kb == 0 and file_size_kb > 0):
+        return None
+    return 'Too small'
+
+
+def full_hash(record: ScanRecord, target_index: TargetIndex) -> str:
+    # Calculate the hash of a file (or a file in an archive) with the hash algorithm of the target folder.
+    # Raise a HashError if the file can not be read.
+    if isinstance(record, ArchiveMember):
+        with record.open() as f:
+            return target_index.hash_file_object(f, record.path)
+    return target_index.hash_file(record.path, record.size)
+
+
+def staged_hash(record: ScanRecord, target_index: TargetIndex) -> str:
+    # Staged duplicate check: compare the size and the partial hash of the file with the files in
+    # the target folder first, and only calculate the full hash if they match.
+    # For a file in an archive the size and the CRC-32 stored in the archive (zip) are compared instead
+    # (reading its last block means decompressing all of it).
+    # Return the hash, or None if the file is known to be new.
+    if isinstance(record, ArchiveMember):
+        if not target_index.needs_full_hash(None, record.size, record.crc):
+            return None
+    elif not target_index.needs_full_hash(record.path, record.size):
+        return None
+    return full_hash(record, target_index)
+
+
+def copy_file_to_target(file, target_layout: TargetLayout, file_hash: str, claim, target_index: TargetIndex,
+                        file_transfer: FileTransfer=None) -> tuple:
+    # Copy the file to a unique destination filename in the target folder (in the folder chosen by the layout).
+    # The file is read once: it is copied to a temporary file in the target folder, and if the hash
+    # of the file is not known yet (new according to the size index), it is calculated in the same
+    # pass and claimed with the claim function. The temporary file gets its final name if the claim
+    # succeeds, and is removed if the file turns out to be a duplicate.
+    # With a file transfer strategy that does not pass the data through Python (kernel copy, reflink
+    # or hard link), the hash is calculated and claimed before the file is transferred.
+    # Return a tuple with a string with the status of the copy operation and the hash of the file.
+    if file_transfer is None:
+        file_transfer = FileTransfer()
+    target_folder = target_layout.target_folder
+
+    try:
+        if file_hash is None and not file_transfer.hashes_while_copying(file, target_folder):
+            file_hash = target_index.hash_file(file)
+            if not claim(file_hash):
+                return ('Duplicate', file_hash)
+    except (HashError, OSError) as e:
+        return (f"Error hashing: {e}", file_hash)
+
+    try:
+        # The CRC-32 of the copy is recorded in the target index (see size_index.py): it is calculated
+        # in the same pass as the hash, or taken from the archive.
+        hash_object = Crc32Hash(target_index.new_hash()) if file_hash is None else None
+        temp_file_path = file_transfer.transfer(file, target_folder, hash_object)
+    except Exception as e:
+        return (f"Error copying: {e}", file_hash)
+
+    crc = file.crc if isinstance(file, ArchiveMember) else None
+    if file_hash is None:
+        file_hash = hash_object.hexdigest()
+        crc = hash_object.crc
+        if not claim(file_hash):
+            discard_temp_file(temp_file_path)
+            return ('Duplicate', file_hash)
+
+    try:
+        destination_file = target_layout.destination_path(file, file_hash)
+        commit_temp_file(temp_file_path, destination_file)
+        target_layout.file_committed(destination_file)
+        target_index.add_file(destination_file, file_hash, crc)
+        return ('Copied', file_hash)
+    except Exception as e:
+        discard_temp_file(temp_file_path)
+        return (f"Error copying: {e}", file_hash)
+
+
+def copy_file_if_unique(file, target_folder: str, target_index: TargetIndex, target_layout: TargetLayout=None) -> str:
+    # Check if the file is unique (not already in the target folder) and copy it if it is.
+    # Return a string with the status of the copy operation.
+    if target_layout is None:
+        target_layout = create_target_layout(target_index.layout_name, target_folder)
+
+    # Get the hash of the file.
+    try:
+        file_hash = target_index.hash_file(file)
+    except HashError as e:
+        return f"Error hashing: {e}"
+
+    # Check if the file is unique - if it is, copy it to the target folder.
+    if file_hash not in target_index:
+        copy_result, _ = copy_file_to_target(file, target_layout, file_hash, None, target_index)
+        if copy_result == 'Copied':
+            target_index.add(file_hash) # Update the hash list (appended to the hash file).
+        return copy_result
+    else:
+        return 'Duplicate'
+
+
+class CollectorSettings:
+    # This class is used to store the settings of a collection run.
+
+    def __init__(self, source_folders, target_folder: str, forbidden_paths_file: str="", file_types: str='images',
+                 extensions=None, min_file_size_kb: int=0, hash_workers: int=None, copy_workers: int=2,
+                 update_hash_list_from_scratch: bool=False, folders_2_avoid=FOLDERS_2_AVOID, hash_algorithm: str=None,
+                 layout: str=None, bucket_size: int=DEFAULT_BUCKET_SIZE, resume: bool=True, incremental: bool=False,
+                 transfer_strategy: str=DEFAULT_TRANSFER_STRATEGY, device_scheduling: bool=True,
+                 rotational_workers: int=DEFAULT_ROTATIONAL_WORKERS, max_read_mb_s: float=None, near_duplicates: bool=False,
+                 perceptual_algorithm: str=DEFAULT_PERCEPTUAL_ALGORITHM, near_duplicate_threshold: int=DEFAULT_NEAR_DUPLICATE_THRESHOLD,
+                 metrics_file: str=None, prometheus_textfile: str=None, profile_file: str=None, trace_memory: bool=False,
+                 log_format: str=DEFAULT_LOG_FORMAT, log_compression: str=None, log_rotate_mb: float=None,
+                 scan_archives: bool=False):
+        super().__init__()
+        if isinstance(source_folders, str):
+            source_folders = [source_folders]
+        self.source_folders = list(source_folders)
+        self.target_folder = target_folder
+        self.forbidden_paths_file = forbidden_paths_file
+        self.file_types = file_types
+        # The extensions default to the extensions of the selected file types ('images', 'videos', 'images and videos').
+        self.extensions = tuple(extensions) if extensions else FileTypes2Copy().file_types_extentions[file_types]
+        self.min_file_size_kb = min_file_size_kb
+        self.hash_workers = hash_workers or default_hash_workers()
+        self.copy_workers = copy_workers
+        self.update_hash_list_from_scratch = update_hash_list_from_scratch
+        self.folders_2_avoid = tuple(folders_2_avoid)
+        # The hash algorithm for a new target folder (default: the fastest available). An existing
+        # target folder keeps its hash algorithm unless the hash list is updated from scratch.
+        self.hash_algorithm = hash_algorithm
+        # The layout for a new target folder ('flat', 'date', 'hash' or 'bucket', default: flat) and the
+        # number of files per folder of the bucket layout. An existing target folder keeps its layout
+        # unless the hash list is updated from scratch.
+        self.layout = layout
+        self.bucket_size = bucket_size
+        # Resume an interrupted run of the same job (files completed by that run are not hashed again).
+        self.resume = resume
+        # Incremental run: only process the files that are new or changed since the last finished run.
+        self.incremental = incremental
+        # How files are transferred to the target folder ('copy', 'kernel', 'reflink' or 'hardlink').
+        self.transfer_strategy = transfer_strategy
+        # Per-device scheduling of the reads and writes: the number of workers for a spinning disk, and an
+        # optional limit of the read bandwidth per device (MB/s).
+        self.device_scheduling = device_scheduling
+        self.rotational_workers = rotational_workers
+        self.max_read_mb_s = max_read_mb_s
+        # Skip images that are near-duplicates of images in the target folder (resized, recompressed or without
+        # EXIF data): the perceptual hash algorithm ('dhash' or 'phash') and the largest Hamming distance (bits).
+        self.near_duplicates = near_duplicates
+        self.perceptual_algorithm = perceptual_algorithm
+        self.near_duplicate_threshold = near_duplicate_threshold
+        # Where to write the metrics of the run: a JSON lines file (appended) and/or a Prometheus textfile (replaced).
+        self.metrics_file = metrics_file
+        self.prometheus_textfile = prometheus_textfile
+        # Opt-in profiling of the run: a cProfile statistics file for all threads, and/or tracing the memory allocations.
+        self.profile_file = profile_file
+        self.trace_memory = trace_memory
+        # The log of the run: 'jsonl', 'csv' or 'text', optionally compressed ('gzip' or 'zstd') and rotated
+        # into parts of about log_rotate_mb MB.
+        self.log_format = log_format
+        self.log_compression = log_compression
+        self.log_rotate_mb = log_rotate_mb
+        # Also collect the files in the ZIP and TAR archives (.zip, .tar, .tar.gz, ...) in the source folders.
+        self.scan_archives = scan_archives
+
+    def job_description(self) -> dict:
+        # Return the settings that identify the job, used to recognize an interrupted run of the same job.
+        job = {
+            'source_folders': [os.path.abspath(folder) for folder in self.source_folders],
+            'extensions': list(self.extensions),
+            'forbidden_paths_file': self.forbidden_paths_file,
+            'min_file_size_kb': self.min_file_size_kb,
+            'folders_2_avoid': list(self.folders_2_avoid),
+        }
+        if self.scan_archives:
+            job['scan_archives'] = True
+        return job
+
+
+class RunSummary:
+    # This class is used to store the outcome of a collection run.
+
+    def __init__(self):
+        super().__init__()
+        self.files_found = 0
+        self.bytes_found = 0
+        self.copied_count = 0
+        self.bytes_copied = 0
+        self.skipped_count = 0
+        self.near_duplicate_count = 0
+        self.error_count = 0
+        self.resumed_count = 0
+        self.unchanged_count = 0
+        self.log_file_path = ""
+        self.log_file_paths = []
+        self.summary_file_path = ""
+        self.summary_text = ""
+        self.metrics = None
+        self.start_time = None
+        self.end_time = None
+
+    def to_dict(self) -> dict:
+        return {
+            'files_found': self.files_found,
+            'bytes_found': self.bytes_found,
+            'copied': self.copied_count,
+            'bytes_copied': self.bytes_copied,
+            'skipped': self.skipped_count,
+            'near_duplicates': self.near_duplicate_count,
+            'errors': self.error_count,
+            'resumed': self.resumed_count,
+            'unchanged': self.unchanged_count,
+            'log_file': self.log_file_path,
+            'log_files': self.log_file_paths,
+            'summary_file': self.summary_file_path,
+            'start_time': self.start_time.isoformat() if self.start_time else None,
+            'end_time': self.end_time.isoformat() if self.end_time else None,
+            'metrics': self.metrics,
+        }
+
+
+def prepare_target(settings: CollectorSettings, metrics: RunMetrics, progress_bus: ProgressBus) -> tuple:
+    # Remove the incomplete copies left in the target folder, open its index and harvest the hashes of
+    # the files in it if the hash list is updated from scratch or there is none yet.
+    # Return a tuple with the TargetIndex (to be closed by the caller) and the TargetLayout.
+    target_folder = settings.target_folder
+
+    # Remove the incomplete copies left behind by an interrupted run (copies only get their final name when complete).
+    removed_count = remove_stale_temp_files(target_folder)
+    if removed_count:
+        progress_bus.post_log_text(f"Removed {removed_count} incomplete copies left behind by an interrupted run.")
+
+    # Update the log text panel with the initial status text.
+    progress_bus.post_log_text("Harvesting file hashes for files already in the target folder...")
+
+    # Open the index of the target folder (hash journal, size index and catalog in the hashes folder).
+    # New hashes are appended to the hash journal, so the cost of saving a hash does not grow with
+    # the number of files in the target folder.
+    target_index = TargetIndex(target_folder, settings.hash_algorithm, settings.update_hash_list_from_scratch, settings.layout, metrics)
+    try:
+        target_layout = create_target_layout(target_index.layout_name, target_folder, settings.bucket_size)
+
+        # Check if the user wants to update the hash list from scratch, or if there is no hash list yet.
+        if settings.update_hash_list_from_scratch or not target_index:
+            # Get all files in the target folder (including the subfolders of a sharded layout).
+            recursive = target_layout.sharded or target_index.previous_layout_name != DEFAULT_LAYOUT
+            with metrics.timer('harvest_list'):
+                target_files = list_target_files(target_folder, settings.extensions, recursive, (HASH_FOLDER_NAME, LOG_FOLDER_NAME))
+            # Validate the catalog of the target folder: only files that are new or changed since the last
+            # time are hashed, and hashes of files removed from the target folder are dropped.
+            with metrics.timer('harvest'):
+                target_index.rebuild(target_files,
+                                     lambda index, total, file: progress_bus.post_progress(index, total, f"- {target_index.hash_backend.name} hash", file))
+    except BaseException:
+        target_index.close()
+        raise
+    return (target_index, target_layout)
+
+
+class ImageCollector:
+    # This class is used to run a collection: copy the files from the source folders to the
+    # target folder, skipping duplicates, and write a log file to the target folder.
+    # batch: the BatchContext of the batch run the collection is a job of (see batch.py), or None.
+
+    def __init__(self, settings: CollectorSettings, progress_bus: ProgressBus=None, batch=None):
+        super().__init__()
+        self._settings = settings
+        self._progress_bus = progress_bus if progress_bus is not None else ProgressBus()
+        self._metrics = RunMetrics()
+        self._batch = batch
+
+    @property
+    def settings(self) -> CollectorSettings:
+        return self._settings
+
+    @property
+    def progress_bus(self) -> ProgressBus:
+        return self._progress_bus
+
+    @property
+    def metrics(self) -> RunMetrics:
+        # The metrics of the last run.
+        return self._metrics
+
+    def run(self) -> RunSummary:
+        # Run the collection.
+        # Return a RunSummary with the counters and metrics of the run.
+        settings = self._settings
+        metrics = self._metrics = RunMetrics()
+
+        with RunProfiler(metrics, settings.profile_file, settings.trace_memory):
+            summary = self._run()
+
+        for counter, count in (('files_found', summary.files_found), ('files_copied', summary.copied_count),
+                               ('files_skipped', summary.skipped_count), ('files_near_duplicate', summary.near_duplicate_count),
+                               ('files_failed', summary.error_count), ('files_resumed', summary.resumed_count),
+                               ('files_unchanged', summary.unchanged_count)):
+            metrics.count(counter, count)
+        summary.metrics = metrics.to_dict()
+
+        # Write the summary next to the log (the log itself is complete and is not touched again).
+        try:
+            write_summary_file(summary.summary_file_path, {'summary': summary.summary_text, **summary.to_dict(),
+                                                           'log_format': settings.log_format})
+        except OSError as e:
+            print(f"Warning: Could not write the summary file '{summary.summary_file_path}'. Error: {e}")
+        run_info = {'source_folders': settings.source_folders, 'target_folder': settings.target_folder}
+        try:
+            if settings.metrics_file:
+                metrics.write_json_lines(settings.metrics_file, run_info)
+            if settings.prometheus_textfile:
+                metrics.write_prometheus_textfile(settings.prometheus_textfile, {'target': settings.target_folder})
+        except OSError as e:
+            print(f"Warning: Could not write the metrics of the run. Error: {e}")
+        return summary
+
+    def _run(self) -> RunSummary:
+        settings = self._settings
+        metrics = self._metrics
+        progress_bus = self._progress_bus
+        target_folder = settings.target_folder
+
+        # Check if source and target folders are valid directories.
+        for folder in settings.source_folders + [target_folder]:
+            if not os.path.isdir(folder):
+                raise NotADirectoryError(f"Not a valid directory: {folder}")
+
+        summary = RunSummary()
+        summary.start_time = datetime.datetime.now()
+        progress_bus.post_reset("Initializing...")
+
+        # In a batch run, the target folder was prepared by the batch (and its index is closed by the batch).
+        if self._batch is None:
+            target_index, target_layout = prepare_target(settings, metrics, progress_bus)
+        else:
+            target_index, target_layout = self._batch.target(target_folder)
+        try:
+            perceptual_index = self._open_perceptual_index(target_index)
+            try:
+                self._copy_files(target_index, target_layout, perceptual_index, summary)
+            finally:
+                if perceptual_index is not None:
+                    perceptual_index.close()
+        finally:
+            # Close the target index (flushes the last hashes to the disk and compacts the files if needed).
+            if self._batch is None:
+                target_index.close()
+
+        summary.end_time = datetime.datetime.now()
+
+        # Update the end time (and re-enable the Start Copy button in the GUI).
+        progress_bus.post_finished(f"End time:  {summary.end_time.strftime('%d.%m.%Y %H:%M:%S')}")
+        return summary
+
+    def _open_perceptual_index(self, target_index: TargetIndex) -> PerceptualIndex:
+        # Open the perceptual hash index of the target folder for the near-duplicate check, and hash the
+        # images in the target folder that are not in it yet (copied by runs without the near-duplicate check).
+        # Return None if the near-duplicate check is off or can not be used.
+        settings = self._settings
+        progress_bus = self._progress_bus
+        if not settings.near_duplicates:
+            return None
+        if settings.perceptual_algorithm not in available_perceptual_algorithms():
+            print(f"Warning: The perceptual hash algorithm '{settings.perceptual_algorithm}' is not available "
+                  f"(it needs Pillow{' and numpy' if settings.perceptual_algorithm == 'phash' else ''}). "
+                  f"Near-duplicates are not checked.")
+            return None
+
+        perceptual_index = PerceptualIndex(os.path.join(target_index.hash_folder_path, PERCEPTUAL_INDEX_FILE_NAME),
+                                           settings.perceptual_algorithm, settings.near_duplicate_threshold)
+        # The index holds a record for every file of the catalog (also files that are not images or can not be
+        # decoded), so it is in sync when it covers exactly the files of the catalog.
+        catalog_entries = target_index.catalog.entries().values()
+        if not perceptual_index.is_synced(catalog_entries):
+            progress_bus.post_log_text("Harvesting perceptual hashes for images already in the target folder...")
+            with self._metrics.timer('perceptual_harvest'):
+                perceptual_index.sync(target_index.target_folder, catalog_entries, PERCEPTUAL_EXTENSIONS,
+                                      settings.hash_workers,
+                                      lambda index, total, file: progress_bus.post_progress(index, total, f"- {settings.perceptual_algorithm}", file))
+        return perceptual_index
+
+    def _copy_files(self, target_index: TargetIndex, target_layout: TargetLayout, perceptual_index: PerceptualIndex, summary: RunSummary):
+        settings = self._settings
+        progress_bus = self._progress_bus
+        metrics = self._metrics
+        target_folder = settings.target_folder
+        file_types_text = settings.file_types
+        source_folders_text = ", ".join(settings.source_folders)
+
+        # Create a log folder in the target folder
+        log_folder_path = os.path.join(target_folder, LOG_FOLDER_NAME)
+        os.makedirs(log_folder_path, exist_ok=True)  # Create the log_files folder if it doesn't exist
+        # Create a log file name with a timestamp
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        # Save the log file in the log_files folder (streamed: one record per file, the summary goes to a sidecar file)
+        run_log = RunLogWriter(log_folder_path, f"Files_processed_{timestamp}", settings.log_format, settings.log_compression,
+                               int(settings.log_rotate_mb * 1024 * 1024) if settings.log_rotate_mb else None)
+        summary.log_file_path = run_log.file_paths[0]
+        summary.summary_file_path = run_log.summary_file_path
+
+        # Update the log text panel
+        progress_bus.post_log_text(f"Scanning and copying {file_types_text} from {source_folders_text}...")
+
+        # Open the run journal. If an earlier run of the same job was interrupted, the files it completed
+        # get their earlier result without being hashed or copied again.
+        # Copied and duplicate files are only resumed if their hash is in the target folder.
+        run_journal = RunJournal(os.path.join(target_index.hash_folder_path, RUN_JOURNAL_FILE_NAME),
+                                 settings.job_description(), settings.resume, target_hashes=target_index)
+        summary.resumed_count = run_journal.resumed_count
+        if summary.resumed_count:
+            progress_bus.post_log_text(f"Resuming an interrupted run ({summary.resumed_count} files already done)...")
+
+        # In an incremental run, the snapshot of the last finished run is used to skip unchanged folders and files.
+        snapshot = None
+        if settings.incremental:
+            snapshot = SourceSnapshot(os.path.join(target_index.hash_folder_path, SNAPSHOT_FILE_NAME), settings.job_description())
+
+        # With device scheduling, every source and target device gets its own workers and I/O limits, and
+        # the source folders on different devices are scanned and processed at the same time.
+        # In a batch run, the jobs share the I/O scheduler of the batch, so the limits of a device hold over all jobs.
+        io_scheduler = None
+        own_io_scheduler = False
+        target_device = None
+        if settings.device_scheduling:
+            if self._batch is not None:
+                io_scheduler = self._batch.io_scheduler
+                target_device = device_of(target_folder)
+            else:
+                io_scheduler = IOScheduler(settings.hash_workers, settings.copy_workers, target_folder, settings.rotational_workers,
+                                           settings.max_read_mb_s * 1024 * 1024 if settings.max_read_mb_s else None)
+                own_io_scheduler = True
+
+        # The archives in the source folders are read while the files in them are in the run, and the data
+        # read ahead from compressed archives is kept in the target folder if it does not fit in memory.
+        archive_scanner = ArchiveScanner(target_folder) if settings.scan_archives else None
+
+        # Group the source folders by device (one group without device scheduling).
+        source_groups = {}
+        for source_folder in settings.source_folders:
+            source_groups.setdefault(device_of(source_folder) if io_scheduler else None, []).append(source_folder)
+
+        # Running totals of the files found by the scan stages (updated while the scan is going on).
+        scan_finished = []
+        scan_lock = threading.Lock()
+
+        def scan_stage(device, source_folders):
+            # Scan the source folders and count the files found, so the progress can show the running total.
+            # Each file is recorded in the run journal before it enters the copy engine.
+            # The files on a spinning disk are read in inode order.
+            # The scan time does not include the time the files wait to be taken by the copy engine.
+            order_by_inode = io_scheduler is not None and io_scheduler.is_rotational(device)
+            scan_seconds = 0.0
+            scan_bytes = 0
+            for source_folder in source_folders:
+                start = time.perf_counter()
+                # In a batch run, a source folder that is used by other jobs too is scanned once for all of them.
+                records = self._batch.scan(settings, source_folder, order_by_inode) if self._batch is not None else None
+                if records is None:
+                    records = find_files_in_folder(source_folder, settings.extensions, settings.forbidden_paths_file, settings.folders_2_avoid,
+                                                   snapshot=snapshot, order_by_inode=order_by_inode, archive_scanner=archive_scanner)
+                for record in records:
+                    with scan_lock:
+                        summary.files_found += 1
+                        summary.bytes_found += record.size
+                    if run_journal.completed_result(record) is None:
+                        run_journal.plan(record)
+                    scan_seconds += time.perf_counter() - start
+                    scan_bytes += record.size
+                    yield record
+                    start = time.perf_counter()
+                scan_seconds += time.perf_counter() - start
+            metrics.observe('scan', scan_seconds, scan_bytes)
+            scan_finished.append(True)
+
+        # In a batch run, the hashing and copying of all jobs share a global budget of workers. The worker
+        # slot is always taken before any I/O slot of the I/O scheduler.
+        worker_slot = self._batch.worker_slot if self._batch is not None else contextlib.nullcontext()
+
+        # The digest and the time spent hashing and copying of the files in flight, for the log.
+        file_details = {}
+
+        def note_file(record, file_hash, seconds):
+            digest, total_seconds = file_details.get(record.path, (None, 0.0))
+            file_details[record.path] = (file_hash or digest, total_seconds + seconds)
+
+        def hash_stage(record):
+            def calculate_hash():
+                # The worker slot is taken before the I/O slot of the device, like in the copy stage, so
+                # the two stages never hold one of them while waiting for the other.
+                with worker_slot, io_scheduler.reading(record) if io_scheduler is not None else contextlib.nullcontext():
+                    if self._batch is not None:
+                        # The size index only knows this target folder, so the full hash is needed for the shared index.
+                        return full_hash(record, target_index)
+                    return staged_hash(record, target_index)
+
+            start = time.perf_counter()
+            if self._batch is not None:
+                # The hash of a file found by several jobs is calculated once.
+                file_hash, calculated = self._batch.hash_cache.hash_once(record, calculate_hash)
+                if not calculated:
+                    metrics.count('shared_hash_hits')
+            else:
+                file_hash = calculate_hash()
+            seconds = time.perf_counter() - start
+            if file_hash is None:
+                # Known to be new by the size index: hashed while copying.
+                metrics.observe('precheck', seconds)
+                metrics.count('new_by_size_index')
+            else:
+                metrics.observe('hash', seconds, record.size)
+            note_file(record, file_hash, seconds)
+            return file_hash
+
+        file_transfer = FileTransfer(settings.transfer_strategy)
+
+        def copy_stage(record, file_hash, claim):
+            start = time.perf_counter()
+            with worker_slot:
+                copy_result, file_hash = check_and_copy(record, file_hash, claim)
+            note_file(record, file_hash, time.perf_counter() - start)
+            return (copy_result, file_hash)
+
+        def check_and_copy(record, file_hash, claim):
+            # Near-duplicate check: only files that are not exact duplicates get here, so only new images are decoded.
+            # The perceptual hash is claimed, so two near-duplicates copied at the same time are not both copied.
+            perceptual_hash = None
+            if perceptual_index is not None and os.path.splitext(record.path)[1].lower() in PERCEPTUAL_EXTENSIONS:
+                with io_scheduler.reading(record) if io_scheduler is not None else contextlib.nullcontext(), \
+                     metrics.timer('perceptual_hash', record.size):
+                    if isinstance(record, ArchiveMember):
+                        with record.open() as f:
+                            perceptual_hash = perceptual_hash_file(f, perceptual_index.algorithm)
+                    else:
+                        perceptual_hash = perceptual_hash_file(record.path, perceptual_index.algorithm)
+                if perceptual_hash is not None and perceptual_index.claim(perceptual_hash) is not None:
+                    return ('Near duplicate', file_hash)
+
+            # A copy is recorded as completed as soon as it has its final name, so a resumed run does
+            # not take a file that was copied right before the interruption for a duplicate.
+            run_journal.start(record)
+            with io_scheduler.copying(record, target_device) if io_scheduler is not None else contextlib.nullcontext(), \
+                 metrics.timer('copy', record.size):
+                copy_result, file_hash = copy_file_to_target(record if isinstance(record, ArchiveMember) else record.path, target_layout,
+                                                             file_hash, claim, target_index, file_transfer)
+            if copy_result == 'Copied':
+                run_journal.complete(record, copy_result, file_hash)
+                if perceptual_index is not None:
+                    perceptual_index.add(file_hash, perceptual_hash)
+            elif perceptual_hash is not None:
+                perceptual_index.release(perceptual_hash)
+            return (copy_result, file_hash)
+
+        def precheck_stage(record):
+            return run_journal.completed_result(record) or check_file_size(record, settings.min_file_size_kb)
+
+        # Iteriate through the files and copy them to the target folder while logging the results.
+        run_finished = False
+        try:
+            with run_log:
+
+                # The run is a streaming pipeline: the scan stage runs in its own thread and hands over the
+                # files through a bounded queue, and the copy engine filters, hashes and copies them with a
+                # bounded number of files in flight. Copying starts as soon as the first file is found.
+                # The results come back in the same order as the files were found, so the log file is the
+                # same as for a sequential run.
+                # Files that can not be duplicates according to the size index are copied without hashing first.
+                # With device scheduling, the files of each device are admitted up to a limit, so a slow device does
+                # not fill up the pipeline. With more than one source device the results are logged as they come.
+                if io_scheduler is None:
+                    files = iterate_in_thread(scan_stage(None, settings.source_folders), thread_name="scan")
+                else:
+                    files = merge_in_threads([scan_stage(device, folders) for device, folders in source_groups.items()],
+                                             admit=io_scheduler.admit, thread_name="scan")
+                ordered = len(source_groups) == 1
+                copy_engine = ParallelCopyEngine(hash_func=hash_stage,
+                                                 copy_func=copy_stage,
+                                                 target_hashes=self._batch.target_hashes(target_index) if self._batch is not None else target_index,
+                                                 hash_workers=settings.hash_workers,
+                                                 copy_workers=settings.copy_workers,
+                                                 precheck_func=precheck_stage,
+                                                 max_pending=None if ordered else io_scheduler.max_files_in_flight(),
+                                                 scheduler=io_scheduler,
+                                                 ordered=ordered,
+                                                 claims=self._batch.claims if self._batch is not None else None)
+
+                # Iterate through the results
+                for index, (record, copy_result) in enumerate(copy_engine.run(files)):
+
+                    # Count the result and log it to the log file (with the digest and timing of the file).
+                    f = record.path
+                    log_start = time.perf_counter()
+                    if copy_result == 'Copied':
+                        summary.copied_count += 1
+                        summary.bytes_copied += record.size
+                    elif copy_result in ('Duplicate', 'Near duplicate', 'Too small'):
+                        summary.skipped_count += 1
+                        if copy_result == 'Near duplicate':
+                            summary.near_duplicate_count += 1
+                    else:
+                        # Error copying file
+                        summary.error_count += 1
+                    digest, seconds = file_details.pop(f, (None, None))
+                    status = LOG_STATUSES.get(copy_result, 'error')
+                    run_log.write(f, status, copy_result if status == 'error' else "", record.size, digest, seconds)
+                    metrics.observe('log_write', time.perf_counter() - log_start)
+
+                    if self._batch is not None:
+                        # The hash of a file shared with other jobs is kept until all of them are done with it.
+                        self._batch.hash_cache.release(record)
+
+                    if isinstance(record, ArchiveMember):
+                        # Free the data of a file in an archive read ahead.
+                        record.release()
+
+                    # Update the progress bar and status text (against the running total while the scan is going on).
+                    scanning = len(scan_finished) < len(source_groups)
+                    progress_bus.post_progress(index, summary.files_found, "copying (scanning...)" if scanning else "copying", f)
+
+                    # Record the result in the run journal (and in the snapshot, unless the file has to be tried again).
+                    with metrics.timer('journal_write'):
+                        run_journal.complete(record, copy_result, digest)
+                        if snapshot is not None and copy_result in ('Copied', 'Duplicate', 'Near duplicate', 'Too small'):
+                            snapshot.mark_done(record)
+
+            run_finished = True
+        finally:
+            # The run journal is removed when the run finished, and kept to resume the run otherwise.
+            # The snapshot is only updated when the run finished.
+            if own_io_scheduler:
+                io_scheduler.shutdown()
+            if archive_scanner is not None:
+                archive_scanner.close()
+            run_log.close()
+            summary.log_file_paths = run_log.file_paths
+            run_journal.close(remove=run_finished)
+            if snapshot is not None:
+                summary.unchanged_count = snapshot.unchanged_count
+                snapshot.close(commit=run_finished)
+
+        # Update status text to "Finished!"
+        progress_bus.post_status("Finished!")
+
+        total_files_size_formated = format_unit_4_byte_size(summary.bytes_found)
+        total_bytes_copied = format_unit_4_byte_size(summary.bytes_copied)
+
+        # Create the summary text and update the log text panel.
+        summary.summary_text = f"Found {summary.files_found} {file_types_text} in {source_folders_text}.\n" + \
+                               f"Total of {total_files_size_formated['value']} {total_files_size_formated['unit']}.\n" + \
+                               f"Copied {summary.copied_count} new {file_types_text} to the target folder" + \
+                               f" --> {total_bytes_copied['value']} {total_bytes_copied['unit']} total.\n" + \
+                               f"Skipped {summary.skipped_count} {file_types_text} duplicates.\n" + \
+                               (f"Of these, {summary.near_duplicate_count} were near-duplicates (resized or re-saved copies).\n" if perceptual_index is not None else "") + \
+                               (f"Skipped {summary.unchanged_count} unchanged {file_types_text} (incremental run).\n" if settings.incremental else "") + \
+                               f"Error copying {summary.error_count} {file_types_text}.\n" + \
+                               f"Log file saved to the following file in the target folder --> {os.sep}{LOG_FOLDER_NAME}{os.sep}{os.path.basename(summary.log_file_path)}" + \
+                               (f" (and {len(summary.log_file_paths) - 1} more parts)" if len(summary.log_file_paths) > 1 else "") + \
+                               f", summary in {os.path.basename(summary.summary_file_path)}."
+
+        progress_bus.post_log_text(summary.summary_text)
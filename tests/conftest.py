@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The tests import the Helpers and ImageCollector packages from the repository folder
+# (run them with python -m pytest from the repository folder).
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,103 @@
+import io
+import os
+import tarfile
+import zipfile
+import zlib
+from Helpers.archive_source import ArchiveScanner
+from Helpers.source_scanner import ForbiddenPathMatcher
+
+EXTENSIONS = ('.jpg',)
+
+
+def tar_bytes(files: dict, mode: str='w') -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode=mode) as tar_file:
+        for name, data in files.items():
+            tar_info = tarfile.TarInfo(name)
+            tar_info.size = len(data)
+            tar_file.addfile(tar_info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def zip_bytes(files: dict) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for name, data in files.items():
+            zip_file.writestr(name, data)
+    return buffer.getvalue()
+
+
+def read_members(scanner, archive_path, **options) -> dict:
+    members = {}
+    for member in scanner.scan(str(archive_path), 0, EXTENSIONS, **options):
+        with member.open() as f:
+            members[os.path.relpath(member.path, archive_path)] = f.read()
+        member.release()
+    return members
+
+
+def test_zip_members_with_crc(tmp_path):
+    archive_path = tmp_path / "photos.zip"
+    archive_path.write_bytes(zip_bytes({"a.jpg": b"aaa", "dir/b.jpg": b"bbb", "notes.txt": b"x"}))
+    scanner = ArchiveScanner(str(tmp_path))
+    members = list(scanner.scan(str(archive_path), 0, EXTENSIONS))
+    assert sorted(os.path.relpath(member.path, archive_path) for member in members) == ["a.jpg", os.path.join("dir", "b.jpg")]
+    assert {member.crc for member in members} == {zlib.crc32(b"aaa"), zlib.crc32(b"bbb")}
+    with members[0].open() as f:
+        assert f.read() in (b"aaa", b"bbb")
+    scanner.close()
+
+
+def test_tar_and_compressed_tar(tmp_path):
+    files = {"a.jpg": b"a" * 1000, "sub/b.jpg": b"b" * 10}
+    (tmp_path / "plain.tar").write_bytes(tar_bytes(files))
+    (tmp_path / "packed.tar.gz").write_bytes(tar_bytes(files, 'w:gz'))
+    scanner = ArchiveScanner(str(tmp_path))
+    expected = {"a.jpg": b"a" * 1000, os.path.join("sub", "b.jpg"): b"b" * 10}
+    assert read_members(scanner, tmp_path / "plain.tar") == expected
+    assert read_members(scanner, tmp_path / "packed.tar.gz") == expected
+    scanner.close()
+
+
+def test_spooled_members_beyond_the_memory_budget_use_temp_files(tmp_path):
+    (tmp_path / "packed.tgz").write_bytes(tar_bytes({"a.jpg": b"a" * 1000}, 'w:gz'))
+    spool_folder = tmp_path / "spool"
+    spool_folder.mkdir()
+    scanner = ArchiveScanner(str(spool_folder), spool_memory_budget=10)
+    members = list(scanner.scan(str(tmp_path / "packed.tgz"), 0, EXTENSIONS))
+    assert len(os.listdir(spool_folder)) == 1
+    with members[0].open() as f:
+        assert f.read() == b"a" * 1000
+    scanner.close()
+    assert os.listdir(spool_folder) == []
+
+
+def test_nested_archives(tmp_path):
+    inner_zip = zip_bytes({"deep.jpg": b"deep"})
+    inner_tar = tar_bytes({"inner.zip": inner_zip, "mid.jpg": b"mid"})
+    archive_path = tmp_path / "outer.zip"
+    archive_path.write_bytes(zip_bytes({"inner.tar": inner_tar, "top.jpg": b"top"}))
+    scanner = ArchiveScanner(str(tmp_path))
+    assert read_members(scanner, archive_path) == {
+        "top.jpg": b"top", os.path.join("inner.tar", "mid.jpg"): b"mid", os.path.join("inner.tar", "inner.zip", "deep.jpg"): b"deep"}
+    scanner.close()
+
+
+def test_folders_to_avoid_and_forbidden_paths(tmp_path):
+    archive_path = tmp_path / "photos.zip"
+    archive_path.write_bytes(zip_bytes({"keep/a.jpg": b"a", "cache/b.jpg": b"b", "private/c.jpg": b"c"}))
+    scanner = ArchiveScanner(str(tmp_path))
+    matcher = ForbiddenPathMatcher([os.path.join(str(archive_path), "private")])
+    members = read_members(scanner, archive_path, forbidden_path_matcher=matcher, folders_2_avoid=("cache",))
+    assert members == {os.path.join("keep", "a.jpg"): b"a"}
+    scanner.close()
+
+
+def test_broken_archive_is_skipped(tmp_path, capsys):
+    archive_path = tmp_path / "broken.zip"
+    archive_path.write_bytes(b"not a zip file")
+    scanner = ArchiveScanner(str(tmp_path))
+    assert list(scanner.scan(str(archive_path), 0, EXTENSIONS)) == []
+    assert "Could not read archive" in capsys.readouterr().out
+    scanner.close()
+
@@ -0,0 +1,139 @@
+import os
+import json
+import time
+import threading
+import contextlib
+from ImageCollector import CollectorSettings, ImageCollector
+from ImageCollector.batch import BatchRunner, BatchSettings, load_batch_file
+from Helpers import io_scheduler, shared_scan
+from Helpers.io_scheduler import IOScheduler
+
+
+def make_source(folder, count: int, prefix: str="") -> set:
+    folder.mkdir(parents=True, exist_ok=True)
+    names = set()
+    for index in range(count):
+        name = f"{prefix}{index:05d}.jpg"
+        (folder / name).write_bytes(f"{prefix}{index}".encode() * 10)
+        names.add(name)
+    return names
+
+
+def run_with_timeout(runner: BatchRunner, timeout: float=60):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(runner.run()), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert result, "The batch run did not finish (deadlock)"
+    return result[0]
+
+
+def collected_names(target_folder) -> set:
+    return {name for _, _, names in os.walk(target_folder) for name in names if name.endswith(".jpg")}
+
+
+def test_one_worker_does_not_deadlock(tmp_path):
+    # More copy workers than workers in the global budget: the hash and copy stages must take their slots in the same order.
+    source = tmp_path / "source"
+    names = make_source(source, 3000)
+    targets = [tmp_path / "target1", tmp_path / "target2"]
+    jobs = []
+    for target in targets:
+        target.mkdir()
+        jobs.append(CollectorSettings([str(source)], str(target), hash_workers=1, copy_workers=2))
+    summary = run_with_timeout(BatchRunner(BatchSettings(jobs, str(tmp_path / "index"), workers=1)))
+    assert summary.failed_job_count == 0
+    assert summary.shared_scan_count == 1
+    # Every file is copied into one of the target folders (one dedup domain), and hashed once.
+    assert collected_names(targets[0]) | collected_names(targets[1]) == names
+    assert not collected_names(targets[0]) & collected_names(targets[1])
+    assert summary.shared_hash_hits == 3000
+
+
+def test_jobs_that_do_not_run_together_scan_on_their_own(tmp_path, monkeypatch):
+    # With one job at a time, the second job must not hold up the shared scan of the first one.
+    monkeypatch.setattr(shared_scan, "MAX_BUFFERED_RECORDS", shared_scan.TRIM_STEP)
+    source = tmp_path / "source"
+    names = make_source(source, 3000)
+    jobs = []
+    for target in (tmp_path / "target1", tmp_path / "target2"):
+        target.mkdir()
+        jobs.append(CollectorSettings([str(source)], str(target)))
+    summary = run_with_timeout(BatchRunner(BatchSettings(jobs, str(tmp_path / "index"), parallel_jobs=1)))
+    assert summary.failed_job_count == 0
+    assert [job['summary'].files_found for job in summary.jobs] == [3000, 3000]
+    assert collected_names(tmp_path / "target1") == names
+    assert collected_names(tmp_path / "target2") == set()
+
+
+def test_job_file_shares_scans_and_target_domain(tmp_path):
+    photos = make_source(tmp_path / "photos", 20, "p")
+    make_source(tmp_path / "phone", 10, "p")
+    for name in ("archive1", "archive2", "index"):
+        (tmp_path / name).mkdir()
+    job_file = tmp_path / "jobs.json"
+    job_file.write_text(json.dumps({
+        'index_folder': "index",
+        'defaults': {'copy_workers': 1},
+        'jobs': [{'source_folders': ["photos"], 'target_folder': "archive1"},
+                 {'source_folders': ["photos", "phone"], 'target_folder': "archive2"}],
+    }))
+    batch_settings = load_batch_file(str(job_file))
+    assert batch_settings.jobs[0].copy_workers == 1
+    summary = run_with_timeout(BatchRunner(batch_settings))
+    assert summary.shared_scan_count == 1
+    # The phone files are the same as the first ten photos: every file is in exactly one target folder.
+    assert collected_names(tmp_path / "archive1") | collected_names(tmp_path / "archive2") == photos
+    assert summary.to_dict()['copied'] == 20
+
+
+def test_target_with_another_hash_algorithm_fails_only_its_job(tmp_path, capsys):
+    source = tmp_path / "source"
+    names = make_source(source, 5)
+    old_target, new_target = tmp_path / "old", tmp_path / "new"
+    old_target.mkdir()
+    new_target.mkdir()
+    ImageCollector(CollectorSettings([str(tmp_path / "source")], str(old_target), hash_algorithm='sha256')).run()
+
+    jobs = [CollectorSettings([str(source)], str(old_target)), CollectorSettings([str(source)], str(new_target))]
+    summary = run_with_timeout(BatchRunner(BatchSettings(jobs, str(tmp_path / "index"), hash_algorithm='blake2b')))
+    assert summary.failed_job_count == 1
+    assert "sha256" in summary.jobs[0]['error'] and summary.jobs[0]['summary'] is None
+    assert summary.jobs[1]['error'] is None
+    assert collected_names(new_target) == names
+    assert "failed" in capsys.readouterr().out
+
+
+def test_jobs_on_one_device_share_its_worker_limit(tmp_path, monkeypatch):
+    # The I/O slots of a device are shared by all jobs: two jobs on one device never use more than its workers.
+    monkeypatch.setattr(io_scheduler, "is_rotational_device", lambda device: False)
+    lock = threading.Lock()
+    busy = [0]
+    most_busy = [0]
+    original_reading, original_copying = IOScheduler.reading, IOScheduler.copying
+
+    def counted(original):
+        @contextlib.contextmanager
+        def hold_slot(*args, **kwargs):
+            with original(*args, **kwargs):
+                with lock:
+                    busy[0] += 1
+                    most_busy[0] = max(most_busy[0], busy[0])
+                time.sleep(0.002)
+                with lock:
+                    busy[0] -= 1
+                yield
+        return hold_slot
+
+    monkeypatch.setattr(IOScheduler, "reading", counted(original_reading))
+    monkeypatch.setattr(IOScheduler, "copying", counted(original_copying))
+    jobs = []
+    for number in (1, 2):
+        make_source(tmp_path / f"source{number}", 100, f"s{number}_")
+        (tmp_path / f"target{number}").mkdir()
+        jobs.append(CollectorSettings([str(tmp_path / f"source{number}")], str(tmp_path / f"target{number}"),
+                                      hash_workers=2, copy_workers=2))
+    summary = run_with_timeout(BatchRunner(BatchSettings(jobs, str(tmp_path / "index"), workers=16)))
+    assert summary.failed_job_count == 0
+    assert summary.to_dict()['copied'] == 200
+    assert most_busy[0] == 2
@@ -0,0 +1,18 @@
+from ImageCollector.benchmark import PHASES, BenchmarkSettings, compare_with_baseline, run_benchmark
+
+
+def test_benchmark_runs_every_phase_on_a_small_tree(tmp_path):
+    report = run_benchmark(BenchmarkSettings(file_count=40, mean_file_size_kb=4, folder_depth=2, files_per_folder=10,
+                                             forbidden_path_count=5), str(tmp_path))
+    assert list(report['phases']) == list(PHASES)
+    assert report['phases']['scan']['files'] > 0
+    # The temporary trees are removed.
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_regressions_are_reported_against_the_baseline():
+    report = {'settings': {}, 'phases': {'scan': {'files_per_s': 50.0}, 'hash': {'files_per_s': 100.0}}}
+    baseline = {'settings': {}, 'phases': {'scan': {'files_per_s': 100.0}, 'hash': {'files_per_s': 100.0}}}
+    regressions = compare_with_baseline(report, baseline, 0.2)
+    assert len(regressions) == 1 and regressions[0].startswith("scan:")
+    assert report['phases']['hash']['vs_baseline'] == 1.0
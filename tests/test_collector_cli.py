@@ -0,0 +1,83 @@
+import os
+import sys
+import json
+import zlib
+import zipfile
+import subprocess
+import pytest
+from ImageCollector import CollectorSettings, ImageCollector
+from ImageCollector.cli import main
+from Helpers.target_index import TargetIndex
+
+
+def make_source(folder, files: dict):
+    for relative_path, data in files.items():
+        path = folder / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+
+
+def test_importing_the_package_does_not_import_tkinter():
+    code = "import sys, ImageCollector, ImageCollector.cli; sys.exit('tkinter' in sys.modules)"
+    root_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    assert subprocess.run([sys.executable, "-c", code], cwd=root_folder).returncode == 0
+
+
+def test_library_run_skips_duplicates(tmp_path):
+    source, target = tmp_path / "source", tmp_path / "target"
+    make_source(source, {"a.jpg": b"a" * 100, "sub/a_copy.jpg": b"a" * 100, "b.png": b"b" * 100, "notes.txt": b"x"})
+    target.mkdir()
+
+    summary = ImageCollector(CollectorSettings([str(source)], str(target))).run()
+    assert (summary.files_found, summary.copied_count, summary.skipped_count, summary.error_count) == (3, 2, 1, 0)
+    assert sorted(name for name in os.listdir(target) if name.endswith(('.jpg', '.png'))) in (["a.jpg", "b.png"], ["a_copy.jpg", "b.png"])
+
+    # A second run finds everything in the target folder.
+    summary = ImageCollector(CollectorSettings([str(source)], str(target))).run()
+    assert (summary.copied_count, summary.skipped_count) == (0, 3)
+
+
+def test_cli_prints_a_json_summary(tmp_path, capsys):
+    source, target = tmp_path / "source", tmp_path / "target"
+    make_source(source, {"a.jpg": b"a" * 2048, "small.jpg": b"s"})
+    target.mkdir()
+
+    assert main(["--source", str(source), "--target", str(target), "--min-size-kb", "1", "--json", "--quiet"]) == 0
+    summary = json.loads(capsys.readouterr().out)
+    assert (summary['files_found'], summary['copied'], summary['skipped']) == (2, 1, 1)
+
+
+def test_cli_rejects_invalid_folders(tmp_path, capsys):
+    assert main(["--source", str(tmp_path / "missing"), "--target", str(tmp_path), "--quiet"]) == 2
+    assert "Not a valid directory" in capsys.readouterr().err
+
+
+def test_cli_rejects_an_invalid_near_duplicate_threshold(tmp_path, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        main(["--source", str(tmp_path), "--target", str(tmp_path), "--near-duplicate-threshold", "64"])
+    assert exit_info.value.code == 2
+    assert "--near-duplicate-threshold: must be between 0 and 63" in capsys.readouterr().err
+
+
+def test_zip_member_with_a_crc_miss_is_copied_without_hashing_first(tmp_path):
+    source, target = tmp_path / "source", tmp_path / "target"
+    make_source(source, {"a.jpg": b"a" * 100})
+    target.mkdir()
+    ImageCollector(CollectorSettings([str(source)], str(target))).run()
+
+    # A file with the size of the file in the target folder, but another CRC-32, is new: it is hashed while copying.
+    # A file with the same CRC-32 is hashed to confirm that it is a duplicate.
+    (source / "a.jpg").unlink()
+    with zipfile.ZipFile(source / "photos.zip", 'w') as zip_file:
+        zip_file.writestr("b.jpg", b"b" * 100)
+        zip_file.writestr("a_again.jpg", b"a" * 100)
+
+    summary = ImageCollector(CollectorSettings([str(source)], str(target), scan_archives=True)).run()
+    assert (summary.files_found, summary.copied_count, summary.skipped_count) == (2, 1, 1)
+    assert summary.metrics['counters']['new_by_size_index'] == 1
+    assert (target / "b.jpg").read_bytes() == b"b" * 100
+
+    # The CRC-32 of the copied file is known in the next run.
+    target_index = TargetIndex(str(target))
+    assert {entry.crc for entry in target_index.catalog.entries().values()} == {zlib.crc32(b"a" * 100), zlib.crc32(b"b" * 100)}
+    target_index.close()
@@ -0,0 +1,123 @@
+import os
+import hashlib
+import pytest
+from Helpers import hash_journal
+from Helpers.digest_store import DigestStore, read_digest_file
+from Helpers.hash_journal import HashJournal
+from Helpers.target_index import TargetIndex
+
+
+def digests(count: int, start: int=0) -> list:
+    return [hashlib.sha256(str(index).encode()).hexdigest() for index in range(start, start + count)]
+
+
+def open_store(folder, **kwargs) -> DigestStore:
+    return DigestStore(os.path.join(folder, "hashes.jllog"), os.path.join(folder, "digests.bin"), **kwargs)
+
+
+def test_lookup_in_the_digest_file_and_the_journal(tmp_path):
+    store = open_store(str(tmp_path), merge_min_digests=10)
+    store.rewrite(digests(100), header=["algo=sha256"])
+    for file_hash in digests(5, 100):
+        assert store.add(file_hash)
+    assert not store.add(digests(1)[0])
+    assert len(store) == 105
+    assert all(file_hash in store for file_hash in digests(105))
+    assert digests(1, 105)[0] not in store
+    assert "not hex" not in store
+    assert sorted(store.hex_hashes()) == sorted(digests(105))
+    store.close()
+
+    store = open_store(str(tmp_path))
+    assert store.header == ["algo=sha256"]
+    assert len(store) == 105
+    store.close()
+
+
+def test_large_delta_is_merged_into_the_digest_file(tmp_path):
+    store = open_store(str(tmp_path), merge_min_digests=10, merge_ratio=0.5)
+    store.rewrite((), header=["algo=sha256"])
+    for file_hash in digests(30):
+        store.add(file_hash)
+    store.close()
+    assert read_digest_file(str(tmp_path / "digests.bin")) == set(digests(30))
+    assert (tmp_path / "hashes.jllog").read_text() == "#algo=sha256\n"
+
+
+def test_crash_while_emptying_the_journal_keeps_the_header(tmp_path, monkeypatch):
+    # A merge writes the new digest file, then empties the journal. A crash while the journal is emptied
+    # must not leave a journal without its header (the target would be taken for a legacy md5 folder).
+    target_index = TargetIndex(str(tmp_path), 'sha256')
+    for file_hash in digests(20):
+        target_index.add(file_hash)
+    store = target_index.hashes
+
+    real_replace = os.replace
+
+    def crashing_replace(source, destination):
+        if destination.endswith(".jllog"):
+            raise KeyboardInterrupt("crash")
+        return real_replace(source, destination)
+
+    monkeypatch.setattr(hash_journal.os, "replace", crashing_replace)
+    with pytest.raises(KeyboardInterrupt):
+        store.merge()
+    monkeypatch.undo()
+
+    header_line = (tmp_path / "hashes" / "hashes.jllog").read_text().splitlines()[0]
+    assert header_line == "#algo=sha256"
+    target_index = TargetIndex(str(tmp_path))
+    assert target_index.hash_backend.name == 'sha256'
+    assert all(file_hash in target_index for file_hash in digests(20))
+    target_index.close()
+
+
+def test_reset_replaces_the_journal_atomically(tmp_path, monkeypatch):
+    file_path = str(tmp_path / "hashes.jllog")
+    journal = HashJournal(file_path, header=["algo=sha256"])
+    journal.add("aa")
+    journal.sync()
+
+    def crashing_fsync(fd):
+        raise KeyboardInterrupt("crash")
+
+    # A crash while the empty journal is written leaves the old journal in place.
+    monkeypatch.setattr(hash_journal.os, "fsync", crashing_fsync)
+    with pytest.raises(KeyboardInterrupt):
+        journal.reset(["algo=sha256"])
+    monkeypatch.undo()
+    records, header, _, _ = hash_journal.load_journal_records(file_path)
+    assert (records, header) == ({"aa"}, ["algo=sha256"])
+
+    journal.reset(["algo=md5"])
+    journal.add("bb")
+    journal.close()
+    records, header, _, _ = hash_journal.load_journal_records(file_path)
+    assert (records, header) == ({"bb"}, ["algo=md5"])
+
+
+def test_other_stores_are_merged_in_one_pass(tmp_path):
+    folders = [tmp_path / name for name in ("shared", "first", "second")]
+    for folder in folders:
+        folder.mkdir()
+    shared, first, second = (open_store(str(folder), merge_min_digests=1000) for folder in folders)
+    shared.rewrite(digests(10), header=["algo=sha256"])
+    shared.add(digests(1, 10)[0])
+    first.rewrite(digests(20, 5))
+    first.add(digests(1, 100)[0])
+    second.rewrite(digests(10, 30))
+    second.add(digests(1, 5)[0])
+
+    # New: 11..24 and 30..39 from the digest files, and 100 from a journal.
+    assert shared.merge_stores([first, second]) == 14 + 10 + 1
+    assert len(shared) == 36
+    assert sorted(shared.hex_hashes()) == sorted(digests(25) + digests(10, 30) + digests(1, 100))
+    assert set(shared.journal.records) == {digests(1, 100)[0]}
+    for store in (shared, first, second):
+        store.close()
+
+    shared = open_store(str(folders[0]))
+    assert shared.header == ["algo=sha256"]
+    assert len(shared) == 36
+    assert all(file_hash in shared for file_hash in digests(25) + digests(10, 30))
+    shared.close()
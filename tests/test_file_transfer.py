@@ -0,0 +1,69 @@
+import os
+import errno
+import hashlib
+import pytest
+from Helpers import file_transfer
+from Helpers.file_transfer import FileTransfer, TRANSFER_STRATEGIES
+
+DATA = os.urandom(200_000)
+
+
+@pytest.fixture
+def source_file(tmp_path):
+    path = tmp_path / "source.jpg"
+    path.write_bytes(DATA)
+    target = tmp_path / "target"
+    target.mkdir()
+    return (str(path), str(target))
+
+
+@pytest.mark.parametrize("strategy", TRANSFER_STRATEGIES)
+def test_every_strategy_transfers_the_data(source_file, strategy):
+    source_path, target_folder = source_file
+    temp_file_path = FileTransfer(strategy).transfer(source_path, target_folder)
+    assert os.path.dirname(temp_file_path) == target_folder
+    with open(temp_file_path, "rb") as f:
+        assert f.read() == DATA
+
+
+def test_buffered_copy_hashes_while_copying(source_file):
+    source_path, target_folder = source_file
+    transfer = FileTransfer('copy')
+    assert transfer.hashes_while_copying(source_path, target_folder)
+    hash_object = hashlib.sha256()
+    transfer.transfer(source_path, target_folder, hash_object)
+    assert hash_object.hexdigest() == hashlib.sha256(DATA).hexdigest()
+
+
+def test_unsupported_method_falls_back_once(source_file, monkeypatch):
+    source_path, target_folder = source_file
+    calls = []
+
+    def no_hard_links(source, destination):
+        calls.append(source)
+        raise OSError(errno.EXDEV, "not supported")
+
+    monkeypatch.setattr(file_transfer.os, "link", no_hard_links)
+    transfer = FileTransfer('hardlink')
+    assert not transfer.hashes_while_copying(source_path, target_folder)
+    for _ in range(3):
+        with open(transfer.transfer(source_path, target_folder), "rb") as f:
+            assert f.read() == DATA
+    assert len(calls) == 1
+    assert transfer.hashes_while_copying(source_path, target_folder)
+
+
+def test_real_errors_are_not_hidden(source_file, monkeypatch):
+    source_path, target_folder = source_file
+
+    def failing_link(source, destination):
+        raise OSError(errno.ENOSPC, "no space")
+
+    monkeypatch.setattr(file_transfer.os, "link", failing_link)
+    with pytest.raises(OSError):
+        FileTransfer('hardlink').transfer(source_path, target_folder)
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        FileTransfer('teleport')
@@ -0,0 +1,41 @@
+import io
+import hashlib
+import pytest
+from Helpers import hash_backends
+from Helpers.hash_backends import HashError, available_hash_algorithms, get_hash_backend, hash_file, hash_file_object
+
+
+@pytest.mark.parametrize("name", available_hash_algorithms())
+def test_backends_hash_like_hashlib(tmp_path, name):
+    data = bytes(range(256)) * 5000
+    file_path = tmp_path / "file.bin"
+    file_path.write_bytes(data)
+    backend = get_hash_backend(name)
+    expected = backend.new()
+    expected.update(data)
+    assert hash_file(str(file_path), backend, buffer_size=4096) == expected.hexdigest()
+    assert hash_file_object(io.BytesIO(data), backend, buffer_size=4096) == expected.hexdigest()
+
+
+def test_large_files_are_hashed_through_mmap(tmp_path, monkeypatch):
+    monkeypatch.setattr(hash_backends, "MMAP_THRESHOLD", 1024)
+    monkeypatch.setattr(hash_backends, "MMAP_CHUNK_SIZE", 1000)
+    data = b"0123456789" * 1000
+    file_path = tmp_path / "large.bin"
+    file_path.write_bytes(data)
+    assert hash_file(str(file_path), get_hash_backend('md5')) == hashlib.md5(data).hexdigest()
+
+
+def test_empty_and_unreadable_files(tmp_path):
+    empty = tmp_path / "empty.bin"
+    empty.write_bytes(b"")
+    assert hash_file(str(empty), get_hash_backend('md5')) == hashlib.md5(b"").hexdigest()
+    # A file that can not be read does not get the hash of an empty file.
+    with pytest.raises(HashError):
+        hash_file(str(tmp_path / "missing.bin"), get_hash_backend('md5'))
+
+
+def test_default_backend_and_unknown_names():
+    assert get_hash_backend().name == available_hash_algorithms()[0]
+    with pytest.raises(ValueError):
+        get_hash_backend('crc32')
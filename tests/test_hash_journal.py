@@ -0,0 +1,68 @@
+from Helpers.hash_journal import HashJournal, load_journal_records
+
+
+def test_records_survive_reopen(tmp_path):
+    file_path = str(tmp_path / "hashes.jllog")
+    with HashJournal(file_path, header=["algo=md5"]) as journal:
+        assert journal.add("aa")
+        assert not journal.add("aa")
+        journal.add("bb")
+        assert journal.discard("aa")
+        assert not journal.discard("aa")
+
+    with HashJournal(file_path) as journal:
+        assert journal.records == {"bb"}
+        assert journal.header == ["algo=md5"]
+
+
+def test_files_of_earlier_versions_are_valid_journals(tmp_path):
+    file_path = tmp_path / "hashes.jllog"
+    file_path.write_text("aa\nbb\n")
+    with HashJournal(str(file_path)) as journal:
+        assert journal.records == {"aa", "bb"}
+        assert journal.header == []
+
+
+def test_torn_last_line_is_ignored_and_cut_off(tmp_path):
+    file_path = tmp_path / "hashes.jllog"
+    file_path.write_bytes(b"#algo=md5\naa\nbb\ncc")  # crash while writing "cc"
+
+    records, header, line_count, valid_length = load_journal_records(str(file_path))
+    assert records == {"aa", "bb"}
+    assert header == ["algo=md5"]
+    assert line_count == 2
+    assert valid_length == len(b"#algo=md5\naa\nbb\n")
+
+    with HashJournal(str(file_path)) as journal:
+        journal.add("dd")
+    assert file_path.read_bytes() == b"#algo=md5\naa\nbb\ndd\n"
+
+
+def test_compaction_keeps_only_live_records(tmp_path):
+    file_path = tmp_path / "hashes.jllog"
+    with HashJournal(str(file_path), header=["algo=md5"], compact_min_lines=10, compact_ratio=2.0) as journal:
+        for index in range(20):
+            journal.add(f"{index:02x}")
+            journal.discard(f"{index:02x}")
+        journal.add("ff")
+        # The tombstones were compacted away while adding.
+        assert journal.records == {"ff"}
+
+    lines = file_path.read_text().splitlines()
+    assert lines[0] == "#algo=md5"
+    assert len(lines) < 10
+    assert not (tmp_path / "hashes.jllog.tmp").exists()
+    with HashJournal(str(file_path)) as journal:
+        assert journal.records == {"ff"}
+
+
+def test_rewrite_replaces_records_and_header(tmp_path):
+    file_path = str(tmp_path / "hashes.jllog")
+    with HashJournal(file_path, header=["algo=md5"]) as journal:
+        journal.add("aa")
+        journal.rewrite(["bb", "cc"], header=["algo=sha256"])
+        assert journal.records == {"bb", "cc"}
+
+    with HashJournal(file_path) as journal:
+        assert journal.records == {"bb", "cc"}
+        assert journal.header == ["algo=sha256"]
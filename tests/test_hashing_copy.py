@@ -0,0 +1,61 @@
+import io
+import os
+import hashlib
+import pytest
+from Helpers import hashing_copy
+from Helpers.hashing_copy import (TEMP_FILE_SUFFIX, commit_temp_file, copy_file_hashing, copy_stream_hashing, discard_temp_file,
+                                  remove_stale_temp_files)
+
+
+def test_copy_hashes_in_the_same_pass(tmp_path):
+    data = os.urandom(300 * 1024)
+    source = tmp_path / "source.jpg"
+    source.write_bytes(data)
+    os.utime(source, ns=(1_600_000_000_000_000_000, 1_600_000_000_000_000_000))
+    target_folder = tmp_path / "target"
+    target_folder.mkdir()
+
+    hash_object = hashlib.sha256()
+    temp_file_path = copy_file_hashing(str(source), str(target_folder), hash_object, buffer_size=64 * 1024)
+    name = os.path.basename(temp_file_path)
+    assert name.startswith(".") and name.endswith(TEMP_FILE_SUFFIX)
+    assert hash_object.hexdigest() == hashlib.sha256(data).hexdigest()
+
+    destination = target_folder / "source.jpg"
+    commit_temp_file(temp_file_path, str(destination))
+    assert destination.read_bytes() == data
+    assert os.stat(destination).st_mtime_ns == 1_600_000_000_000_000_000
+    assert os.listdir(target_folder) == ["source.jpg"]
+
+
+def test_copy_stream_sets_mode_and_time(tmp_path):
+    temp_file_path = copy_stream_hashing(io.BytesIO(b"member data"), str(tmp_path), None, mode=0o640, mtime_ns=1_000_000_000)
+    assert open(temp_file_path, 'rb').read() == b"member data"
+    assert os.stat(temp_file_path).st_mode & 0o777 == 0o640
+    assert os.stat(temp_file_path).st_mtime_ns == 1_000_000_000
+
+
+def test_failed_copy_leaves_no_temp_file(tmp_path, monkeypatch):
+    def failing_copy(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(hashing_copy, "_copy_data_hashing", failing_copy)
+    source = tmp_path / "source.jpg"
+    source.write_bytes(b"data")
+    target_folder = tmp_path / "target"
+    target_folder.mkdir()
+    with pytest.raises(OSError):
+        copy_file_hashing(str(source), str(target_folder))
+    assert os.listdir(target_folder) == []
+
+
+def test_stale_temp_files_are_removed(tmp_path):
+    (tmp_path / f".abc{TEMP_FILE_SUFFIX}").write_bytes(b"half a copy")
+    (tmp_path / f".def{TEMP_FILE_SUFFIX}").write_bytes(b"")
+    (tmp_path / f"photo{TEMP_FILE_SUFFIX}").write_bytes(b"not a temp file (no dot)")
+    (tmp_path / "photo.jpg").write_bytes(b"photo")
+    (tmp_path / f".folder{TEMP_FILE_SUFFIX}").mkdir()
+
+    assert remove_stale_temp_files(str(tmp_path)) == 2
+    assert sorted(os.listdir(tmp_path)) == sorted([f".folder{TEMP_FILE_SUFFIX}", "photo.jpg", f"photo{TEMP_FILE_SUFFIX}"])
+    discard_temp_file(str(tmp_path / "missing"))
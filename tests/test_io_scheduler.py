@@ -0,0 +1,76 @@
+import os
+import time
+import threading
+from types import SimpleNamespace
+from Helpers import io_scheduler
+from Helpers.io_scheduler import IOScheduler, TokenBucket, FILES_IN_FLIGHT_PER_WORKER
+
+
+def test_token_bucket_limits_the_rate():
+    bucket = TokenBucket(1_000_000)
+    start = time.monotonic()
+    for _ in range(4):
+        bucket.consume(100_000)
+    bucket.consume(1_000_000)
+    assert time.monotonic() - start >= 0.3
+
+
+def test_rotational_devices_get_one_slot(tmp_path, monkeypatch):
+    monkeypatch.setattr(io_scheduler, "is_rotational_device", lambda device: device == 1)
+    monkeypatch.setattr(io_scheduler, "device_of", lambda path: 3)
+    with IOScheduler(4, 2, str(tmp_path)) as scheduler:
+        assert scheduler.is_rotational(1)
+        assert scheduler.device_queue(1).workers == 1
+        assert scheduler.device_queue(2).workers == 4
+        # The target device counts too (not rotational).
+        assert scheduler.max_files_in_flight() == FILES_IN_FLIGHT_PER_WORKER * ((4 + 2) * 2 + (1 + 2))
+
+
+def test_reading_holds_a_slot_of_the_device(tmp_path, monkeypatch):
+    monkeypatch.setattr(io_scheduler, "is_rotational_device", lambda device: True)
+    record = SimpleNamespace(device=os.stat(tmp_path).st_dev + 1, size=1)
+    entered = threading.Event()
+    with IOScheduler(4, 2, str(tmp_path)) as scheduler:
+        with scheduler.reading(record):
+            def read():
+                with scheduler.reading(record):
+                    entered.set()
+
+            thread = threading.Thread(target=read)
+            thread.start()
+            assert not entered.wait(0.2)
+        assert entered.wait(5)
+        thread.join()
+
+
+def test_copies_take_device_slots_in_order(tmp_path, monkeypatch):
+    # Two copies from two devices with one slot each, in opposite directions, must not wait for each other.
+    monkeypatch.setattr(io_scheduler, "is_rotational_device", lambda device: True)
+    with IOScheduler(1, 1, str(tmp_path)) as scheduler:
+        target_device = os.stat(tmp_path).st_dev
+        records = [SimpleNamespace(device=target_device + 1, size=1), SimpleNamespace(device=target_device, size=1)]
+        done = []
+
+        def copy(record):
+            for _ in range(200):
+                with scheduler.copying(record):
+                    pass
+            done.append(record)
+
+        threads = [threading.Thread(target=copy, args=(record,)) for record in records]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        assert len(done) == 2
+
+
+def test_files_in_flight_are_limited_per_device(tmp_path, monkeypatch):
+    monkeypatch.setattr(io_scheduler, "is_rotational_device", lambda device: False)
+    record = SimpleNamespace(device=os.stat(tmp_path).st_dev, size=1)
+    with IOScheduler(1, 1, str(tmp_path)) as scheduler:
+        limit = FILES_IN_FLIGHT_PER_WORKER * 2
+        assert all(scheduler.admit(record, timeout=0) for _ in range(limit))
+        assert not scheduler.admit(record, timeout=0)
+        scheduler.release(record)
+        assert scheduler.admit(record, timeout=0)
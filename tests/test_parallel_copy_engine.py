@@ -0,0 +1,112 @@
+import time
+import random
+import threading
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from Helpers.parallel_copy_engine import HashClaims, ParallelCopyEngine
+
+
+def make_engine(target_hashes, copied, hash_func=None, claims=None, **kwargs):
+    def copy_func(file, file_hash, claim):
+        if file_hash is None:
+            file_hash = f"hash-{file}"
+            if not claim(file_hash):
+                return ('Duplicate', file_hash)
+        copied.append(file)
+        return ('Copied', file_hash)
+
+    return ParallelCopyEngine(hash_func=hash_func or (lambda file: f"hash-{file}"), copy_func=copy_func,
+                              target_hashes=target_hashes, claims=claims, **kwargs)
+
+
+def test_results_are_in_the_order_of_the_files():
+    def slow_hash(file):
+        time.sleep(random.random() / 200)
+        return f"hash-{file}"
+
+    copied = []
+    engine = make_engine(set(), copied, slow_hash, hash_workers=4, copy_workers=2, max_pending=8)
+    files = list(range(100))
+    results = list(engine.run(files))
+    assert [file for file, _ in results] == files
+    assert all(result == 'Copied' for _, result in results)
+    assert sorted(copied) == files
+
+
+def test_identical_files_are_copied_once():
+    copied = []
+    target_hashes = {"hash-known"}
+    engine = make_engine(target_hashes, copied, lambda file: f"hash-{file % 5}" if file != 'known' else "hash-known",
+                         hash_workers=8)
+    results = dict(engine.run(list(range(50)) + ['known']))
+    assert sorted(copied) == [0, 1, 2, 3, 4]
+    assert sum(1 for result in results.values() if result == 'Copied') == 5
+    assert results['known'] == 'Duplicate'
+    assert {f"hash-{index}" for index in range(5)} <= target_hashes
+
+
+def test_files_hashed_while_copying_are_claimed():
+    # The hash function returns None (new by the size index): the copy function claims the hash itself.
+    copied = []
+    engine = make_engine({"hash-1"}, copied, lambda file: None)
+    results = dict(engine.run([1, 2]))
+    assert results == {1: 'Duplicate', 2: 'Copied'}
+    assert copied == [2]
+
+
+def test_shared_claims_dedup_across_engines():
+    # Two engines (two jobs of a batch) collecting the same files at the same time copy each digest once.
+    claims = HashClaims()
+    shared_target_hashes = set()
+    copied = []
+    start = threading.Barrier(2)
+
+    def run_engine():
+        start.wait()
+        list(make_engine(shared_target_hashes, copied, claims=claims, hash_workers=4).run(range(200)))
+
+    threads = [threading.Thread(target=run_engine) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(copied) == list(range(200))
+    with claims.lock:
+        assert not claims.hashes
+
+
+def test_hash_errors_are_results():
+    def failing_hash(file):
+        raise OSError("unreadable")
+
+    results = list(make_engine(set(), [], failing_hash).run([1]))
+    assert results == [(1, "Error hashing: unreadable")]
+
+
+def test_failing_hand_over_fails_the_file_instead_of_hanging():
+    class BrokenPool:
+        def submit(self, *args):
+            raise RuntimeError("cannot schedule new futures after shutdown")
+
+    class Scheduler:
+        def __init__(self):
+            self.pool = ThreadPoolExecutor(max_workers=1)
+
+        def hash_pool(self, file):
+            return self.pool
+
+        def copy_pool(self, file):
+            return BrokenPool()
+
+        def release(self, file):
+            pass
+
+    claims = HashClaims()
+    scheduler = Scheduler()
+    engine = make_engine(set(), [], claims=claims, scheduler=scheduler)
+    with pytest.raises(RuntimeError):
+        list(engine.run([1]))
+    scheduler.pool.shutdown()
+    with claims.lock:
+        assert not claims.hashes
@@ -0,0 +1,83 @@
+import random
+import pytest
+from Helpers.perceptual_hash import hamming_distance
+from Helpers.perceptual_index import HammingIndex, PerceptualIndex
+from Helpers.target_catalog import CatalogEntry
+
+
+def flip_bits(value: int, count: int, rng: random.Random) -> int:
+    for bit in rng.sample(range(64), count):
+        value ^= 1 << bit
+    return value
+
+
+@pytest.mark.parametrize("threshold", [0, 3, 6, 10])
+def test_finds_every_hash_within_the_threshold(threshold):
+    # Compare with a brute-force search: the index must find the closest hash whenever one is within the threshold.
+    rng = random.Random(threshold)
+    hashes = [rng.getrandbits(64) for _ in range(2000)]
+    index = HammingIndex(threshold)
+    for perceptual_hash in hashes:
+        index.add(perceptual_hash)
+
+    queries = [flip_bits(rng.choice(hashes), rng.randint(0, threshold + 2), rng) for _ in range(500)]
+    queries += [rng.getrandbits(64) for _ in range(100)]
+    for query in queries:
+        best_distance = min(hamming_distance(query, perceptual_hash) for perceptual_hash in hashes)
+        found = index.find(query)
+        if best_distance <= threshold:
+            assert found is not None and found[1] == best_distance == hamming_distance(query, found[0])
+        else:
+            assert found is None
+
+
+def test_remove_counts_duplicate_hashes():
+    index = HammingIndex(4)
+    index.add(0b1011)
+    index.add(0b1011)
+    index.remove(0b1011)
+    assert index.find(0b1010) == (0b1011, 1)
+    index.remove(0b1011)
+    assert index.find(0b1010) is None
+    assert len(index) == 0
+
+
+def test_invalid_threshold():
+    with pytest.raises(ValueError):
+        HammingIndex(64)
+
+
+def test_claims_are_found_and_journal_is_reloaded(tmp_path):
+    file_path = str(tmp_path / "perceptual.jllog")
+    index = PerceptualIndex(file_path, 'dhash', threshold=4)
+    assert index.claim(0xFF00) is None
+    assert index.claim(0xFF01) == 0xFF00
+    index.add("a" * 64, 0xFF00)
+    index.add("b" * 64)
+    assert index.claim(0x1234_5678_0000_0000) is None
+    index.release(0x1234_5678_0000_0000)
+    index.close()
+
+    index = PerceptualIndex(file_path, 'dhash', threshold=4)
+    assert len(index) == 2
+    assert index.claim(0xFF03) == 0xFF00
+    assert index.claim(0x1234_5678_0000_0000) is None
+    index.close()
+
+    # Hashes of another algorithm are dropped.
+    index = PerceptualIndex(file_path, 'phash', threshold=4)
+    assert len(index) == 0
+    index.close()
+
+
+def test_sync_state_follows_the_catalog_files(tmp_path):
+    index = PerceptualIndex(str(tmp_path / "perceptual.jllog"), 'dhash')
+    # Files that are not images get a record without a perceptual hash; equal files share one record.
+    entries = [CatalogEntry("a.raw", 1, 0, 1, "p", "a" * 64), CatalogEntry("copy of a.raw", 1, 0, 2, "p", "a" * 64),
+               CatalogEntry("b.mov", 2, 0, 3, "p", "b" * 64)]
+    assert not index.is_synced(entries)
+    assert index.sync(str(tmp_path), entries, ('.jpg',)) == (2, 0)
+    assert index.is_synced(entries)
+    assert not index.is_synced(entries[:2])
+    assert not index.is_synced(entries + [CatalogEntry("c.raw", 3, 0, 4, "p", "c" * 64)])
+    index.close()
@@ -0,0 +1,62 @@
+import time
+import threading
+import pytest
+from Helpers.pipeline import iterate_in_thread, merge_in_threads
+
+
+def test_iterate_in_thread_keeps_the_order():
+    assert list(iterate_in_thread(range(5000), max_queued=16)) == list(range(5000))
+
+
+def test_producer_waits_for_the_consumer():
+    produced = []
+
+    def stage():
+        for index in range(100):
+            produced.append(index)
+            yield index
+
+    items = iterate_in_thread(stage(), max_queued=4)
+    assert next(items) == 0
+    time.sleep(0.1)
+    # Backpressure: only the bounded queue (and the item being put) is produced ahead.
+    assert len(produced) <= 1 + 4 + 1
+    items.close()
+
+
+def test_errors_are_raised_in_the_consumer():
+    def stage():
+        yield 1
+        raise ValueError("scan failed")
+
+    items = iterate_in_thread(stage())
+    assert next(items) == 1
+    with pytest.raises(ValueError):
+        next(items)
+
+
+def test_consumer_stopping_early_stops_the_producer():
+    def endless():
+        index = 0
+        while True:
+            yield index
+            index += 1
+
+    items = iterate_in_thread(endless(), max_queued=2, thread_name="endless")
+    assert next(items) == 0
+    items.close()
+    assert not any(thread.name == "endless" for thread in threading.enumerate())
+
+
+def test_merge_in_threads_yields_all_items_and_admits_them():
+    admitted = []
+
+    def admit(item, timeout):
+        admitted.append(item)
+        return True
+
+    items = list(merge_in_threads([range(0, 100), range(100, 200)], max_queued=8, admit=admit))
+    assert sorted(items) == list(range(200))
+    assert sorted(admitted) == list(range(200))
+    # The items of one stage keep their order.
+    assert [item for item in items if item < 100] == list(range(100))
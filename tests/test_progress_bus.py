@@ -0,0 +1,81 @@
+import io
+import threading
+from Helpers.progress_bus import MAX_PENDING_LOG_TEXTS, ProgressBus, TtyProgressRenderer
+
+
+def test_only_the_latest_progress_is_kept():
+    progress_bus = ProgressBus()
+    assert progress_bus.drain() is None
+    for index in range(100000):
+        progress_bus.post_progress(index, 100000, "copying", f"/photos/{index}.jpg")
+    # Nothing is queued per event: the bus holds the latest progress only.
+    assert progress_bus._progress == (99999, 100000, "copying", "/photos/99999.jpg")
+
+    state = progress_bus.drain()
+    assert state.status_text == "100.00% (100000/100000) copying"
+    assert state.file_text == "-> File: 99999.jpg"
+    assert state.log_text is None and state.finished_text is None
+    assert progress_bus.drain() is None
+
+
+def test_log_texts_posted_between_drains_are_all_kept():
+    progress_bus = ProgressBus()
+    progress_bus.post_log_text("Removed 2 incomplete copies left behind by an interrupted run.")
+    progress_bus.post_log_text("Resuming an interrupted run (5 files already done)...")
+    progress_bus.post_finished("End time")
+    state = progress_bus.drain()
+    assert state.log_text.splitlines() == ["Removed 2 incomplete copies left behind by an interrupted run.",
+                                           "Resuming an interrupted run (5 files already done)..."]
+    assert state.finished_text == "End time"
+    assert state.progress_percent == 100.0
+    state = progress_bus.drain()
+    assert state is None
+
+
+def test_undrained_log_texts_are_bounded():
+    progress_bus = ProgressBus()
+    for index in range(MAX_PENDING_LOG_TEXTS + 10):
+        progress_bus.post_log_text(str(index))
+    lines = progress_bus.drain().log_text.splitlines()
+    assert len(lines) == MAX_PENDING_LOG_TEXTS
+    assert lines[-1] == str(MAX_PENDING_LOG_TEXTS + 9)
+
+
+def test_reset_and_status():
+    progress_bus = ProgressBus()
+    progress_bus.post_progress(0, 2, "copying", "/a.jpg")
+    progress_bus.post_reset("Initializing...")
+    state = progress_bus.drain()
+    assert (state.status_text, state.file_text, state.progress_percent) == ("Initializing...", "", 0.0)
+    progress_bus.post_status("Finished!")
+    assert progress_bus.drain().status_text == "Finished!"
+
+
+def test_posting_from_many_threads():
+    progress_bus = ProgressBus()
+
+    def post(thread_index):
+        for index in range(1000):
+            progress_bus.post_progress(index, 1000, "hash", "f")
+        progress_bus.post_log_text(f"thread {thread_index} done")
+
+    threads = [threading.Thread(target=post, args=(index,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(progress_bus.drain().log_text.splitlines()) == sorted(f"thread {index} done" for index in range(8))
+
+
+def test_tty_renderer_shows_every_log_text():
+    progress_bus = ProgressBus()
+    stream = io.StringIO()
+    renderer = TtyProgressRenderer(progress_bus, stream, refresh_rate_hz=1000)
+    renderer.start()
+    progress_bus.post_log_text("first")
+    progress_bus.post_log_text("second")
+    progress_bus.post_finished("done")
+    renderer.stop()
+    output = stream.getvalue()
+    assert "first\nsecond\n" in output
+    assert output.rstrip().endswith("done")
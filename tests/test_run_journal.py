@@ -0,0 +1,75 @@
+from Helpers.run_journal import RunJournal
+from Helpers.source_scanner import ScanRecord
+
+JOB = {'source_folders': ["/photos"], 'extensions': [".jpg"]}
+
+
+def interrupted_run(file_path, results):
+    # Record the files and their results, and "crash" (close without removing the journal).
+    journal = RunJournal(file_path, JOB)
+    for record, result, file_hash in results:
+        journal.plan(record)
+        journal.start(record)
+        if result is not None:
+            journal.complete(record, result, file_hash)
+    journal.close()
+
+
+def test_completed_files_are_resumed(tmp_path):
+    file_path = str(tmp_path / "run.jljob")
+    copied = ScanRecord("/photos/a.jpg", 10, 1)
+    duplicate = ScanRecord("/photos/b.jpg", 20, 2)
+    failed = ScanRecord("/photos/c.jpg", 30, 3)
+    in_flight = ScanRecord("/photos/d.jpg", 40, 4)
+    interrupted_run(file_path, [(copied, 'Copied', "aa"), (duplicate, 'Duplicate', "bb"), (failed, "Error copying: disk full", None),
+                                (in_flight, None, None)])
+
+    journal = RunJournal(file_path, JOB)
+    assert journal.resumed_count == 2
+    assert journal.completed_result(copied) == 'Copied'
+    assert journal.completed_result(duplicate) == 'Duplicate'
+    assert journal.completed_result(failed) is None
+    assert journal.completed_result(in_flight) is None
+    # A file changed since the interrupted run is processed again.
+    assert journal.completed_result(ScanRecord("/photos/a.jpg", 11, 1)) is None
+    journal.close(remove=True)
+    assert not (tmp_path / "run.jljob").exists()
+
+
+def test_other_jobs_and_no_resume_start_over(tmp_path):
+    file_path = str(tmp_path / "run.jljob")
+    record = ScanRecord("/photos/a.jpg", 10, 1)
+    interrupted_run(file_path, [(record, 'Copied', "aa")])
+    assert RunJournal(file_path, {'source_folders': ["/other"]}).resumed_count == 0
+
+    interrupted_run(file_path, [(record, 'Copied', "aa")])
+    assert RunJournal(file_path, JOB, resume=False).resumed_count == 0
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    file_path = tmp_path / "run.jljob"
+    record = ScanRecord("/photos/a.jpg", 10, 1)
+    interrupted_run(str(file_path), [(record, 'Copied', "aa")])
+    with open(file_path, 'ab') as f:
+        f.write(b'{"i": 0, "r": "Dupl')
+
+    journal = RunJournal(str(file_path), JOB)
+    assert journal.completed_result(record) == 'Copied'
+    journal.plan(ScanRecord("/photos/b.jpg", 1, 1))
+    journal.close()
+    assert all(line.endswith(b"}") for line in file_path.read_bytes().splitlines())
+
+
+def test_copies_whose_hash_never_reached_the_target_are_not_resumed(tmp_path):
+    # The run journal was synced, the hash journal was not: the copy is not known to the target index.
+    file_path = str(tmp_path / "run.jljob")
+    synced = ScanRecord("/photos/a.jpg", 10, 1)
+    lost = ScanRecord("/photos/b.jpg", 20, 2)
+    legacy = ScanRecord("/photos/c.jpg", 30, 3)
+    interrupted_run(file_path, [(synced, 'Copied', "aa"), (lost, 'Copied', "bb"), (legacy, 'Copied', None)])
+
+    journal = RunJournal(file_path, JOB, target_hashes={"aa"})
+    assert journal.completed_result(synced) == 'Copied'
+    assert journal.completed_result(lost) is None
+    assert journal.completed_result(legacy) is None
+    journal.close()
@@ -0,0 +1,61 @@
+import os
+import csv
+import gzip
+import json
+import pytest
+from Helpers.run_log import RunLogWriter, write_summary_file
+
+
+def test_jsonl_records(tmp_path):
+    with RunLogWriter(str(tmp_path), "run") as log:
+        log.write("a.jpg", 'copied', size=10, digest="ab", seconds=0.5)
+        log.write("b.jpg", 'error', "Permission denied")
+    assert log.file_paths == [str(tmp_path / "run.jsonl")]
+    records = [json.loads(line) for line in (tmp_path / "run.jsonl").read_text().splitlines()]
+    assert records[0] == {'path': "a.jpg", 'status': 'copied', 'detail': "", 'size': 10, 'digest': "ab", 'seconds': 0.5}
+    assert records[1]['detail'] == "Permission denied"
+
+
+def test_csv_with_gzip(tmp_path):
+    with RunLogWriter(str(tmp_path), "run", 'csv', 'gzip') as log:
+        log.write("a,b.jpg", 'duplicate', size=3)
+    with gzip.open(log.file_paths[0], 'rt', encoding='utf-8', newline='') as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ['path', 'status', 'detail', 'size', 'digest', 'seconds']
+    assert rows[1] == ["a,b.jpg", 'duplicate', "", "3", "", ""]
+
+
+def test_text_format(tmp_path):
+    with RunLogWriter(str(tmp_path), "run", 'text') as log:
+        log.write("a.jpg", 'copied')
+        log.write("b.jpg", 'too_small', size=512)
+        log.write("c.jpg", 'error', "broken")
+    assert (tmp_path / "run.txt").read_text().splitlines() == [
+        f"{os.path.normpath('a.jpg')} --> OK", f"{os.path.normpath('b.jpg')} --> Too small (0.5 kb)", f"{os.path.normpath('c.jpg')} --> !broken"]
+
+
+def test_rotation_writes_complete_parts(tmp_path):
+    with RunLogWriter(str(tmp_path), "run", 'csv', rotate_bytes=100) as log:
+        for index in range(20):
+            log.write(f"file{index:02d}.jpg", 'copied', size=index)
+    assert len(log.file_paths) > 1
+    assert [os.path.basename(path) for path in log.file_paths][:2] == ["run.0001.csv", "run.0002.csv"]
+    paths = []
+    for file_path in log.file_paths:
+        with open(file_path, newline='', encoding='utf-8') as f:
+            rows = list(csv.reader(f))
+        assert rows[0][0] == 'path'
+        paths.extend(row[0] for row in rows[1:])
+    assert paths == [f"file{index:02d}.jpg" for index in range(20)]
+
+
+def test_summary_file(tmp_path):
+    log = RunLogWriter(str(tmp_path), "run")
+    log.close()
+    write_summary_file(log.summary_file_path, {'copied': 1})
+    assert json.loads((tmp_path / "run.summary.json").read_text()) == {'copied': 1}
+
+
+def test_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        RunLogWriter(str(tmp_path), "run", 'xml')
@@ -0,0 +1,59 @@
+import sys
+import json
+import pstats
+import threading
+from Helpers.run_metrics import RunMetrics, RunProfiler
+
+
+def test_phases_counters_and_quantiles():
+    metrics = RunMetrics()
+    for _ in range(99):
+        metrics.observe('hash', 0.002, 1024)
+    metrics.observe('hash', 20.0, 1024)
+    metrics.count('skipped_by_size')
+    metrics.count('skipped_by_size', 2)
+    result = metrics.to_dict()
+    assert result['phases']['hash']['count'] == 100
+    assert result['phases']['hash']['bytes'] == 100 * 1024
+    assert result['phases']['hash']['p50_s'] == 0.0025
+    assert result['phases']['hash']['p99_s'] == 0.0025
+    assert result['counters'] == {'skipped_by_size': 3}
+
+
+def test_json_lines_and_prometheus_textfile(tmp_path):
+    metrics = RunMetrics()
+    with metrics.timer('copy', 10):
+        pass
+    metrics.set_value('peak', 5)
+    json_path = tmp_path / "metrics.jsonl"
+    metrics.write_json_lines(str(json_path), {'job': "a"})
+    metrics.write_json_lines(str(json_path))
+    lines = [json.loads(line) for line in json_path.read_text().splitlines()]
+    assert [line['type'] for line in lines] == ['run', 'phase', 'run', 'phase']
+    assert lines[0]['job'] == "a"
+
+    text_path = tmp_path / "metrics.prom"
+    metrics.write_prometheus_textfile(str(text_path), {'job': 'a"b'})
+    text = text_path.read_text()
+    assert 'jl_image_collector_phase_duration_seconds_count{job="a\\"b",phase="copy"} 1' in text
+    assert 'jl_image_collector_peak{job="a\\"b"} 5' in text
+
+
+def work_in_thread():
+    return sum(range(1000))
+
+
+def test_profiler_covers_threads_and_is_stopped(tmp_path):
+    metrics = RunMetrics()
+    profile_path = str(tmp_path / "run.pstats")
+    previous_profile = sys.getprofile()
+    with RunProfiler(metrics, cpu_profile_path=profile_path, trace_memory=True):
+        thread = threading.Thread(target=work_in_thread)
+        thread.start()
+        thread.join()
+    assert sys.getprofile() is previous_profile
+    function_names = {function[2] for function in pstats.Stats(profile_path).stats}
+    assert 'work_in_thread' in function_names
+    values = metrics.to_dict()['values']
+    assert values['cpu_profile'] == profile_path
+    assert values['peak_traced_memory_bytes'] > 0
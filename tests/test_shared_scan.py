@@ -0,0 +1,142 @@
+import time
+import threading
+from Helpers.shared_scan import SharedScan, SourceHashCache, TRIM_STEP
+from Helpers.source_scanner import ScanRecord
+
+MAX_BUFFERED = 2 * TRIM_STEP
+
+
+def make_records(count: int) -> list:
+    return [ScanRecord(f"/source/{index:05d}{'.jpg' if index % 2 else '.mp4'}", index, index) for index in range(count)]
+
+
+def consume(iterator, output: list):
+    thread = threading.Thread(target=lambda: output.extend(iterator), daemon=True)
+    thread.start()
+    return thread
+
+
+def test_every_consumer_gets_its_files_from_one_scan():
+    records = make_records(5000)
+    scan_count = []
+    shared_scan = SharedScan(lambda: scan_count.append(1) or iter(records), [('.jpg',), None], max_buffered_records=MAX_BUFFERED)
+    images, everything = [], []
+    threads = [consume(shared_scan.records(0), images), consume(shared_scan.records(1), everything)]
+    for thread in threads:
+        thread.join(10)
+    assert images == [record for record in records if record.path.endswith('.jpg')]
+    assert everything == records
+    assert scan_count == [1]
+    assert shared_scan.buffered_count == 0
+
+
+def test_scan_waits_for_a_slow_consumer():
+    produced = []
+    both_started = threading.Event()
+
+    def scan():
+        for index, record in enumerate(make_records(10 * MAX_BUFFERED)):
+            if index == 1:
+                both_started.wait(10)
+            produced.append(record)
+            yield record
+
+    shared_scan = SharedScan(scan, [None, None], max_buffered_records=MAX_BUFFERED)
+    slow = shared_scan.records(1)
+    next(slow)
+    fast = []
+    fast_thread = consume(shared_scan.records(0), fast)
+    while not fast:
+        time.sleep(0.01)
+    both_started.set()
+    time.sleep(0.3)
+    # The scan is held up by the slow consumer, and keeps no more records than allowed.
+    assert fast_thread.is_alive()
+    assert shared_scan.buffered_count <= MAX_BUFFERED
+    assert len(produced) <= MAX_BUFFERED + 2
+    assert len(list(slow)) == 10 * MAX_BUFFERED - 1
+    fast_thread.join(10)
+    assert len(fast) == 10 * MAX_BUFFERED
+
+
+def test_consumer_that_does_not_start_in_time_scans_on_its_own():
+    records = make_records(5 * MAX_BUFFERED)
+    scan_count = []
+    shared_scan = SharedScan(lambda: scan_count.append(1) or iter(records), [None, None], max_buffered_records=MAX_BUFFERED)
+    first = []
+    consume(shared_scan.records(0), first).join(10)
+    assert first == records
+    assert list(shared_scan.records(1)) == records
+    assert scan_count == [1, 1]
+
+
+def test_hash_cache_entries_are_dropped_when_every_consumer_is_done():
+    records = make_records(3 * MAX_BUFFERED)
+    hash_cache = SourceHashCache()
+    shared_scan = SharedScan(lambda: iter(records), [None, ('.jpg',), ('.jpg',)], hash_cache, max_buffered_records=MAX_BUFFERED)
+    calculated = []
+
+    def job(consumer: int, output: list):
+        for record in shared_scan.records(consumer):
+            hash_cache.hash_once(record, lambda: calculated.append(record) or f"hash-{record.path}")
+            hash_cache.release(record)
+            output.append(record)
+
+    outputs = [[], []]
+    threads = [threading.Thread(target=job, args=(consumer, outputs[consumer])) for consumer in (0, 1)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    # The third consumer never started: it was detached, so nothing is kept for it.
+    assert len(outputs[0]) == len(records) and len(outputs[1]) == len(records) // 2
+    assert len(hash_cache) == 0
+    # The images were hashed once for both jobs, the other files (one job only) are not cached.
+    assert len(calculated) == len(records)
+    assert hash_cache.hit_count == len(records) // 2
+
+
+def test_stopping_early_releases_the_remaining_records():
+    records = make_records(100)
+    hash_cache = SourceHashCache()
+    shared_scan = SharedScan(lambda: iter(records), [None, None], hash_cache)
+    first = shared_scan.records(0)
+    second = shared_scan.records(1)
+    next(first)
+    for record in second:
+        hash_cache.release(record)
+    first.close()
+    shared_scan.detach(1)
+    assert len(hash_cache) == 1
+    hash_cache.release(records[0])
+    assert len(hash_cache) == 0
+
+
+def test_hash_is_calculated_once_for_concurrent_jobs():
+    hash_cache = SourceHashCache()
+    record = ScanRecord("/source/a.jpg", 1, 1)
+    hash_cache.expect(record, 3)
+    started = threading.Event()
+    calls = []
+
+    def calculate():
+        calls.append(1)
+        started.set()
+        time.sleep(0.1)
+        return "hash"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(hash_cache.hash_once(record, calculate))) for _ in range(3)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert calls == [1]
+    assert sorted(results) == [("hash", False), ("hash", False), ("hash", True)]
+
+    # A file that is not shared is not kept.
+    other = ScanRecord("/source/b.jpg", 1, 1)
+    assert hash_cache.hash_once(other, lambda: "other") == ("other", True)
+    assert len(hash_cache) == 1
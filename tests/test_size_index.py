@@ -0,0 +1,87 @@
+import zlib
+import hashlib
+from Helpers.size_index import Crc32Hash, SizeIndex, partial_hash
+
+
+def write_file(path, data: bytes) -> str:
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_partial_hash_covers_first_and_last_block(tmp_path):
+    block_size = 16
+    middle_changed = write_file(tmp_path / "a", b"A" * 16 + b"x" * 40 + b"Z" * 16)
+    original = write_file(tmp_path / "b", b"A" * 16 + b"y" * 40 + b"Z" * 16)
+    tail_changed = write_file(tmp_path / "c", b"A" * 16 + b"y" * 40 + b"Q" * 16)
+    assert partial_hash(middle_changed, 72, block_size) == partial_hash(original, 72, block_size)
+    assert partial_hash(tail_changed, 72, block_size) != partial_hash(original, 72, block_size)
+
+
+def test_small_files_are_hashed_whole(tmp_path):
+    first = write_file(tmp_path / "a", b"A" * 10 + b"x" + b"Z" * 10)
+    second = write_file(tmp_path / "b", b"A" * 10 + b"y" + b"Z" * 10)
+    assert partial_hash(first, 21, 16) != partial_hash(second, 21, 16)
+
+
+def test_staged_check(tmp_path):
+    target_file = write_file(tmp_path / "target.jpg", b"target data")
+    same_size = write_file(tmp_path / "same_size.jpg", b"other  data")
+    same_content = write_file(tmp_path / "copy.jpg", b"target data")
+
+    size_index = SizeIndex(str(tmp_path / "sizes.jllog"), complete=True)
+    size_index.add(11, partial_hash(target_file, 11), "full")
+    # No file with the same size: new.
+    assert not size_index.needs_full_hash(str(tmp_path / "missing"), 12)
+    # Same size, other partial hash: new.
+    assert not size_index.needs_full_hash(same_size, 11)
+    # Same size and partial hash: only the full hash can tell.
+    assert size_index.needs_full_hash(same_content, 11)
+    # Without a path (a file in an archive) only the size is compared.
+    assert size_index.needs_full_hash(None, 11)
+    assert not size_index.needs_full_hash(None, 12)
+    size_index.close()
+
+
+def test_incomplete_index_can_not_rule_out_duplicates(tmp_path):
+    file_path = str(tmp_path / "sizes.jllog")
+    size_index = SizeIndex(file_path)
+    assert not size_index.complete
+    assert size_index.needs_full_hash(None, 1)
+    size_index.rebuild([(5, "p", "f")])
+    assert size_index.complete
+    size_index.close()
+
+    size_index = SizeIndex(file_path)
+    assert size_index.complete
+    assert len(size_index) == 1
+    assert not size_index.needs_full_hash(None, 6)
+    size_index.reset()
+    assert size_index.complete and len(size_index) == 0
+    size_index.close()
+
+
+def test_crc_rules_out_files_in_archives(tmp_path):
+    size_index = SizeIndex(str(tmp_path / "sizes.jllog"), complete=True)
+    size_index.add(3, "p", "hash-a", zlib.crc32(b"aaa"))
+    assert size_index.needs_full_hash(None, 3, zlib.crc32(b"aaa"))
+    assert not size_index.needs_full_hash(None, 3, zlib.crc32(b"bbb"))
+    # Without a CRC-32 for the file, only the size is compared.
+    assert size_index.needs_full_hash(None, 3)
+
+    # A file of the same size whose CRC-32 is not known could be a duplicate.
+    size_index.add(3, "q", "hash-b")
+    assert size_index.needs_full_hash(None, 3, zlib.crc32(b"bbb"))
+    size_index.rebuild([(3, "p", "hash-a", zlib.crc32(b"aaa"))])
+    size_index.close()
+
+    size_index = SizeIndex(str(tmp_path / "sizes.jllog"))
+    assert not size_index.needs_full_hash(None, 3, zlib.crc32(b"bbb"))
+    size_index.close()
+
+
+def test_crc32_hash_updates_the_hash_in_the_same_pass():
+    crc_hash = Crc32Hash(hashlib.sha256())
+    crc_hash.update(b"abc")
+    crc_hash.update(memoryview(b"def"))
+    assert crc_hash.crc == zlib.crc32(b"abcdef")
+    assert crc_hash.hexdigest() == hashlib.sha256(b"abcdef").hexdigest()
@@ -0,0 +1,63 @@
+import os
+from Helpers.source_scanner import ForbiddenPathMatcher, normalize_path, read_forbidden_paths, scan_source
+
+
+def test_matcher_matches_prefixes():
+    matcher = ForbiddenPathMatcher(["C:\\Users\\Me\\Private", "c:/users/me/private/deeper", "/data/b", ""])
+    # The prefix covered by a shorter prefix is dropped.
+    assert len(matcher) == 2
+    assert matcher.matches(normalize_path("C:\\Users\\Me\\Private\\a.jpg"))
+    assert matcher.matches("/data/b/x.jpg")
+    assert matcher.matches("/data/bx.jpg")  # Plain prefixes, like the forbidden paths file always had.
+    assert not matcher.matches("/data/a/x.jpg")
+    assert not matcher.matches("/data/")
+    assert not ForbiddenPathMatcher(()).matches("/anything")
+
+
+def test_matcher_finds_prefixes_under_a_folder():
+    matcher = ForbiddenPathMatcher(["/data/photos/private"])
+    assert matcher.has_prefixes_under("/data/")
+    assert matcher.has_prefixes_under("/data/photos/")
+    assert not matcher.has_prefixes_under("/data/music/")
+
+
+def test_read_forbidden_paths(tmp_path):
+    file_path = tmp_path / "forbidden.txt"
+    file_path.write_text("C:\\Private\n\n  /data/b  \n", encoding='utf-8')
+    assert read_forbidden_paths(str(file_path)) == {"c:/private", "/data/b"}
+    assert read_forbidden_paths(str(tmp_path / "missing.txt")) == set()
+
+
+def make_tree(root):
+    for relative_path in ("a.jpg", "b.JPG", "c.txt", "sub/d.png", "sub/private/e.jpg", "sub/privateer.jpg",
+                          "node_modules/f.jpg", "deep/er/g.jpg"):
+        path = root / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x" * len(relative_path))
+
+
+def test_scan_filters_extensions_folders_and_forbidden_paths(tmp_path):
+    make_tree(tmp_path)
+    forbidden = ForbiddenPathMatcher([os.path.join(str(tmp_path), "sub", "private")])
+    records = list(scan_source(str(tmp_path), ('.jpg', '.png'), forbidden, ('node_modules',)))
+    found = sorted(os.path.relpath(record.path, tmp_path).replace(os.sep, '/') for record in records)
+    # "sub/privateer.jpg" starts with the forbidden path "sub/private" too.
+    assert found == ["a.jpg", "b.JPG", "deep/er/g.jpg", "sub/d.png"]
+    for record in records:
+        assert record.size == os.path.getsize(record.path)
+        assert record.mtime_ns == os.stat(record.path).st_mtime_ns
+
+
+def test_scan_reports_progress_and_orders_by_inode(tmp_path):
+    make_tree(tmp_path)
+    progress = []
+    records = list(scan_source(str(tmp_path), ('.jpg',), progress_callback=lambda examined, found: progress.append(found),
+                               order_by_inode=True))
+    assert progress[-1] == len(records) == 6
+    top_level = [record for record in records if os.path.dirname(record.path) == str(tmp_path)]
+    inodes = [os.stat(record.path).st_ino for record in top_level]
+    assert inodes == sorted(inodes)
+
+
+def test_scan_of_missing_folder_yields_nothing(tmp_path):
+    assert list(scan_source(str(tmp_path / "missing"), ('.jpg',))) == []
@@ -0,0 +1,109 @@
+import os
+from Helpers.source_scanner import scan_source
+from Helpers.source_snapshot import SourceSnapshot
+
+JOB = {'source_folders': ["source"]}
+OLD_TIME = 1_600_000_000
+
+
+def make_tree(root):
+    for relative_path in ("a.jpg", "sub/b.jpg", "sub/c.jpg"):
+        path = root / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(relative_path.encode())
+    age_folders(root)
+
+
+def age_folders(root):
+    # Folders changed right before a scan are always listed again, so the tests use old folder times.
+    for folder in (root, root / "sub"):
+        os.utime(folder, (OLD_TIME, OLD_TIME))
+
+
+def incremental_run(root, snapshot_path, handled=lambda record: True) -> list:
+    snapshot = SourceSnapshot(snapshot_path, JOB)
+    records = list(scan_source(str(root), ('.jpg',), snapshot=snapshot))
+    for record in records:
+        if handled(record):
+            snapshot.mark_done(record)
+    snapshot.close(commit=True)
+    return sorted(os.path.relpath(record.path, root) for record in records)
+
+
+def test_unchanged_folders_are_skipped_and_new_files_found(tmp_path):
+    root = tmp_path / "source"
+    make_tree(root)
+    snapshot_path = str(tmp_path / "sources.sqlite3")
+    assert incremental_run(root, snapshot_path) == ["a.jpg", os.path.join("sub", "b.jpg"), os.path.join("sub", "c.jpg")]
+    assert incremental_run(root, snapshot_path) == []
+
+    (root / "sub" / "d.jpg").write_bytes(b"new")
+    age_folders(root)
+    os.utime(root / "sub", (OLD_TIME + 10, OLD_TIME + 10))
+    assert incremental_run(root, snapshot_path) == [os.path.join("sub", "d.jpg")]
+
+
+def test_files_not_handled_are_returned_again(tmp_path):
+    root = tmp_path / "source"
+    make_tree(root)
+    snapshot_path = str(tmp_path / "sources.sqlite3")
+    incremental_run(root, snapshot_path, handled=lambda record: not record.path.endswith("b.jpg"))
+    assert incremental_run(root, snapshot_path) == [os.path.join("sub", "b.jpg")]
+
+
+def test_pending_file_rewritten_in_place_is_marked_done(tmp_path):
+    root = tmp_path / "source"
+    make_tree(root)
+    snapshot_path = str(tmp_path / "sources.sqlite3")
+    incremental_run(root, snapshot_path, handled=lambda record: not record.path.endswith("b.jpg"))
+
+    # Rewriting a file in place does not change the modification time of its folder.
+    (root / "sub" / "b.jpg").write_bytes(b"rewritten")
+    age_folders(root)
+    assert incremental_run(root, snapshot_path) == [os.path.join("sub", "b.jpg")]
+    assert incremental_run(root, snapshot_path) == []
+
+
+def test_removed_subfolder_is_dropped_with_its_contents(tmp_path):
+    root = tmp_path / "source"
+    make_tree(root)
+    (root / "sub" / "deep").mkdir()
+    (root / "sub" / "deep" / "e.jpg").write_bytes(b"e")
+    os.utime(root / "sub" / "deep", (OLD_TIME, OLD_TIME))
+    age_folders(root)
+    snapshot_path = str(tmp_path / "sources.sqlite3")
+    assert len(incremental_run(root, snapshot_path)) == 4
+
+    for file_path in (root / "sub" / "deep" / "e.jpg", root / "sub" / "b.jpg", root / "sub" / "c.jpg"):
+        os.remove(file_path)
+    os.rmdir(root / "sub" / "deep")
+    os.rmdir(root / "sub")
+    os.utime(root, (OLD_TIME + 10, OLD_TIME + 10))
+    assert incremental_run(root, snapshot_path) == []
+
+    snapshot = SourceSnapshot(snapshot_path, JOB)
+    assert snapshot.known_subfolders(str(root / "sub")) == []
+    assert snapshot.pending_files(str(root / "sub" / "deep")) == []
+    assert snapshot._connection.execute("SELECT COUNT(*) FROM files").fetchone()[0] == 1
+    snapshot.close()
+
+
+def test_interrupted_run_keeps_the_last_snapshot(tmp_path):
+    root = tmp_path / "source"
+    make_tree(root)
+    snapshot_path = str(tmp_path / "sources.sqlite3")
+    snapshot = SourceSnapshot(snapshot_path, JOB)
+    for record in scan_source(str(root), ('.jpg',), snapshot=snapshot):
+        snapshot.mark_done(record)
+    snapshot.close(commit=False)
+    assert len(incremental_run(root, snapshot_path)) == 3
+
+
+def test_snapshot_of_another_job_is_discarded(tmp_path):
+    root = tmp_path / "source"
+    make_tree(root)
+    snapshot_path = str(tmp_path / "sources.sqlite3")
+    incremental_run(root, snapshot_path)
+    snapshot = SourceSnapshot(snapshot_path, {'source_folders': ["other"]})
+    assert len(list(scan_source(str(root), ('.jpg',), snapshot=snapshot))) == 3
+    snapshot.close()
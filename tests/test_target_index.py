@@ -0,0 +1,90 @@
+import os
+import sqlite3
+from Helpers.target_index import TargetIndex
+from Helpers.target_catalog import CatalogEntry, TargetCatalog
+
+
+def collect(target_folder, name: str, data: bytes, target_index: TargetIndex) -> str:
+    file_path = os.path.join(target_folder, name)
+    with open(file_path, 'wb') as f:
+        f.write(data)
+    return file_path
+
+
+def test_rebuild_hashes_only_new_or_changed_files(tmp_path):
+    target_folder = str(tmp_path)
+    target_index = TargetIndex(target_folder, 'sha256')
+    first = collect(target_folder, "a.jpg", b"first", target_index)
+    second = collect(target_folder, "b.jpg", b"second", target_index)
+    assert target_index.rebuild([first, second]) == (2, 0)
+    assert target_index.hash_file(first) in target_index
+    target_index.close()
+
+    # Unchanged files are not hashed again; a removed file is dropped from the index.
+    os.remove(second)
+    target_index = TargetIndex(target_folder)
+    assert target_index.hash_backend.name == 'sha256'
+    assert target_index.rebuild([first]) == (0, 1)
+    assert len(target_index) == 1
+    assert target_index.hash_file(first) in target_index
+
+    # A changed file is hashed again.
+    with open(first, 'ab') as f:
+        f.write(b" changed")
+    os.utime(first, ns=(1, 1))
+    assert target_index.rebuild([first]) == (1, 0)
+    assert target_index.hash_file(first) in target_index
+    target_index.close()
+
+
+def test_rebuild_drops_a_file_removed_after_the_listing(tmp_path):
+    target_folder = str(tmp_path)
+    target_index = TargetIndex(target_folder, 'sha256')
+    first = collect(target_folder, "a.jpg", b"first", target_index)
+    second = collect(target_folder, "b.jpg", b"second", target_index)
+    assert target_index.rebuild([first, second]) == (2, 0)
+    second_hash = target_index.hash_file(second)
+
+    # The folder was listed with both files, then the second file was removed before its stat.
+    os.remove(second)
+    assert target_index.rebuild([first, second]) == (0, 1)
+    assert len(target_index) == 1
+    assert second_hash not in target_index
+    target_index.close()
+
+    target_index = TargetIndex(target_folder)
+    assert target_index.rebuild([first]) == (0, 0)
+    assert second_hash not in target_index
+    target_index.close()
+
+
+def test_hash_algorithm_is_kept_unless_rebuilt(tmp_path):
+    target_folder = str(tmp_path)
+    target_index = TargetIndex(target_folder, 'md5')
+    target_index.add(target_index.hash_file(collect(target_folder, "a.jpg", b"a", target_index)))
+    target_index.close()
+
+    target_index = TargetIndex(target_folder, 'sha256')
+    assert target_index.hash_backend.name == 'md5'
+    assert len(target_index) == 1
+    target_index.close()
+
+    target_index = TargetIndex(target_folder, 'sha256', rebuild=True)
+    assert target_index.hash_backend.name == 'sha256'
+    target_index.close()
+
+
+def test_catalog_of_an_earlier_version_gets_a_crc_column(tmp_path):
+    file_path = str(tmp_path / "catalog.sqlite3")
+    connection = sqlite3.connect(file_path)
+    connection.execute("CREATE TABLE files (path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, "
+                       "inode INTEGER NOT NULL, partial_hash TEXT NOT NULL, hash TEXT NOT NULL)")
+    connection.execute("INSERT INTO files VALUES ('a.jpg', 1, 2, 3, 'p', 'h')")
+    connection.commit()
+    connection.close()
+
+    catalog = TargetCatalog(file_path)
+    assert catalog.entries()['a.jpg'].crc is None
+    catalog.put(CatalogEntry('b.jpg', 1, 2, 4, 'p', 'h', 0x1234))
+    assert catalog.entries()['b.jpg'].crc == 0x1234
+    catalog.close()
@@ -0,0 +1,85 @@
+import os
+import threading
+import pytest
+from Helpers.target_layout import BucketLayout, DateLayout, HashPrefixLayout, UniqueNameAllocator, create_target_layout, list_target_files
+
+
+def test_allocator_hands_out_unique_names(tmp_path):
+    (tmp_path / "photo.jpg").write_bytes(b"")
+    (tmp_path / "photo(4).jpg").write_bytes(b"")
+    allocator = UniqueNameAllocator()
+    names = [os.path.basename(allocator.allocate(str(tmp_path), "photo.jpg")) for _ in range(3)]
+    # The numbers continue after the highest number in the folder.
+    assert names == ["photo(5).jpg", "photo(6).jpg", "photo(7).jpg"]
+    assert os.path.basename(allocator.allocate(str(tmp_path), "other.jpg")) == "other.jpg"
+    assert os.path.basename(allocator.allocate(str(tmp_path), "other.jpg")) == "other(1).jpg"
+    # A new folder is created.
+    assert allocator.allocate(str(tmp_path / "new"), "a.jpg") == str(tmp_path / "new" / "a.jpg")
+    assert (tmp_path / "new").is_dir()
+
+
+def test_allocator_from_several_threads(tmp_path):
+    allocator = UniqueNameAllocator()
+    names = []
+    lock = threading.Lock()
+
+    def allocate():
+        for _ in range(200):
+            name = allocator.allocate(str(tmp_path), "photo.jpg")
+            with lock:
+                names.append(name)
+
+    threads = [threading.Thread(target=allocate) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(names)) == 800
+
+
+def test_flat_hash_and_date_layouts(tmp_path):
+    source = tmp_path / "source.jpg"
+    source.write_bytes(b"no exif")
+    os.utime(source, (1715000000, 1715000000))  # May 2024
+    target = tmp_path / "target"
+    target.mkdir()
+
+    assert create_target_layout('flat', str(target)).destination_path(str(source), "abcdef") == str(target / "source.jpg")
+    assert HashPrefixLayout(str(target)).folder_for(str(source), "abcdef") == str(target / "ab" / "cd")
+    assert DateLayout(str(target)).folder_for(str(source), "abcdef") == str(target / "2024" / "05")
+    assert DateLayout(str(target)).folder_for(str(tmp_path / "missing.jpg"), "abcdef") == str(target / "undated")
+    with pytest.raises(ValueError):
+        create_target_layout('tree', str(target))
+
+
+def test_buckets_count_committed_files_only(tmp_path):
+    layout = BucketLayout(str(tmp_path), bucket_size=2)
+    first = layout.destination_path("/source/a.jpg", "aa")
+    # A failed copy (never committed) does not count.
+    layout.destination_path("/source/failed.jpg", "bb")
+    layout.file_committed(first)
+    second = layout.destination_path("/source/b.jpg", "cc")
+    layout.file_committed(second)
+    third = layout.destination_path("/source/c.jpg", "dd")
+    assert os.path.dirname(first) == os.path.dirname(second) == str(tmp_path / "00000")
+    assert os.path.dirname(third) == str(tmp_path / "00001")
+
+
+def test_buckets_continue_after_earlier_runs_and_ignore_year_folders(tmp_path):
+    (tmp_path / "2024").mkdir()  # From an earlier date layout.
+    (tmp_path / "00003").mkdir()
+    (tmp_path / "00003" / "a.jpg").write_bytes(b"")
+    layout = BucketLayout(str(tmp_path), bucket_size=2)
+    assert layout.folder_for("/source/b.jpg", "aa") == str(tmp_path / "00003")
+    layout.file_committed(str(tmp_path / "00003" / "b.jpg"))
+    assert layout.folder_for("/source/c.jpg", "bb") == str(tmp_path / "00004")
+
+
+def test_list_target_files(tmp_path):
+    for relative_path in ("a.jpg", "2024/05/b.JPG", "hashes/c.jpg", "d.txt"):
+        path = tmp_path / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"")
+    found = sorted(os.path.relpath(path, tmp_path) for path in list_target_files(str(tmp_path), ('.jpg',), True, ("hashes",)))
+    assert found == ["2024/05/b.JPG".replace("/", os.sep), "a.jpg"]
+    assert list_target_files(str(tmp_path), ('.jpg',), False) == [str(tmp_path / "a.jpg")]